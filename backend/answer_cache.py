@@ -0,0 +1,199 @@
+"""
+Кэш готовых ответов (RAG + LLM) в два уровня:
+1) точное совпадение по нормализованному тексту запроса;
+2) при промахе — ближайший сосед по эмбеддингам закэшированных запросов (косинус >= порога).
+
+TTL и LRU-вытеснение; весь кэш сбрасывается при смене «поколения» коллекции (переиндексация).
+"""
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EmbedFn = Callable[[str], Sequence[float]]
+GenerationFn = Callable[[], Any]
+
+_WS_RE = re.compile(r"\s+")
+_EDGE_PUNCT = " \t\n.,!?;:…«»\"'()"
+
+
+def normalize_query(text: str) -> str:
+    """Нормализация запроса для ключа кэша: регистр, ё→е, пробелы, пунктуация по краям."""
+    t = (text or "").lower().replace("ё", "е")
+    t = _WS_RE.sub(" ", t)
+    return t.strip(_EDGE_PUNCT)
+
+
+@dataclass
+class _Entry:
+    reply: str
+    vector: np.ndarray | None
+    created: float
+
+
+class AnswerCache:
+    """
+    Потокобезопасный кэш ответов. embed_fn — эмбеддинг запроса (для семантического уровня; None — только точный).
+    embed_fn получает исходный текст запроса, а не нормализованный ключ: с embed_query из rag.search это тот же
+    текст, что эмбеддит поиск, и при промахе кэша поиск берёт вектор из кэша эмбеддингов, а не считает второй.
+    generation_fn — «поколение» индекса (например, index_generation из метаданных коллекции); при его смене кэш очищается.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int = 500,
+        ttl_sec: float = 3600.0,
+        similarity_threshold: float = 0.95,
+        embed_fn: EmbedFn | None = None,
+        generation_fn: GenerationFn | None = None,
+        generation_check_sec: float = 60.0,
+    ) -> None:
+        self._max_size = max(1, max_size)
+        self._ttl = ttl_sec
+        self._threshold = similarity_threshold
+        self._embed_fn = embed_fn
+        self._generation_fn = generation_fn
+        self._generation_check_sec = generation_check_sec
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        # Матрица нормированных векторов для поиска ближайшего соседа; пересобирается после изменений
+        self._matrix: np.ndarray | None = None
+        self._matrix_keys: list[str] = []
+        self._matrix_created: np.ndarray | None = None
+        self._generation: Any = None
+        self._generation_checked = 0.0
+        self._hits_exact = 0
+        self._hits_semantic = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self._embed_fn is not None and 0.0 < self._threshold <= 1.0
+
+    def _embed(self, query: str) -> np.ndarray | None:
+        if not self.semantic_enabled:
+            return None
+        try:
+            v = np.asarray(self._embed_fn(query), dtype=np.float32)
+        except Exception as e:
+            logger.warning("answer cache: embedding failed, semantic lookup skipped: %s", e)
+            return None
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else None
+
+    def _check_generation(self) -> None:
+        if self._generation_fn is None:
+            return
+        now = time.monotonic()
+        if now - self._generation_checked < self._generation_check_sec:
+            return
+        self._generation_checked = now
+        try:
+            generation = self._generation_fn()
+        except Exception as e:
+            logger.warning("answer cache: generation check failed: %s", e)
+            return
+        with self._lock:
+            if self._generation is not None and generation != self._generation:
+                logger.info("answer cache: index generation changed %r -> %r, invalidating", self._generation, generation)
+                self._clear_locked()
+            self._generation = generation
+
+    def _clear_locked(self) -> None:
+        self._entries.clear()
+        self._matrix = None
+        self._matrix_keys = []
+        self._invalidations += 1
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self._ttl > 0 and now - entry.created > self._ttl
+
+    def _nearest_locked(self, vector: np.ndarray, now: float) -> str | None:
+        if self._matrix is None:
+            keys = [k for k, e in self._entries.items() if e.vector is not None]
+            if not keys:
+                return None
+            self._matrix = np.stack([self._entries[k].vector for k in keys])
+            self._matrix_keys = keys
+            self._matrix_created = np.array([self._entries[k].created for k in keys])
+        sims = self._matrix @ vector
+        if self._ttl > 0:
+            # Просроченные строки не участвуют в выборе: иначе они заслоняли бы живого соседа выше порога
+            sims = np.where(now - self._matrix_created > self._ttl, -np.inf, sims)
+        best = int(np.argmax(sims))
+        if float(sims[best]) < self._threshold:
+            return None
+        key = self._matrix_keys[best]
+        return key if key in self._entries else None
+
+    def get(self, query: str) -> str | None:
+        """Ответ из кэша или None. Сначала точное совпадение, затем семантическое."""
+        key = normalize_query(query)
+        if not key:
+            return None
+        self._check_generation()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry, now):
+                    self._entries.move_to_end(key)
+                    self._hits_exact += 1
+                    return entry.reply
+                del self._entries[key]
+                self._matrix = None
+            if not self._entries or not self.semantic_enabled:
+                self._misses += 1
+                return None
+        vector = self._embed(query)
+        with self._lock:
+            near = self._nearest_locked(vector, now) if vector is not None else None
+            if near is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(near)
+            self._hits_semantic += 1
+            return self._entries[near].reply
+
+    def put(self, query: str, reply: str) -> None:
+        """Сохраняет финальный ответ. Пустые ответы не кэшируются."""
+        key = normalize_query(query)
+        if not key or not (reply or "").strip():
+            return
+        vector = self._embed(query)
+        with self._lock:
+            self._entries[key] = _Entry(reply=reply, vector=vector, created=time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self) -> None:
+        """Полный сброс (например, после переиндексации коллекции)."""
+        with self._lock:
+            self._clear_locked()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self._max_size,
+                "ttl_sec": self._ttl,
+                "similarity_threshold": self._threshold,
+                "hits_exact": self._hits_exact,
+                "hits_semantic": self._hits_semantic,
+                "misses": self._misses,
+                "invalidations": self._invalidations,
+                "generation": self._generation,
+            }
@@ -1,12 +1,21 @@
 """
-Chatwoot Application API client: post messages (public reply or private note).
+Chatwoot Application API client: post messages (public reply or private note) and toggle the typing indicator.
 Used by the webhook handler for RAG bot replies and copilot suggestions.
+
+Connections are pooled (one long-lived httpx.Client per process, HTTP/2 when available).
+Stream-mode blocks go through MessagePoster: a bounded queue drained by a few workers that keep
+block order within a conversation and retry 429/5xx with jittered backoff.
 """
 from __future__ import annotations
 
 import logging
 import os
-from typing import Any
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
 
 import httpx
 
@@ -19,11 +28,118 @@ CHATWOOT_API_ACCESS_TOKEN = (os.environ.get("CHATWOOT_API_ACCESS_TOKEN") or "").
 
 CHATWOOT_AGENTBOT_ACCESS_TOKEN = (os.environ.get("CHATWOOT_AGENTBOT_ACCESS_TOKEN") or "").strip()
 
+# HTTP pool settings (shared by all posts in the process)
+CHATWOOT_HTTP2 = os.environ.get("CHATWOOT_HTTP2", "true").lower() in ("1", "true", "yes")
+CHATWOOT_HTTP_TIMEOUT = float(os.environ.get("CHATWOOT_HTTP_TIMEOUT", "30"))
+CHATWOOT_HTTP_MAX_CONNECTIONS = int(os.environ.get("CHATWOOT_HTTP_MAX_CONNECTIONS", "20"))
+CHATWOOT_HTTP_MAX_KEEPALIVE = int(os.environ.get("CHATWOOT_HTTP_MAX_KEEPALIVE", "10"))
+# Retries for 429/5xx and transport errors
+CHATWOOT_POST_RETRIES = int(os.environ.get("CHATWOOT_POST_RETRIES", "3"))
+CHATWOOT_POST_BACKOFF_BASE = float(os.environ.get("CHATWOOT_POST_BACKOFF_BASE", "0.5"))
+CHATWOOT_POST_BACKOFF_MAX = float(os.environ.get("CHATWOOT_POST_BACKOFF_MAX", "8"))
+# Posting pipeline (stream mode)
+CHATWOOT_POST_WORKERS = int(os.environ.get("CHATWOOT_POST_WORKERS", "4"))
+CHATWOOT_POST_QUEUE_SIZE = int(os.environ.get("CHATWOOT_POST_QUEUE_SIZE", "1000"))
+CHATWOOT_POST_ENQUEUE_TIMEOUT = float(os.environ.get("CHATWOOT_POST_ENQUEUE_TIMEOUT", "2"))
+
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_client: httpx.Client | None = None
+_client_lock = threading.Lock()
+
 
 def is_configured() -> bool:
     return bool(CHATWOOT_BASE_URL and CHATWOOT_ACCOUNT_ID and CHATWOOT_API_ACCESS_TOKEN)
 
 
+def _http2_available() -> bool:
+    if not CHATWOOT_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _client_options() -> dict[str, Any]:
+    return {
+        "timeout": CHATWOOT_HTTP_TIMEOUT,
+        "limits": httpx.Limits(
+            max_connections=CHATWOOT_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=CHATWOOT_HTTP_MAX_KEEPALIVE,
+        ),
+        "http2": _http2_available(),
+    }
+
+
+def _get_client() -> httpx.Client:
+    """Long-lived pooled client (keep-alive between posts)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = httpx.Client(**_client_options())
+    return _client
+
+
+def _conversation_request(
+    conversation_id: int,
+    action: str,
+    access_token: str | None,
+) -> tuple[str, dict[str, str]] | None:
+    token = (access_token or "").strip() or CHATWOOT_API_ACCESS_TOKEN
+    if not CHATWOOT_BASE_URL or not CHATWOOT_ACCOUNT_ID or not token:
+        logger.warning("Chatwoot client: not configured, cannot call %s", action)
+        return None
+    url = f"{CHATWOOT_BASE_URL}/api/v1/accounts/{CHATWOOT_ACCOUNT_ID}/conversations/{conversation_id}/{action}"
+    headers = {
+        "api_access_token": token,
+        "Content-Type": "application/json",
+    }
+    return url, headers
+
+
+def _prepare_post(
+    conversation_id: int,
+    content: str,
+    private: bool,
+    access_token: str | None,
+) -> tuple[str, dict[str, Any], dict[str, str]] | None:
+    prepared = _conversation_request(conversation_id, "messages", access_token)
+    if prepared is None:
+        return None
+    url, headers = prepared
+    payload: dict[str, Any] = {
+        "content": content,
+        "message_type": "outgoing",
+        "private": private,
+    }
+    return url, payload, headers
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None = None) -> float:
+    """Retry-After if the server sent it, otherwise exponential backoff with full jitter."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), CHATWOOT_POST_BACKOFF_MAX)
+            except ValueError:
+                pass
+    ceiling = min(CHATWOOT_POST_BACKOFF_MAX, CHATWOOT_POST_BACKOFF_BASE * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+
+def _log_status_error(conversation_id: int, e: httpx.HTTPStatusError) -> None:
+    logger.error(
+        "Chatwoot client: post_message failed conversation_id=%s status=%s body=%s",
+        conversation_id,
+        e.response.status_code,
+        (e.response.text or "")[:500],
+    )
+
+
 def post_message(
     conversation_id: int,
     content: str,
@@ -37,26 +153,23 @@ def post_message(
     private=False: customer sees it (bot reply).
     access_token: if set, use instead of CHATWOOT_API_ACCESS_TOKEN (e.g. Agent Bot token).
     """
-    token = (access_token or "").strip() or CHATWOOT_API_ACCESS_TOKEN
-    if not CHATWOOT_BASE_URL or not CHATWOOT_ACCOUNT_ID or not token:
-        logger.warning("Chatwoot client: not configured, cannot post message")
+    prepared = _prepare_post(conversation_id, content, private, access_token)
+    if prepared is None:
         return None
-    url = f"{CHATWOOT_BASE_URL}/api/v1/accounts/{CHATWOOT_ACCOUNT_ID}/conversations/{conversation_id}/messages"
-    payload: dict[str, Any] = {
-        "content": content,
-        "message_type": "outgoing",
-        "private": private,
-    }
-    with httpx.Client(timeout=30.0) as client:
+    url, payload, headers = prepared
+    client = _get_client()
+    for attempt in range(CHATWOOT_POST_RETRIES + 1):
+        last_try = attempt == CHATWOOT_POST_RETRIES
         try:
-            r = client.post(
-                url,
-                json=payload,
-                headers={
-                    "api_access_token": token,
-                    "Content-Type": "application/json",
-                },
-            )
+            r = client.post(url, json=payload, headers=headers)
+            if r.status_code in _RETRY_STATUSES and not last_try:
+                delay = _retry_delay(attempt, r)
+                logger.warning(
+                    "Chatwoot client: status=%s conversation_id=%s, retry in %.2fs",
+                    r.status_code, conversation_id, delay,
+                )
+                time.sleep(delay)
+                continue
             r.raise_for_status()
             logger.info(
                 "Chatwoot client: message posted conversation_id=%s private=%s",
@@ -65,13 +178,196 @@ def post_message(
             )
             return r.json()
         except httpx.HTTPStatusError as e:
-            logger.error(
-                "Chatwoot client: post_message failed conversation_id=%s status=%s body=%s",
-                conversation_id,
-                e.response.status_code,
-                (e.response.text or "")[:500],
-            )
+            _log_status_error(conversation_id, e)
             return None
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+            # Запрос не ушёл — повтор безопасен. ReadTimeout и обрыв ответа не повторяем:
+            # Chatwoot мог уже создать сообщение, и клиент увидел бы его дважды.
+            if last_try:
+                logger.exception("Chatwoot client: post_message error conversation_id=%s %s", conversation_id, e)
+                return None
+            time.sleep(_retry_delay(attempt))
         except (httpx.HTTPError, Exception) as e:
             logger.exception("Chatwoot client: post_message error conversation_id=%s %s", conversation_id, e)
             return None
+    return None
+
+
+def toggle_typing(
+    conversation_id: int,
+    on: bool,
+    *,
+    access_token: str | None = None,
+) -> bool:
+    """
+    Show (on=True) or hide the "typing…" indicator in the conversation.
+    Best effort: one attempt, no retries — a missed indicator must not delay the reply.
+    """
+    prepared = _conversation_request(conversation_id, "toggle_typing_status", access_token)
+    if prepared is None:
+        return False
+    url, headers = prepared
+    try:
+        r = _get_client().post(url, json={"typing_status": "on" if on else "off"}, headers=headers)
+        r.raise_for_status()
+    except httpx.HTTPError as e:
+        logger.warning("Chatwoot client: toggle_typing failed conversation_id=%s %s", conversation_id, e)
+        return False
+    return True
+
+
+PostFn = Callable[..., "dict[str, Any] | None"]
+TypingFn = Callable[..., bool]
+
+
+class MessagePoster:
+    """
+    Bounded posting pipeline: each conversation is pinned to one worker (conversation_id % workers),
+    so blocks of one reply are posted in submit order while different conversations post in parallel.
+    submit() only enqueues, so the caller (e.g. the LLM stream) does not wait for the HTTP round trip.
+    submit_typing() goes through the same per-conversation queue, so the indicator toggles stay ordered with blocks.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int = CHATWOOT_POST_WORKERS,
+        queue_size: int = CHATWOOT_POST_QUEUE_SIZE,
+        post_fn: PostFn | None = None,
+        typing_fn: TypingFn | None = None,
+    ) -> None:
+        self._post_fn = post_fn
+        self._typing_fn = typing_fn
+        n = max(1, workers)
+        per_worker = max(1, queue_size // n)
+        self._queues: list[queue.Queue] = [queue.Queue(maxsize=per_worker) for _ in range(n)]
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._posted = 0
+        self._failed = 0
+        self._rejected = 0
+        self._typing = 0
+        self._typing_skipped = 0
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            for i, q in enumerate(self._queues):
+                t = threading.Thread(target=self._run, args=(q,), name=f"chatwoot-poster-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(
+        self,
+        conversation_id: int,
+        content: str,
+        *,
+        private: bool = False,
+        access_token: str | None = None,
+    ) -> Future:
+        """Enqueue a message; the Future resolves to post_message()'s result (dict or None)."""
+        kw: dict[str, Any] = {"private": private}
+        if access_token:
+            kw["access_token"] = access_token
+        return self._enqueue("message", conversation_id, content, kw)
+
+    def submit_typing(self, conversation_id: int, on: bool, *, access_token: str | None = None) -> Future:
+        """
+        Enqueue a typing indicator toggle; the Future resolves to toggle_typing()'s result.
+        Never waits and never takes the last free slots from reply blocks: if the worker's queue
+        is more than half full, the toggle is skipped (Future resolves to False).
+        """
+        kw: dict[str, Any] = {"access_token": access_token} if access_token else {}
+        return self._enqueue("typing", conversation_id, on, kw)
+
+    def _enqueue(self, kind: str, conversation_id: int, arg: Any, kw: dict[str, Any]) -> Future:
+        self._ensure_started()
+        fut: Future = Future()
+        q = self._queues[conversation_id % len(self._queues)]
+        if kind == "typing":
+            if q.qsize() * 2 >= q.maxsize:
+                with self._lock:
+                    self._typing_skipped += 1
+                fut.set_result(False)
+                return fut
+            try:
+                q.put_nowait((kind, conversation_id, arg, kw, fut))
+            except queue.Full:
+                with self._lock:
+                    self._typing_skipped += 1
+                fut.set_result(False)
+            return fut
+        try:
+            q.put((kind, conversation_id, arg, kw, fut), timeout=CHATWOOT_POST_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            logger.error("Chatwoot poster: queue full, dropping %s conversation_id=%s", kind, conversation_id)
+            fut.set_result(None)
+        return fut
+
+    def close(self) -> None:
+        """Stop workers after draining what is already queued."""
+        for q in self._queues:
+            q.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "queue_depth": sum(q.qsize() for q in self._queues),
+                "workers": len(self._queues),
+                "posted": self._posted,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "typing": self._typing,
+                "typing_skipped": self._typing_skipped,
+            }
+
+    def _run(self, q: queue.Queue) -> None:
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            kind, conversation_id, arg, kw, fut = item
+            if kind == "typing":
+                typing_fn = self._typing_fn or toggle_typing
+                try:
+                    result = typing_fn(conversation_id, arg, **kw)
+                except Exception as e:
+                    logger.warning("Chatwoot poster: typing toggle failed conversation_id=%s %s", conversation_id, e)
+                    result = False
+                with self._lock:
+                    self._typing += 1
+                fut.set_result(result)
+                continue
+            post_fn = self._post_fn or post_message
+            try:
+                result = post_fn(conversation_id, arg, **kw)
+            except Exception as e:
+                logger.exception("Chatwoot poster: post failed conversation_id=%s %s", conversation_id, e)
+                result = None
+            with self._lock:
+                if result:
+                    self._posted += 1
+                else:
+                    self._failed += 1
+            fut.set_result(result)
+
+
+_poster: MessagePoster | None = None
+
+
+def get_poster() -> MessagePoster:
+    """Process-wide MessagePoster (created on first use)."""
+    global _poster
+    if _poster is None:
+        with _client_lock:
+            if _poster is None:
+                _poster = MessagePoster()
+    return _poster
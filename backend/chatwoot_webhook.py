@@ -8,18 +8,23 @@ so any project can plug in its own AI backend (e.g. RAG+LLM, another API).
 from __future__ import annotations
 
 import logging
+import math
 import os
 import re
 import sys
 import threading
 import time as _time
+from collections import deque
 from typing import Any, Callable, Iterator
 
 # Идемпотентность: один и тот же message_created Chatwoot может присылать дважды (account webhook + bot webhook).
-# Обрабатываем каждое сообщение только один раз по (conversation_id, message_id).
-_SEEN_MESSAGE_KEYS: set[tuple[int, str]] = set()
-_SEEN_LOCK = threading.Lock()
-_SEEN_MAX = 5000
+# Обрабатываем каждое сообщение только один раз по (conversation_id, message_id) в пределах TTL.
+# CHATWOOT_DEDUP_SQLITE_PATH — общий файл, чтобы несколько воркеров uvicorn дедуплицировали друг против друга.
+DEDUP_TTL_SEC = float(os.environ.get("CHATWOOT_DEDUP_TTL_SEC", "3600"))
+DEDUP_MAX = int(os.environ.get("CHATWOOT_DEDUP_MAX", "5000"))
+DEDUP_SQLITE_PATH = (os.environ.get("CHATWOOT_DEDUP_SQLITE_PATH") or "").strip()
+_seen_messages: SeenStore | None = None
+_seen_lock = threading.Lock()
 
 # Chatwoot иногда присылает content с HTML (<p>текст</p>) — убираем теги перед RAG
 _HTML_TAG_RE = re.compile(r"<[^>]+>")
@@ -36,10 +41,15 @@ _SKIP_PHRASES = frozenset(
     )
 )
 
-from fastapi import APIRouter, BackgroundTasks, Request
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
-from backend.chatwoot_client import is_configured, post_message, CHATWOOT_AGENTBOT_ACCESS_TOKEN
+from backend.chatwoot_client import is_configured, get_poster, post_message, CHATWOOT_AGENTBOT_ACCESS_TOKEN
+from backend.dedup import SeenKeys, SeenStore, SQLiteSeenKeys
+from backend.job_queue import JobQueue, MemoryJobStore, SQLiteJobStore
+from backend.stream_segmenter import with_ticks
 
 logger = logging.getLogger(__name__)
 
@@ -66,6 +76,25 @@ _stream_reply_provider: StreamReplyProvider | None = None
 
 # Стримить ответ бота блоками (true) или одним сообщением (false). При true placeholder не постится.
 STREAM_REPLY_ENABLED = os.environ.get("CHATWOOT_STREAM_REPLY", "").lower() in ("1", "true", "yes")
+# Индикатор «печатает…» через Chatwoot API, пока готовится следующий блок (только стрим-режим)
+STREAM_TYPING_INDICATOR = os.environ.get("CHATWOOT_STREAM_TYPING", "").lower() in ("1", "true", "yes")
+# Через сколько секунд после блока снова показать индикатор, если следующего блока ещё нет
+STREAM_TYPING_DELAY_SEC = float(os.environ.get("CHATWOOT_STREAM_TYPING_DELAY_SEC", "0.5"))
+# Сколько последних ответов учитывать в p50/p95 времени до первого блока (/metrics)
+STREAM_STATS_WINDOW = int(os.environ.get("CHATWOOT_STREAM_STATS_WINDOW", "1000"))
+_first_block_ms: deque[float] = deque(maxlen=max(1, STREAM_STATS_WINDOW))
+_stream_counts = {"replies": 0, "blocks": 0, "no_blocks": 0}
+_stream_stats_lock = threading.Lock()
+
+# Очередь обработки webhook: memory | sqlite (sqlite переживает рестарт — незавершённые задачи проигрываются заново)
+JOB_BACKEND = (os.environ.get("CHATWOOT_JOB_BACKEND") or "memory").strip().lower()
+JOB_SQLITE_PATH = os.environ.get("CHATWOOT_JOB_SQLITE_PATH", "data/chatwoot_jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("CHATWOOT_JOB_WORKERS", "4"))
+JOB_MAX_PENDING = int(os.environ.get("CHATWOOT_JOB_MAX_PENDING", "1000"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("CHATWOOT_JOB_MAX_ATTEMPTS", "2"))
+JOB_LEASE_SEC = float(os.environ.get("CHATWOOT_JOB_LEASE_SEC", "30"))
+_job_queue: JobQueue | None = None
+_job_queue_lock = threading.Lock()
 
 
 def set_reply_provider(provider: ReplyProvider | None) -> None:
@@ -80,6 +109,38 @@ def set_stream_reply_provider(provider: StreamReplyProvider | None) -> None:
     _stream_reply_provider = provider
 
 
+def _record_first_block(ms: float) -> None:
+    with _stream_stats_lock:
+        _first_block_ms.append(ms)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    """Перцентиль по ближайшему рангу; values отсортированы."""
+    return round(values[max(0, math.ceil(q * len(values)) - 1)], 2)
+
+
+def _first_block_callback(t0: float) -> Callable[[Any], None]:
+    def done(fut: Any) -> None:
+        if fut.result():
+            _record_first_block((_time.perf_counter() - t0) * 1000.0)
+
+    return done
+
+
+def stream_stats() -> dict[str, Any]:
+    """Стрим-ответы в Chatwoot: число ответов и блоков, время до первого опубликованного блока (p50/p95, мс)."""
+    with _stream_stats_lock:
+        out: dict[str, Any] = dict(_stream_counts)
+        values = sorted(_first_block_ms)
+    out["first_block_ms"] = (
+        {"count": len(values), "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95), "max": round(values[-1], 2)}
+        if values
+        else {"count": 0}
+    )
+    out["typing_indicator"] = STREAM_TYPING_INDICATOR
+    return out
+
+
 def get_reply_provider() -> ReplyProvider | None:
     return _reply_provider
 
@@ -258,18 +319,49 @@ def _process_message(payload: WebhookPayload) -> None:
 
     t0 = _time.perf_counter()
     if use_stream:
+        # Блоки уходят в очередь постера (порядок внутри беседы сохраняется), стрим LLM не ждёт HTTP
+        poster = get_poster()
+        pending: list = []
         block_count = 0
+        typing = False
+        if STREAM_TYPING_INDICATOR:
+            poster.submit_typing(cid, True, **post_kw)
+            typing = True
+        blocks: Iterator[str | None] = stream_provider(content)
+        if STREAM_TYPING_INDICATOR:
+            # None — блока нет уже STREAM_TYPING_DELAY_SEC: снова показать индикатор (виджет гасит его на
+            # каждом сообщении). После последнего блока стрим обычно заканчивается раньше — лишнего «on» нет.
+            blocks = with_ticks(blocks, STREAM_TYPING_DELAY_SEC)
         try:
-            for block in stream_provider(content):
-                if not (block or "").strip():
+            for block in blocks:
+                if block is None:
+                    if not typing:
+                        poster.submit_typing(cid, True, **post_kw)
+                        typing = True
                     continue
-                block_count += 1
-                ok = post_message(cid, block.strip(), private=False, **post_kw)
-                if not ok:
-                    logger.error("Failed to post stream block %s to conversation_id=%s", block_count, cid)
+                if not block.strip():
+                    continue
+                if any(f.done() and not f.result() for f in pending):
+                    logger.error("Failed to post stream block to conversation_id=%s; stopping stream", cid)
                     break
+                block_count += 1
+                fut = poster.submit(cid, block.strip(), private=False, **post_kw)
+                typing = False
+                if block_count == 1:
+                    # Время до первого блока, который клиент действительно увидел (после HTTP-поста)
+                    fut.add_done_callback(_first_block_callback(t0))
+                pending.append(fut)
         except Exception as e:
             logger.exception("Stream reply provider failed for conversation_id=%s: %s", cid, e)
+        if typing:
+            poster.submit_typing(cid, False, **post_kw)
+        for i, fut in enumerate(pending, 1):
+            if not fut.result():
+                logger.error("Failed to post stream block %s to conversation_id=%s", i, cid)
+        with _stream_stats_lock:
+            _stream_counts["replies"] += 1
+            _stream_counts["blocks"] += block_count
+            _stream_counts["no_blocks"] += block_count == 0
         total_sec = _time.perf_counter() - t0
         print(
             f"[chatwoot] stream_blocks={block_count} total_sec={total_sec:.2f} mode={mode}",
@@ -298,6 +390,52 @@ def _process_message(payload: WebhookPayload) -> None:
             logger.error("Failed to post copilot suggestion to conversation_id=%s", cid)
 
 
+def get_seen_messages() -> SeenStore:
+    """Process-wide dedup store for (conversation_id, message_id)."""
+    global _seen_messages
+    if _seen_messages is None:
+        with _seen_lock:
+            if _seen_messages is None:
+                if DEDUP_SQLITE_PATH:
+                    _seen_messages = SQLiteSeenKeys(DEDUP_SQLITE_PATH, ttl_sec=DEDUP_TTL_SEC, capacity=DEDUP_MAX)
+                else:
+                    _seen_messages = SeenKeys(ttl_sec=DEDUP_TTL_SEC, capacity=DEDUP_MAX)
+    return _seen_messages
+
+
+def _run_job(data: dict[str, Any]) -> None:
+    """Job handler: payload dict (as stored in the queue) -> _process_message."""
+    _process_message(WebhookPayload(**data))
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide webhook job queue (backend from CHATWOOT_JOB_BACKEND)."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                store = SQLiteJobStore(JOB_SQLITE_PATH, lease_sec=JOB_LEASE_SEC) if JOB_BACKEND == "sqlite" else MemoryJobStore()
+                _job_queue = JobQueue(
+                    _run_job,
+                    store=store,
+                    workers=JOB_WORKERS,
+                    max_pending=JOB_MAX_PENDING,
+                    max_attempts=JOB_MAX_ATTEMPTS,
+                )
+    return _job_queue
+
+
+def start_job_queue() -> None:
+    """Start workers and replay unfinished jobs (call on app startup)."""
+    get_job_queue().start()
+
+
+def stop_job_queue(timeout: float | None = 30.0) -> None:
+    """Stop workers (call on app shutdown); queued jobs stay in the store."""
+    if _job_queue is not None:
+        _job_queue.stop(timeout)
+
+
 class CopilotRequest(BaseModel):
     """Request body for /copilot (suggestion only, no post to Chatwoot)."""
     message: str = Field(..., min_length=1)
@@ -318,8 +456,8 @@ def copilot_suggest(req: CopilotRequest) -> CopilotResponse:
     return CopilotResponse(suggestion=reply)
 
 
-@router.post("/webhook")
-async def webhook(request: Request, background_tasks: BackgroundTasks) -> dict[str, str]:
+@router.post("/webhook", response_model=None)
+async def webhook(request: Request) -> dict[str, str] | JSONResponse:
     """
     Chatwoot webhook: message_created.
     - Incoming only; bot mode -> post public reply; human mode -> post private suggestion.
@@ -353,15 +491,12 @@ async def webhook(request: Request, background_tasks: BackgroundTasks) -> dict[s
         logger.debug("chatwoot webhook: skip message_type %s", message_type)
         return {"status": "ok"}
     message_id = body.get("id")
-    if cid is not None and message_id is not None:
-        key = (cid, str(message_id))
-        with _SEEN_LOCK:
-            if key in _SEEN_MESSAGE_KEYS:
-                logger.info("chatwoot webhook: skip duplicate message_id=%s conversation_id=%s", message_id, cid)
-                return {"status": "ok"}
-            _SEEN_MESSAGE_KEYS.add(key)
-            if len(_SEEN_MESSAGE_KEYS) > _SEEN_MAX:
-                _SEEN_MESSAGE_KEYS.clear()
+    seen_key = (cid, str(message_id)) if cid is not None and message_id is not None else None
+    if seen_key is not None:
+        # SQLite-хранилище: BEGIN IMMEDIATE может ждать соседний воркер — не на event loop
+        if await run_in_threadpool(get_seen_messages().seen_before, seen_key):
+            logger.info("chatwoot webhook: skip duplicate message_id=%s conversation_id=%s", message_id, cid)
+            return {"status": "ok"}
     content = (body.get("content") or "").strip()
     conv_attrs = conv.get("custom_attributes") or conv.get("additional_attributes") or {}
     print(
@@ -369,15 +504,21 @@ async def webhook(request: Request, background_tasks: BackgroundTasks) -> dict[s
         file=sys.stderr,
         flush=True,
     )
-    payload = WebhookPayload(
-        event=event,
-        id=message_id,
-        content=body.get("content", ""),
-        message_type=message_type,
-        content_type=body.get("content_type", "text"),
-        sender=body.get("sender"),
-        contact=body.get("contact"),
-        conversation=conv,
-    )
-    background_tasks.add_task(_process_message, payload)
+    job = {
+        "event": event,
+        "id": message_id,
+        "content": body.get("content", ""),
+        "message_type": message_type,
+        "content_type": body.get("content_type", "text"),
+        "sender": body.get("sender"),
+        "contact": body.get("contact"),
+        "conversation": conv,
+    }
+    # SQLite-бэкенд пишет задачу в файл синхронно
+    if not await run_in_threadpool(get_job_queue().submit, job, conversation_id=cid):
+        logger.error("chatwoot webhook: job queue full, rejecting message_id=%s conversation_id=%s", message_id, cid)
+        # Chatwoot повторит доставку после 503 — повтор не должен считаться дублем
+        if seen_key is not None:
+            await run_in_threadpool(get_seen_messages().forget, seen_key)
+        return JSONResponse(status_code=503, content={"status": "busy"})
     return {"status": "ok"}
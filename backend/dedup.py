@@ -0,0 +1,144 @@
+"""
+Idempotency for Chatwoot webhooks: remembers (conversation_id, message_id) keys for a limited time.
+
+- SeenKeys: in-memory, fixed footprint (capacity), TTL, sharded locks so concurrent webhooks do not
+  contend on one global lock. Oldest keys are evicted one by one — never a clear-all.
+- SQLiteSeenKeys: the same contract on a shared SQLite file, so several uvicorn workers dedupe against each other.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Hashable, Protocol
+
+
+class SeenStore(Protocol):
+    def seen_before(self, key: Hashable) -> bool:
+        """Atomically check and remember key. True if key was already seen within TTL."""
+        ...
+
+    def forget(self, key: Hashable) -> None:
+        """Drop key so a redelivery is processed (e.g. the message could not be queued)."""
+        ...
+
+    def stats(self) -> dict[str, Any]: ...
+
+
+class SeenKeys:
+    """Sharded ordered dicts: key -> first-seen time. Per-shard capacity = capacity / shards."""
+
+    def __init__(self, *, ttl_sec: float = 3600.0, capacity: int = 5000, shards: int = 16) -> None:
+        self._ttl = ttl_sec
+        self._shards = max(1, shards)
+        self._shard_capacity = max(1, capacity // self._shards)
+        self._maps: list[OrderedDict[Hashable, float]] = [OrderedDict() for _ in range(self._shards)]
+        self._locks = [threading.Lock() for _ in range(self._shards)]
+        self._duplicates = 0
+        self._evicted = 0
+
+    def seen_before(self, key: Hashable) -> bool:
+        i = hash(key) % self._shards
+        now = time.monotonic()
+        entries = self._maps[i]
+        with self._locks[i]:
+            # Записи идут в порядке времени: истёкшие — в начале
+            while entries:
+                oldest_key, ts = next(iter(entries.items()))
+                if now - ts <= self._ttl:
+                    break
+                del entries[oldest_key]
+            if key in entries:
+                self._duplicates += 1
+                return True
+            entries[key] = now
+            while len(entries) > self._shard_capacity:
+                entries.popitem(last=False)
+                self._evicted += 1
+            return False
+
+    def forget(self, key: Hashable) -> None:
+        i = hash(key) % self._shards
+        with self._locks[i]:
+            self._maps[i].pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "memory",
+            "size": sum(len(m) for m in self._maps),
+            "capacity": self._shard_capacity * self._shards,
+            "ttl_sec": self._ttl,
+            "duplicates": self._duplicates,
+            "evicted": self._evicted,
+        }
+
+
+class SQLiteSeenKeys:
+    """Keys in a SQLite file shared between processes; expired rows are pruned periodically."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        ttl_sec: float = 3600.0,
+        capacity: int = 5000,
+        prune_every: int = 100,
+    ) -> None:
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._ttl = ttl_sec
+        self._capacity = max(1, capacity)
+        self._prune_every = max(1, prune_every)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self._path), timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seen_keys (key TEXT PRIMARY KEY, ts REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS seen_keys_ts ON seen_keys (ts)")
+        self._inserts = 0
+        self._duplicates = 0
+
+    def seen_before(self, key: Hashable) -> bool:
+        k = repr(key)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT ts FROM seen_keys WHERE key = ?", (k,)).fetchone()
+                if row is not None and now - row[0] <= self._ttl:
+                    self._conn.execute("COMMIT")
+                    self._duplicates += 1
+                    return True
+                self._conn.execute("INSERT OR REPLACE INTO seen_keys (key, ts) VALUES (?, ?)", (k, now))
+                self._inserts += 1
+                if self._inserts % self._prune_every == 0:
+                    self._prune(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return False
+
+    def forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM seen_keys WHERE key = ?", (repr(key),))
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute("DELETE FROM seen_keys WHERE ts < ?", (now - self._ttl,))
+        self._conn.execute(
+            "DELETE FROM seen_keys WHERE key IN ("
+            " SELECT key FROM seen_keys ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+            (self._capacity,),
+        )
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM seen_keys").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "size": size,
+            "capacity": self._capacity,
+            "ttl_sec": self._ttl,
+            "duplicates": self._duplicates,
+        }
@@ -0,0 +1,404 @@
+"""
+Bounded job queue with a worker pool for Chatwoot webhook processing.
+
+- Backends: in-memory (MemoryJobStore) or SQLite file (SQLiteJobStore) — the latter survives restarts:
+  jobs that were pending or running when the process stopped are replayed.
+- SQLite rows are leased to the process that holds them and the lease is renewed while it runs, so
+  several uvicorn workers can share one file: a job is replayed (atomically claimed by one process)
+  only after its owner stopped renewing the lease — on start() and then periodically.
+- Jobs of one conversation run strictly one after another; different conversations run in parallel.
+- submit() never blocks: when max_pending is reached the job is rejected (backpressure), see stats().
+- max_attempts bounds both retries of a job whose handler raised and replays of unfinished jobs after a restart.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Protocol
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict[str, Any]], None]
+
+
+@dataclass
+class Job:
+    id: str
+    conversation_id: int | None
+    payload: dict[str, Any]
+    attempts: int = 0
+    enqueued: float = field(default_factory=time.monotonic)
+
+
+class JobStore(Protocol):
+    """Persistence for jobs; only needs to remember what is not finished yet."""
+
+    lease_sec: float  # 0 — no leases, nothing to renew
+
+    def add(self, job: Job) -> None: ...
+
+    def mark_running(self, job: Job) -> None: ...
+
+    def remove(self, job: Job) -> None: ...
+
+    def renew(self) -> None: ...
+
+    def claim_expired(self) -> list[Job]: ...
+
+
+class MemoryJobStore:
+    """No persistence: unfinished jobs are lost on restart."""
+
+    lease_sec = 0.0
+
+    def add(self, job: Job) -> None:
+        pass
+
+    def mark_running(self, job: Job) -> None:
+        pass
+
+    def remove(self, job: Job) -> None:
+        pass
+
+    def renew(self) -> None:
+        pass
+
+    def claim_expired(self) -> list[Job]:
+        return []
+
+
+class SQLiteJobStore:
+    """
+    Jobs in a SQLite file (WAL). A row lives from submit() until the handler finishes and is leased
+    to this store (owner, lease_until) for lease_sec; the queue renews the lease every lease_sec / 3.
+    """
+
+    def __init__(self, path: str | Path, lease_sec: float = 30.0) -> None:
+        self.lease_sec = max(0.01, lease_sec)
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self._path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " conversation_id INTEGER,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created REAL NOT NULL,"
+            " owner TEXT,"
+            " lease_until REAL NOT NULL DEFAULT 0)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "owner" not in columns:
+            # Файл от версии без аренды: старые строки считаются просроченными и будут переиграны
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_until REAL NOT NULL DEFAULT 0")
+
+    def add(self, job: Job) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, conversation_id, payload, status, attempts, created, owner, lease_until)"
+                " VALUES (?, ?, ?, 'pending', ?, ?, ?, ?)",
+                (
+                    job.id, job.conversation_id, json.dumps(job.payload, ensure_ascii=False),
+                    job.attempts, now, self.owner, now + self.lease_sec,
+                ),
+            )
+
+    def mark_running(self, job: Job) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = ? WHERE id = ?",
+                (job.attempts, job.id),
+            )
+
+    def remove(self, job: Job) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job.id,))
+
+    def renew(self) -> None:
+        """Extend the lease on every row this store holds."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ?", (time.time() + self.lease_sec, self.owner)
+            )
+
+    def claim_expired(self) -> list[Job]:
+        """Take over rows whose owner stopped renewing the lease; other processes see them as leased."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Свои строки не забираем: они и так в памяти этого процесса
+                rows = self._conn.execute(
+                    "SELECT id, conversation_id, payload, attempts FROM jobs"
+                    " WHERE lease_until <= ? AND owner IS NOT ? ORDER BY created, rowid",
+                    (now, self.owner),
+                ).fetchall()
+                self._conn.execute(
+                    "UPDATE jobs SET owner = ?, lease_until = ? WHERE lease_until <= ? AND owner IS NOT ?",
+                    (self.owner, now + self.lease_sec, now, self.owner),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [
+            Job(id=row[0], conversation_id=row[1], payload=json.loads(row[2]), attempts=row[3])
+            for row in rows
+        ]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueue:
+    """
+    Worker pool over a job store. Per-conversation serialization: while a conversation has a job
+    queued or running, its next jobs wait in a per-conversation backlog instead of the ready queue.
+    """
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        *,
+        store: JobStore | None = None,
+        workers: int = 4,
+        max_pending: int = 1000,
+        max_attempts: int = 2,
+    ) -> None:
+        self._handler = handler
+        self._store: JobStore = store or MemoryJobStore()
+        self._workers = max(1, workers)
+        self._max_pending = max(1, max_pending)
+        self._max_attempts = max(1, max_attempts)
+        self._cond = threading.Condition()
+        self._ready: deque[Job] = deque()
+        self._backlog: dict[int, deque[Job]] = {}
+        self._claimed: set[int] = set()
+        self._pending = 0
+        self._running = 0
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+        self._stop_event = threading.Event()
+        self._submitted = 0
+        self._processed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._replayed = 0
+        self._retried = 0
+        self._wait_sec_total = 0.0
+
+    @property
+    def started(self) -> bool:
+        return bool(self._threads)
+
+    def start(self) -> None:
+        """Replay unfinished jobs with an expired lease and start the workers (idempotent)."""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            self._stop_event.clear()
+            self._replay_locked(self._store.claim_expired())
+            for i in range(self._workers):
+                t = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+            if self._store.lease_sec > 0:
+                t = threading.Thread(target=self._keep_leases, name="job-lease", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Stop workers after the jobs they are running; queued jobs stay in the store for replay."""
+        with self._cond:
+            self._stopping = True
+            self._stop_event.set()
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def submit(self, payload: dict[str, Any], conversation_id: int | None = None) -> bool:
+        """Enqueue a job. Returns False if the queue is full (job rejected)."""
+        if not self._threads:
+            self.start()
+        job = Job(id=uuid.uuid4().hex, conversation_id=conversation_id, payload=payload)
+        with self._cond:
+            if self._pending >= self._max_pending:
+                self._rejected += 1
+                return False
+            self._pending += 1  # место занято до записи в хранилище, которая идёт без блокировки
+        try:
+            self._store.add(job)
+        except BaseException:
+            with self._cond:
+                self._pending -= 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._enqueue_locked(job)
+            self._submitted += 1
+        return True
+
+    def join(self, timeout: float | None = None) -> bool:
+        """Wait until nothing is queued or running. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        with self._cond:
+            done = self._processed + self._failed
+            return {
+                "workers": self._workers,
+                "pending": self._pending,
+                "ready": len(self._ready),
+                "running": self._running,
+                "conversations_waiting": sum(1 for q in self._backlog.values() if q),
+                "max_pending": self._max_pending,
+                "utilization": round(self._pending / self._max_pending, 3),
+                "submitted": self._submitted,
+                "processed": self._processed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "replayed": self._replayed,
+                "retried": self._retried,
+                "avg_wait_sec": round(self._wait_sec_total / done, 3) if done else 0.0,
+            }
+
+    def _replay_locked(self, jobs: list[Job]) -> None:
+        known = {j.id for j in self._ready} | {j.id for q in self._backlog.values() for j in q}
+        replayed = 0
+        for job in jobs:
+            if job.id in known:
+                continue
+            if job.attempts >= self._max_attempts:
+                logger.warning(
+                    "job queue: dropping job %s conversation_id=%s after %s attempts",
+                    job.id, job.conversation_id, job.attempts,
+                )
+                self._store.remove(job)
+                continue
+            self._pending += 1
+            self._enqueue_locked(job)
+            replayed += 1
+        self._replayed += replayed
+        if replayed:
+            logger.info("job queue: replayed %s unfinished jobs", replayed)
+
+    def _keep_leases(self) -> None:
+        """Renew leases on our jobs; pick up jobs of a worker process that died without finishing them."""
+        while not self._stop_event.wait(self._store.lease_sec / 3):
+            try:
+                self._store.renew()
+                expired = self._store.claim_expired()
+            except Exception as e:
+                logger.exception("job queue: cannot renew job leases: %s", e)
+                continue
+            if expired:
+                with self._cond:
+                    self._replay_locked(expired)
+
+    def _enqueue_locked(self, job: Job) -> None:
+        """Put a job already counted in _pending into the ready queue or its conversation backlog."""
+        cid = job.conversation_id
+        if cid is not None and cid in self._claimed:
+            self._backlog.setdefault(cid, deque()).append(job)
+        else:
+            if cid is not None:
+                self._claimed.add(cid)
+            self._ready.append(job)
+            self._cond.notify()
+
+    def _release_locked(self, job: Job) -> None:
+        cid = job.conversation_id
+        if cid is None:
+            return
+        backlog = self._backlog.get(cid)
+        if backlog:
+            self._ready.append(backlog.popleft())
+            self._cond.notify()
+        else:
+            self._backlog.pop(cid, None)
+            self._claimed.discard(cid)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+                job = self._ready.popleft()
+                self._running += 1
+                self._wait_sec_total += time.monotonic() - job.enqueued
+            job.attempts += 1
+            ok = True
+            try:
+                self._store.mark_running(job)
+                self._handler(job.payload)
+            except Exception as e:
+                ok = False
+                logger.exception("job queue: job %s conversation_id=%s failed: %s", job.id, job.conversation_id, e)
+            if not ok and job.attempts < self._max_attempts and self._retry(job):
+                continue
+            try:
+                self._store.remove(job)
+            except Exception as e:
+                logger.exception("job queue: cannot remove job %s from store: %s", job.id, e)
+            with self._cond:
+                self._running -= 1
+                self._pending -= 1
+                if ok:
+                    self._processed += 1
+                else:
+                    self._failed += 1
+                self._release_locked(job)
+                self._cond.notify_all()
+
+    def _retry(self, job: Job) -> bool:
+        """Requeue a failed job; the conversation stays claimed, so its later jobs still wait behind it."""
+        try:
+            self._store.add(job)
+        except Exception as e:
+            logger.exception("job queue: cannot requeue job %s: %s", job.id, e)
+            return False
+        with self._cond:
+            if self._stopping:
+                # Строка в хранилище осталась — задача будет переиграна после рестарта
+                self._running -= 1
+                self._pending -= 1
+                self._cond.notify_all()
+                return True
+            logger.warning(
+                "job queue: retrying job %s conversation_id=%s (attempt %s of %s)",
+                job.id, job.conversation_id, job.attempts + 1, self._max_attempts,
+            )
+            self._running -= 1
+            self._retried += 1
+            job.enqueued = time.monotonic()
+            self._ready.append(job)
+            self._cond.notify_all()
+        return True
@@ -5,12 +5,15 @@ GET / — чат-интерфейс.
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
 import os
+import threading
 import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Any, Iterator
+from typing import Any, AsyncIterator, Iterator
 
 from dotenv import load_dotenv
 
@@ -20,11 +23,27 @@ import httpx
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
-
-from backend.prompts import SYSTEM_PROMPT_TEMPLATE
-from rag.search import search as rag_search
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from backend.answer_cache import AnswerCache
+from backend.chatwoot_client import get_poster
+from backend.prompts import CONTEXT_MESSAGE_TEMPLATE, SYSTEM_PROMPT
+from backend.stream_segmenter import StreamSegmenter, split_reply, with_ticks
+from rag.context import build_context, context_stats
+from rag.results import SearchHit
+from rag.search import (
+    asearch_hits as rag_asearch_hits,
+    awarm_up as rag_awarm_up,
+    collection_generation,
+    cross_encoder_stats,
+    embed_query,
+    embedding_stats,
+    load_cross_encoder,
+    search_hits as rag_search_hits,
+    warm_status,
+)
 
 # Algolia Agent Studio: URL приложения https://{APPLICATION_ID}.algolia.net/agent-studio/1/agents/{agent_id}/completions
 # Переопределение: ALGOLIA_AGENT_STUDIO_BASE_URL (например https://agent-studio.us.algolia.com для регионального эндпоинта)
@@ -44,10 +63,114 @@ def _get_llm_api_key() -> str:
     return (os.environ.get("LLM_API_KEY") or os.environ.get("OPENAI_API_KEY") or "").strip()
 
 
-LLM_API_BASE_URL = os.environ.get("LLM_API_BASE_URL", "").rstrip("/")
 LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o-mini")
 
-app = FastAPI(title="RAG Chat API", version="0.1.0")
+# Пул соединений к LLM API (общий на процесс): лимиты, keep-alive, таймауты (сек)
+LLM_HTTP_MAX_CONNECTIONS = int(os.environ.get("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.environ.get("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_TIMEOUT = float(os.environ.get("LLM_HTTP_TIMEOUT", "120"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.environ.get("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+
+# Кэш промпта у провайдера: статический системный промпт — общий префикс всех запросов.
+# LLM_PROMPT_CACHE: none — без подсказок (OpenAI кэширует префикс сам), key — prompt_cache_key (OpenAI),
+# cache_control — разметка {"cache_control": {"type": "ephemeral"}} на системном промпте (OpenRouter, Anthropic-совместимые)
+LLM_PROMPT_CACHE = os.environ.get("LLM_PROMPT_CACHE", "none").strip().lower()
+LLM_PROMPT_CACHE_KEY = os.environ.get("LLM_PROMPT_CACHE_KEY", "kinescope-rag-v1")
+# Роль сообщения с результатами поиска: user (принимают все OpenAI-совместимые API) или system — второе системное
+LLM_CONTEXT_ROLE = os.environ.get("LLM_CONTEXT_ROLE", "user").strip().lower()
+# Запрашивать usage в стриме (stream_options.include_usage), чтобы логировать закэшированные токены:
+# true | false | auto — только для API OpenAI (без LLM_API_BASE_URL или api.openai.com); другие провайдеры могут отклонить поле
+LLM_STREAM_USAGE = os.environ.get("LLM_STREAM_USAGE", "auto").strip().lower()
+# Открывать соединение с LLM API (TCP + TLS) параллельно с поиском, если в пуле может не быть живого
+LLM_PREWARM = os.environ.get("LLM_PREWARM", "true").lower() in ("1", "true", "yes")
+# Таймаут самого прогрева (без повторов) и сколько генерация готова его ждать — медленный /models не тормозит ответ
+LLM_PREWARM_TIMEOUT_SEC = float(os.environ.get("LLM_PREWARM_TIMEOUT_SEC", "3"))
+LLM_PREWARM_WAIT_SEC = float(os.environ.get("LLM_PREWARM_WAIT_SEC", "0.3"))
+
+_llm_client: Any = None
+_llm_client_key: tuple[str, str | None] | None = None
+_async_llm_client: Any = None
+_async_llm_client_key: tuple[str, str | None] | None = None
+_llm_client_lock = threading.Lock()
+_llm_usage_lock = threading.Lock()
+_llm_usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+_llm_last_used = 0.0
+_pipeline_lock = threading.Lock()
+_pipeline_stats: dict[str, dict[str, float]] = {}
+
+# Кэш готовых ответов: точный по нормализованному запросу + семантический (косинус эмбеддингов запросов)
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ANSWER_CACHE_MAX_SIZE = int(os.environ.get("ANSWER_CACHE_MAX_SIZE", "500"))
+ANSWER_CACHE_TTL_SEC = float(os.environ.get("ANSWER_CACHE_TTL_SEC", "3600"))
+ANSWER_CACHE_SIM_THRESHOLD = float(os.environ.get("ANSWER_CACHE_SIM_THRESHOLD", "0.95"))
+ANSWER_CACHE_GENERATION_CHECK_SEC = float(os.environ.get("ANSWER_CACHE_GENERATION_CHECK_SEC", "60"))
+# Прогрев моделей и соединений при старте (фоном); пока он не закончен, /ready отвечает 503
+WARMUP_ON_STARTUP = os.environ.get("WARMUP_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+_answer_cache: AnswerCache | None = (
+    AnswerCache(
+        max_size=ANSWER_CACHE_MAX_SIZE,
+        ttl_sec=ANSWER_CACHE_TTL_SEC,
+        similarity_threshold=ANSWER_CACHE_SIM_THRESHOLD,
+        embed_fn=embed_query,
+        generation_fn=collection_generation,
+        generation_check_sec=ANSWER_CACHE_GENERATION_CHECK_SEC,
+    )
+    if ANSWER_CACHE_ENABLED
+    else None
+)
+
+
+def _cache_get(message: str) -> str | None:
+    if _answer_cache is None:
+        return None
+    return _answer_cache.get(message)
+
+
+def _cache_put(message: str, reply: str) -> None:
+    if _answer_cache is not None:
+        _answer_cache.put(message, reply)
+
+
+def _replay_sse(reply: str, chunk_chars: int = 64) -> Iterator[str]:
+    """Отдаёт закэшированный ответ в формате SSE (data: {"delta": "..."}) кусками по границам слов."""
+    start = 0
+    while start < len(reply):
+        end = min(start + chunk_chars, len(reply))
+        if end < len(reply):
+            space = reply.rfind(" ", start + 1, end)
+            if space > start:
+                end = space
+        yield f"data: {json.dumps({'delta': reply[start:end]}, ensure_ascii=False)}\n\n"
+        start = end
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Старт/остановка фоновых компонентов: очередь задач Chatwoot (проигрывает незавершённые задачи),
+    загрузка кросс-энкодера в фоне (USE_CROSS_ENCODER), чтобы первый запрос не ждал модель — независимо от прогрева,
+    прогрев моделей и соединений в фоне (WARMUP_ON_STARTUP) — /ready отвечает 200, когда он закончен.
+    """
+    threading.Thread(target=load_cross_encoder, name="cross-encoder-load", daemon=True).start()
+    warm_task = asyncio.create_task(rag_awarm_up()) if WARMUP_ON_STARTUP else None
+    try:
+        from backend.chatwoot_webhook import start_job_queue, stop_job_queue
+    except ImportError:
+        start_job_queue = stop_job_queue = None
+    if start_job_queue is not None:
+        await run_in_threadpool(start_job_queue)
+    try:
+        yield
+    finally:
+        if warm_task is not None:
+            warm_task.cancel()
+        if stop_job_queue is not None:
+            await run_in_threadpool(stop_job_queue)
+
+
+app = FastAPI(title="RAG Chat API", version="0.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -66,7 +189,45 @@ class ChatResponse(BaseModel):
     reply: str
 
 
+def _get_llm_base_url() -> str:
+    return (os.environ.get("LLM_API_BASE_URL") or "").strip().rstrip("/")
+
+
+def _llm_client_kwargs() -> dict[str, Any]:
+    api_key = _get_llm_api_key()
+    if not api_key:
+        raise HTTPException(
+            status_code=500,
+            detail=(
+                "Не задан API-ключ LLM. В файле .env на сервере укажите LLM_API_KEY=sk-... или OPENAI_API_KEY=sk-... "
+                "(без пробелов вокруг =). Затем перезапустите backend: docker compose up -d --force-recreate backend"
+            ),
+        )
+    client_kw: dict[str, Any] = {"api_key": api_key}
+    base_url = _get_llm_base_url()
+    if base_url:
+        client_kw["base_url"] = base_url
+    return client_kw
+
+
+def _llm_http_options() -> dict[str, Any]:
+    """Общие настройки пула httpx для LLM: лимиты соединений, keep-alive, таймауты."""
+    return {
+        "limits": httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT),
+    }
+
+
 def _get_openai_client() -> Any:
+    """
+    Общий на процесс клиент OpenAI поверх пула httpx (keep-alive, без TLS-рукопожатия на каждый ответ).
+    Пересоздаётся только при смене API-ключа или базового URL.
+    """
+    global _llm_client, _llm_client_key
     try:
         from openai import OpenAI
     except ImportError:
@@ -74,69 +235,224 @@ def _get_openai_client() -> Any:
             status_code=500,
             detail="Установите пакет openai: pip install openai",
         )
-    api_key = _get_llm_api_key()
-    if not api_key:
+    client_kw = _llm_client_kwargs()
+    key = (client_kw["api_key"], client_kw.get("base_url"))
+    with _llm_client_lock:
+        if _llm_client is None or _llm_client_key != key:
+            _llm_client = OpenAI(**client_kw, http_client=httpx.Client(**_llm_http_options()))
+            _llm_client_key = key
+        return _llm_client
+
+
+def _get_async_openai_client() -> Any:
+    """Асинхронный двойник _get_openai_client() для стриминговых эндпоинтов."""
+    global _async_llm_client, _async_llm_client_key
+    try:
+        from openai import AsyncOpenAI
+    except ImportError:
         raise HTTPException(
             status_code=500,
-            detail=(
-                "Не задан API-ключ LLM. В файле .env на сервере укажите LLM_API_KEY=sk-... или OPENAI_API_KEY=sk-... "
-                "(без пробелов вокруг =). Затем перезапустите backend: docker compose up -d --force-recreate backend"
-            ),
+            detail="Установите пакет openai: pip install openai",
         )
-    client_kw: dict[str, Any] = {"api_key": api_key}
-    if LLM_API_BASE_URL:
-        client_kw["base_url"] = LLM_API_BASE_URL
-    return OpenAI(**client_kw)
+    client_kw = _llm_client_kwargs()
+    key = (client_kw["api_key"], client_kw.get("base_url"))
+    with _llm_client_lock:
+        if _async_llm_client is None or _async_llm_client_key != key:
+            _async_llm_client = AsyncOpenAI(**client_kw, http_client=httpx.AsyncClient(**_llm_http_options()))
+            _async_llm_client_key = key
+        return _async_llm_client
 
 
-def _call_llm(system_content: str, user_message: str) -> str:
-    """Вызов OpenAI-совместимого Chat API."""
-    client = _get_openai_client()
-    messages = [
-        {"role": "system", "content": system_content},
+def _system_message() -> dict[str, Any]:
+    if LLM_PROMPT_CACHE == "cache_control":
+        return {
+            "role": "system",
+            "content": [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}],
+        }
+    return {"role": "system", "content": SYSTEM_PROMPT}
+
+
+# Один и тот же объект на все запросы: префикс промпта не пересобирается и не меняется ни на байт
+_SYSTEM_MESSAGE = _system_message()
+
+
+def _build_messages(rag_context: str, user_message: str) -> list[dict[str, Any]]:
+    """Статический системный промпт, затем результаты поиска отдельным сообщением, затем вопрос."""
+    return [
+        _SYSTEM_MESSAGE,
+        {"role": LLM_CONTEXT_ROLE, "content": CONTEXT_MESSAGE_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_context)},
         {"role": "user", "content": user_message},
     ]
+
+
+def _stream_usage_enabled() -> bool:
+    if LLM_STREAM_USAGE in ("1", "true", "yes"):
+        return True
+    if LLM_STREAM_USAGE != "auto":
+        return False
+    base_url = _get_llm_base_url()
+    return not base_url or httpx.URL(base_url).host == "api.openai.com"
+
+
+def _completion_kwargs(stream: bool = False) -> dict[str, Any]:
+    global _llm_last_used
+    _llm_last_used = time.monotonic()  # каждый вызов LLM проходит здесь
+    kwargs: dict[str, Any] = {"model": LLM_MODEL}
+    if LLM_PROMPT_CACHE == "key":
+        kwargs["extra_body"] = {"prompt_cache_key": LLM_PROMPT_CACHE_KEY}
+    if stream:
+        kwargs["stream"] = True
+        if _stream_usage_enabled():
+            kwargs["stream_options"] = {"include_usage": True}
+    return kwargs
+
+
+def _record_usage(usage: Any, where: str) -> None:
+    """Логирует токены промпта, из них закэшированные провайдером, и токены ответа."""
+    if usage is None:
+        return
+    prompt = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion = int(getattr(usage, "completion_tokens", 0) or 0)
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = int(getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+    with _llm_usage_lock:
+        _llm_usage["calls"] += 1
+        _llm_usage["prompt_tokens"] += prompt
+        _llm_usage["cached_tokens"] += cached
+        _llm_usage["completion_tokens"] += completion
+    logging.getLogger(__name__).info(
+        "%s: prompt_tokens=%s cached_tokens=%s completion_tokens=%s", where, prompt, cached, completion
+    )
+
+
+def _llm_usage_stats() -> dict[str, Any]:
+    with _llm_usage_lock:
+        out: dict[str, Any] = dict(_llm_usage)
+    out["cached_ratio"] = round(out["cached_tokens"] / out["prompt_tokens"], 3) if out["prompt_tokens"] else 0.0
+    out["prompt_cache"] = LLM_PROMPT_CACHE
+    return out
+
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _llm_connection_idle() -> bool:
+    """Соединения в пуле могли закрыться по keep-alive: LLM давно не вызывался."""
+    return time.monotonic() - _llm_last_used > LLM_HTTP_KEEPALIVE_EXPIRY / 2
+
+
+def _prewarm_llm() -> float | None:
+    """
+    Лёгкий GET /models тем же клиентом: соединение (TCP + TLS) встаёт в пул, пока идёт поиск,
+    и запрос генерации его переиспользует. Без повторов и с коротким таймаутом: 429 или зависший /models
+    не должны стоить больше, чем экономят. Возвращает время (мс) или None, если прогрев не нужен.
+    """
+    global _llm_last_used
+    if not LLM_PREWARM or not _llm_connection_idle():
+        return None
+    _llm_last_used = time.monotonic()
+    t0 = time.perf_counter()
+    try:
+        _get_openai_client().with_options(max_retries=0, timeout=LLM_PREWARM_TIMEOUT_SEC).models.list()
+    except Exception as e:  # 404/401 тоже открывают соединение; важен только сам коннект
+        logging.getLogger(__name__).debug("llm prewarm: %s", e)
+    return round((time.perf_counter() - t0) * 1000.0, 2)
+
+
+async def _aprewarm_llm() -> float | None:
+    """Асинхронный _prewarm_llm() для стриминговых эндпоинтов."""
+    global _llm_last_used
+    if not LLM_PREWARM or not _llm_connection_idle():
+        return None
+    _llm_last_used = time.monotonic()
+    t0 = time.perf_counter()
+    try:
+        await _get_async_openai_client().with_options(max_retries=0, timeout=LLM_PREWARM_TIMEOUT_SEC).models.list()
+    except Exception as e:
+        logging.getLogger(__name__).debug("llm prewarm: %s", e)
+    return round((time.perf_counter() - t0) * 1000.0, 2)
+
+
+def _record_timings(where: str, timings: dict[str, float]) -> None:
+    """Время стадий запроса (мс) — в лог и в /metrics (pipeline: среднее и максимум по стадиям)."""
+    logging.getLogger(__name__).info(
+        "%s timings_ms: %s", where, " ".join(f"{k}={v:.1f}" for k, v in timings.items())
+    )
+    with _pipeline_lock:
+        for stage, ms in timings.items():
+            agg = _pipeline_stats.setdefault(f"{where}.{stage}", {"count": 0, "sum_ms": 0.0, "max_ms": 0.0})
+            agg["count"] += 1
+            agg["sum_ms"] += ms
+            agg["max_ms"] = max(agg["max_ms"], ms)
+
+
+def _pipeline_metrics() -> dict[str, Any]:
+    with _pipeline_lock:
+        return {
+            name: {"count": int(a["count"]), "avg_ms": round(a["sum_ms"] / a["count"], 2), "max_ms": round(a["max_ms"], 2)}
+            for name, a in _pipeline_stats.items()
+        }
+
+
+def _ms_since(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 2)
+
+
+def _call_llm(rag_context: str, user_message: str) -> str:
+    """Вызов OpenAI-совместимого Chat API."""
+    client = _get_openai_client()
     response = client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=messages,
+        messages=_build_messages(rag_context, user_message),
+        **_completion_kwargs(),
     )
+    _record_usage(getattr(response, "usage", None), "llm")
     choice = response.choices[0] if response.choices else None
     if not choice or not getattr(choice, "message", None):
         raise HTTPException(status_code=502, detail="Пустой ответ от LLM")
     return (choice.message.content or "").strip()
 
 
-def _stream_llm(system_content: str, user_message: str):
-    """Стриминг ответа LLM (SSE: data: {"delta": "..."})."""
-    client = _get_openai_client()
-    messages = [
-        {"role": "system", "content": system_content},
-        {"role": "user", "content": user_message},
-    ]
-    stream = client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=messages,
-        stream=True,
+async def _acall_llm(rag_context: str, user_message: str) -> str:
+    """Асинхронный вызов OpenAI-совместимого Chat API."""
+    client = _get_async_openai_client()
+    response = await client.chat.completions.create(
+        messages=_build_messages(rag_context, user_message),
+        **_completion_kwargs(),
     )
-    for chunk in stream:
+    _record_usage(getattr(response, "usage", None), "llm")
+    choice = response.choices[0] if response.choices else None
+    if not choice or not getattr(choice, "message", None):
+        raise HTTPException(status_code=502, detail="Пустой ответ от LLM")
+    return (choice.message.content or "").strip()
+
+
+async def _astream_llm(rag_context: str, user_message: str, parts: list[str] | None = None) -> AsyncIterator[str]:
+    """Стриминг ответа LLM (SSE: data: {"delta": "..."}). parts — если задан, туда складываются куски текста."""
+    client = _get_async_openai_client()
+    stream = await client.chat.completions.create(
+        messages=_build_messages(rag_context, user_message),
+        **_completion_kwargs(stream=True),
+    )
+    async for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            _record_usage(chunk.usage, "llm stream")
         delta = chunk.choices[0].delta if chunk.choices else None
         if delta and getattr(delta, "content", None):
+            if parts is not None:
+                parts.append(delta.content)
             yield f"data: {json.dumps({'delta': delta.content}, ensure_ascii=False)}\n\n"
 
 
-def _stream_llm_content(system_content: str, user_message: str) -> Iterator[str]:
+def _stream_llm_content(rag_context: str, user_message: str) -> Iterator[str]:
     """Стриминг ответа LLM: по одному куску текста (delta) за раз."""
     client = _get_openai_client()
-    messages = [
-        {"role": "system", "content": system_content},
-        {"role": "user", "content": user_message},
-    ]
     stream = client.chat.completions.create(
-        model=LLM_MODEL,
-        messages=messages,
-        stream=True,
+        messages=_build_messages(rag_context, user_message),
+        **_completion_kwargs(stream=True),
     )
     for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            _record_usage(chunk.usage, "llm stream")
         delta = chunk.choices[0].delta if chunk.choices else None
         if delta and getattr(delta, "content", None):
             yield delta.content
@@ -283,29 +599,20 @@ def _clean_reply(reply: str) -> str:
 # Минимальная и максимальная длина блока при стриминге в Chatwoot (по абзацам/предложениям)
 STREAM_MIN_CHARS = int(os.environ.get("CHATWOOT_STREAM_MIN_CHARS", "120"))
 STREAM_MAX_CHARS = int(os.environ.get("CHATWOOT_STREAM_MAX_CHARS", "450"))
-
-
-def _split_block(buffer: str, min_chars: int, max_chars: int) -> tuple[str, str]:
-    """
-    Отрезает от buffer один блок: по границе абзаца (\\n\\n) или предложения (. ),
-    не меньше min_chars и не больше max_chars. Возвращает (block, remainder).
-    """
-    if len(buffer) < min_chars:
-        return "", buffer
-    # Ищем последнюю «хорошую» границу в пределах [min_chars, min(max_chars, len(buffer))]
-    end = min(max_chars + 1, len(buffer))
-    search = buffer[min_chars:end]
-    for sep, shift in (("\n\n", 2), (". ", 2), (".\n", 2), (" ", 1)):
-        idx = search.rfind(sep)
-        if idx >= 0:
-            cut = min_chars + idx + shift
-            return buffer[:cut].strip(), buffer[cut:].lstrip()
-    # Нет границы — режем по max_chars по последнему пробелу
-    chunk = buffer[: max_chars + 1]
-    last_space = chunk.rfind(" ")
-    if last_space >= min_chars:
-        return buffer[:last_space].strip(), buffer[last_space:].lstrip()
-    return buffer[:max_chars].strip(), buffer[max_chars:].lstrip()
+# Блок копится дольше N сек — отправить по ближайшей границе предложения, даже если короче MIN_CHARS (0 — выкл.)
+STREAM_MAX_WAIT_SEC = float(os.environ.get("CHATWOOT_STREAM_MAX_WAIT_SEC", "2.5"))
+# Как часто проверять дедлайн, пока LLM молчит
+_STREAM_TICK_SEC = 0.1
+
+
+def _rag_context(message: str, hits: list[SearchHit]) -> str:
+    """Контекст для промпта из хитов (rag.context): склейка перекрытий, без дублей, в бюджете токенов."""
+    built = build_context(message, hits)
+    logging.getLogger(__name__).info(
+        "rag context: hits=%s passages=%s merged=%s deduped=%s dropped=%s tokens=%s saved_tokens=%s",
+        len(hits), len(built.passages), built.merged, built.deduped, built.dropped, built.tokens, built.saved_tokens,
+    )
+    return built.text
 
 
 def stream_rag_reply(message: str) -> Iterator[str]:
@@ -316,37 +623,60 @@ def stream_rag_reply(message: str) -> Iterator[str]:
     message = (message or "").strip()
     if not message:
         return
+    log = logging.getLogger(__name__)
+    cached = _cache_get(message)
+    if cached is not None:
+        log.info("stream_rag_reply: answer cache hit query_len=%s", len(message))
+        yield from split_reply(cached, STREAM_MIN_CHARS, STREAM_MAX_CHARS)
+        return
     t0 = time.perf_counter()
-    rag_text = rag_search(message)
+    timings: dict[str, float] = {}
+    # Соединение с LLM открывается параллельно с поиском и ре-ранжированием
+    prewarm = threading.Thread(target=_prewarm_llm, name="llm-prewarm", daemon=True)
+    prewarm.start()
+    hits = rag_search_hits(message, timings=timings)
+    t1 = time.perf_counter()
+    rag_text = _rag_context(message, hits)
+    timings["context"] = _ms_since(t1)
     rag_sec = time.perf_counter() - t0
-    log = logging.getLogger(__name__)
     log.info(
-        "stream_rag_reply: query_len=%s rag_len=%s rag_sec=%.2f",
-        len(message), len(rag_text or ""), rag_sec,
+        "stream_rag_reply: query_len=%s hits=%s rag_len=%s rag_sec=%.2f",
+        len(message), len(hits), len(rag_text), rag_sec,
     )
-    system_content = SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text)
-    buffer = ""
-    sources_start = False
-    min_c, max_c = STREAM_MIN_CHARS, STREAM_MAX_CHARS
+    t1 = time.perf_counter()
+    # Не успел — генерация откроет своё соединение, прогрев доработает в фоне
+    prewarm.join(timeout=LLM_PREWARM_WAIT_SEC)
+    timings["llm_connect_wait"] = _ms_since(t1)
+    segmenter = StreamSegmenter(STREAM_MIN_CHARS, STREAM_MAX_CHARS, max_wait_sec=STREAM_MAX_WAIT_SEC)
+    deltas = _stream_llm_content(rag_text, message)
     try:
-        for delta in _stream_llm_content(system_content, message):
-            buffer += delta
-            if "Источники:" in buffer or "Источник:" in buffer:
-                sources_start = True
-            if sources_start:
-                continue
-            while len(buffer) >= min_c:
-                block, buffer = _split_block(buffer, min_c, max_c)
-                if block:
-                    yield block
-        if buffer.strip():
-            yield _clean_reply(buffer.strip()) if ("Источники:" in buffer or "Источник:" in buffer) else buffer.strip()
+        if segmenter.max_wait_sec is None:
+            for delta in deltas:
+                if "ttft" not in timings:
+                    timings["ttft"] = _ms_since(t0)
+                yield from segmenter.feed(delta)
+        else:
+            # Дедлайн проверяется и без новых дельт: LLM может надолго замолчать посреди предложения
+            for delta in with_ticks(deltas, min(_STREAM_TICK_SEC, segmenter.max_wait_sec)):
+                if delta is None:
+                    yield from segmenter.poll()
+                    continue
+                if "ttft" not in timings:
+                    timings["ttft"] = _ms_since(t0)
+                yield from segmenter.feed(delta)
+        for block in segmenter.finish():
+            yield _clean_reply(block) if segmenter.sources_started else block
+        _cache_put(message, _clean_reply(segmenter.text().strip()))
     except Exception as e:
         log.exception("stream_rag_reply failed: %s", e)
-        if buffer.strip():
-            yield buffer.strip()
+        yield from segmenter.finish()
     finally:
-        log.info("stream_rag_reply: llm stream done total_sec=%.2f", time.perf_counter() - t0)
+        timings["total"] = _ms_since(t0)
+        _record_timings("stream_rag_reply", timings)
+        log.info(
+            "stream_rag_reply: llm stream done total_sec=%.2f time_flushes=%s",
+            time.perf_counter() - t0, segmenter.time_flushes,
+        )
 
 
 def get_rag_reply(message: str) -> str:
@@ -354,53 +684,61 @@ def get_rag_reply(message: str) -> str:
     message = (message or "").strip()
     if not message:
         return ""
+    log = logging.getLogger(__name__)
+    cached = _cache_get(message)
+    if cached is not None:
+        log.info("get_rag_reply: answer cache hit query_len=%s", len(message))
+        return cached
     t0 = time.perf_counter()
-    rag_text = rag_search(message)
+    hits = rag_search_hits(message)
+    rag_text = _rag_context(message, hits)
     rag_sec = time.perf_counter() - t0
-    rag_empty = "ничего не найдено" in (rag_text or "") or len(rag_text or "") < 50
-    log = logging.getLogger(__name__)
     log.info(
-        "get_rag_reply: query_len=%s rag_len=%s rag_has_results=%s rag_sec=%.2f",
-        len(message), len(rag_text or ""), not rag_empty, rag_sec,
+        "get_rag_reply: query_len=%s hits=%s rag_len=%s rag_sec=%.2f",
+        len(message), len(hits), len(rag_text), rag_sec,
     )
-    system_content = SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text)
     t1 = time.perf_counter()
     try:
-        reply = _call_llm(system_content, message)
+        reply = _call_llm(rag_text, message)
     except Exception:
         return ""
     llm_sec = time.perf_counter() - t1
     log.info("get_rag_reply: llm_sec=%.2f total_sec=%.2f", llm_sec, time.perf_counter() - t0)
-    return _clean_reply(reply)
+    reply = _clean_reply(reply)
+    _cache_put(message, reply)
+    return reply
 
 
 @app.post("/chat", response_model=ChatResponse)
-def chat(request: ChatRequest) -> ChatResponse:
+async def chat(request: ChatRequest) -> ChatResponse:
     message = (request.message or "").strip()
     if not message:
         raise HTTPException(status_code=400, detail="Укажите message")
     backend = (request.backend or "qdrant").strip().lower()
     if backend == "algolia":
         try:
-            reply = _algolia_reply(message)
+            reply = await run_in_threadpool(_algolia_reply, message)
         except HTTPException:
             raise
         except Exception as e:
             raise HTTPException(status_code=502, detail=f"Algolia: {e}")
         reply = _clean_reply(reply)
         return ChatResponse(reply=reply)
-    rag_text = rag_search(message)
-    system_content = SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text)
+    cached = await run_in_threadpool(_cache_get, message)
+    if cached is not None:
+        return ChatResponse(reply=cached)
+    rag_text = _rag_context(message, await rag_asearch_hits(message))
     try:
-        reply = _call_llm(system_content, message)
+        reply = await _acall_llm(rag_text, message)
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Ошибка вызова LLM: {e}")
     reply = _clean_reply(reply)
+    await run_in_threadpool(_cache_put, message, reply)
     return ChatResponse(reply=reply)
 
 
 @app.post("/chat/stream")
-def chat_stream(request: ChatRequest) -> StreamingResponse:
+async def chat_stream(request: ChatRequest) -> StreamingResponse:
     """Стриминг ответа (SSE). Для плавного появления текста в чате."""
     message = (request.message or "").strip()
     if not message:
@@ -414,18 +752,48 @@ def chat_stream(request: ChatRequest) -> StreamingResponse:
             detail="Algolia Agent не настроен. Задайте ALGOLIA_APPLICATION_ID и ALGOLIA_API_KEY в .env на сервере.",
         )
 
-    def generate() -> Any:
+    async def generate() -> Any:
         try:
             if backend == "algolia":
-                for chunk in _algolia_stream(message):
+                async for chunk in iterate_in_threadpool(_algolia_stream(message)):
                     yield chunk
             else:
-                rag_text = rag_search(message)
-                for chunk in _stream_llm(
-                    SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text),
+                t0 = time.perf_counter()
+                timings: dict[str, float] = {}
+                # Соединение с LLM открывается параллельно с кэшем, поиском и ре-ранжированием
+                prewarm = asyncio.create_task(_aprewarm_llm())
+                _background_tasks.add(prewarm)  # прогрев может пережить запрос — держим ссылку до конца
+                prewarm.add_done_callback(_background_tasks.discard)
+                cached = await run_in_threadpool(_cache_get, message)
+                timings["cache"] = _ms_since(t0)
+                if cached is not None:
+                    prewarm.cancel()
+                    for chunk in _replay_sse(cached):
+                        yield chunk
+                    return
+                hits = await rag_asearch_hits(message, timings=timings)
+                t1 = time.perf_counter()
+                rag_text = _rag_context(message, hits)
+                timings["context"] = _ms_since(t1)
+                t1 = time.perf_counter()
+                # shield: по таймауту ожидания прогрев не отменяется, а дорабатывает в фоне
+                try:
+                    await asyncio.wait_for(asyncio.shield(prewarm), LLM_PREWARM_WAIT_SEC)
+                except asyncio.TimeoutError:
+                    pass
+                timings["llm_connect_wait"] = _ms_since(t1)
+                parts: list[str] = []
+                async for chunk in _astream_llm(
+                    rag_text,
                     message,
+                    parts,
                 ):
+                    if "ttft" not in timings:
+                        timings["ttft"] = _ms_since(t0)
                     yield chunk
+                timings["total"] = _ms_since(t0)
+                _record_timings("chat_stream", timings)
+                await run_in_threadpool(_cache_put, message, _clean_reply("".join(parts).strip()))
         except HTTPException as e:
             yield f"data: {json.dumps({'error': e.detail or str(e)}, ensure_ascii=False)}\n\n"
         except Exception as e:
@@ -447,11 +815,62 @@ except ImportError:
     pass
 
 
+def _job_queue_stats() -> dict[str, Any]:
+    try:
+        from backend.chatwoot_webhook import get_job_queue
+    except ImportError:
+        return {"enabled": False}
+    return get_job_queue().stats()
+
+
+def _chatwoot_stream_stats() -> dict[str, Any]:
+    try:
+        from backend.chatwoot_webhook import stream_stats
+    except ImportError:
+        return {"enabled": False}
+    return stream_stats()
+
+
 @app.get("/health")
 def health() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/ready", response_model=None)
+def ready() -> dict[str, Any] | JSONResponse:
+    """Готовность к трафику: модели загружены и прогреты, Qdrant доступен. До этого — 503."""
+    if not WARMUP_ON_STARTUP:
+        return {"status": "ready", "warmup": False}
+    status = warm_status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming", **status})
+    return {"status": "ready", **status}
+
+
+@app.get("/metrics")
+def metrics() -> dict[str, Any]:
+    """Внутренние метрики процесса (JSON): батчинг эмбеддинга, кэш ответов и т.п."""
+    return {
+        "embedder": embedding_stats(),
+        "cross_encoder": cross_encoder_stats(),
+        "context": context_stats(),
+        "llm": _llm_usage_stats(),
+        "pipeline": _pipeline_metrics(),
+        "answer_cache": _answer_cache.stats() if _answer_cache is not None else {"enabled": False},
+        "chatwoot_poster": get_poster().stats(),
+        "chatwoot_jobs": _job_queue_stats(),
+        "chatwoot_stream": _chatwoot_stream_stats(),
+    }
+
+
+@app.post("/cache/invalidate")
+def cache_invalidate() -> dict[str, str]:
+    """Сбросить кэш ответов (например, сразу после переиндексации)."""
+    if _answer_cache is not None:
+        _answer_cache.invalidate()
+    return {"status": "ok"}
+
+
 _STATIC_DIR = Path(__file__).resolve().parent / "static"
 
 
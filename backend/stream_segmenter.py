@@ -0,0 +1,245 @@
+"""
+Инкрементальная нарезка потока LLM (дельт) на блоки для постинга в Chatwoot.
+
+Каждая дельта просматривается один раз: границы абзацев, предложений/строк и пробелов запоминаются
+позициями в текущем (ещё не отправленном) блоке, маркер «Источники:» ищется только в новой дельте
+с хвостом предыдущей. Буфер не пересобирается на каждую дельту — строка склеивается только в момент
+отрезания блока, а он не длиннее max_chars, так что работа на дельту амортизированно O(1).
+
+Политики отправки блока:
+- граница: набралось min_chars и есть граница абзаца или предложения в [min_chars, max_chars];
+- размер: набралось max_chars — режем по лучшей границе до max_chars (в крайнем случае по пробелу или жёстко);
+- время (max_wait_sec): блок копится дольше max_wait_sec — отправляем по ближайшей границе абзаца/предложения,
+  даже если он короче min_chars (проверка в feed() и в poll() — для вызова по таймеру без новых дельт).
+После маркера источников блоки не отправляются: хвост ответа целиком отдаёт finish().
+
+with_ticks() превращает поток дельт в поток с None на каждые interval секунд тишины — по ним вызывается poll().
+"""
+from __future__ import annotations
+
+import bisect
+import queue
+import re
+import threading
+import time
+from typing import Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+SOURCES_MARKERS = ("Источники:", "Источник:")
+
+# Ранги границ: чем выше, тем лучше место для разреза
+_PARAGRAPH, _SENTENCE, _SPACE = 3, 2, 1
+_BOUNDARY_RE = re.compile(r"([.!?…]?\n\n)|([.!?…][ \n]|\n)|( )")
+
+
+class StreamSegmenter:
+    """Нарезка дельт на блоки: feed() — по мере поступления, poll() — по таймеру, finish() — хвост."""
+
+    def __init__(
+        self,
+        min_chars: int,
+        max_chars: int,
+        max_wait_sec: float | None = None,
+        markers: Iterable[str] = SOURCES_MARKERS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.min_chars = max(1, min_chars)
+        self.max_chars = max(self.min_chars, max_chars)
+        self.max_wait_sec = max_wait_sec if max_wait_sec and max_wait_sec > 0 else None
+        self._markers = tuple(markers)
+        self._marker_carry = max((len(m) for m in self._markers), default=1) - 1
+        self._clock = clock
+        self._parts: list[str] = []  # весь ответ — для кэша
+        self._pending: list[str] = []  # текущий блок
+        self._pending_len = 0
+        self._pending_since: float | None = None
+        self._bounds: dict[int, list[int]] = {_PARAGRAPH: [], _SENTENCE: [], _SPACE: []}
+        self._last_char = ""
+        self._tail = ""  # хвост потока для поиска маркера на стыке дельт
+        self.sources_started = False
+        self.time_flushes = 0  # блоков, отправленных по max_wait_sec раньше min_chars
+
+    @property
+    def pending_chars(self) -> int:
+        return self._pending_len
+
+    def text(self) -> str:
+        """Весь полученный текст ответа."""
+        return "".join(self._parts)
+
+    def feed(self, delta: str) -> list[str]:
+        """Добавить дельту; вернуть блоки, готовые к отправке (обычно 0 или 1)."""
+        if not delta:
+            return []
+        self._parts.append(delta)
+        if self.sources_started:
+            self._append(delta)
+            return []
+        window = self._tail + delta
+        self._tail = window[-self._marker_carry :] if self._marker_carry else ""
+        found = [i for i in (window.find(m) for m in self._markers) if i >= 0]
+        if not found:
+            self._append(delta)
+            return self._drain()
+        # Текст до маркера ещё режется на блоки, начиная с маркера — копится до finish()
+        split = max(0, min(found) - (len(window) - len(delta)))
+        self._append(delta[:split])
+        blocks = self._drain()
+        self.sources_started = True
+        self._append(delta[split:])
+        return blocks
+
+    def poll(self, now: float | None = None) -> list[str]:
+        """Проверка по времени без новых дельт: блок, если max_wait_sec истёк и есть хорошая граница."""
+        if self.sources_started or not self._pending_len:
+            return []
+        block = self._next_block(self._clock() if now is None else now)
+        return [block] if block else []
+
+    def finish(self) -> list[str]:
+        """Остаток ответа одним блоком (вместе с источниками, если они начались)."""
+        rest = "".join(self._pending).strip()
+        self._reset_pending("")
+        return [rest] if rest else []
+
+    def _append(self, text: str) -> None:
+        if not text:
+            return
+        if self._pending_since is None:
+            self._pending_since = self._clock()
+        self._scan(text)
+        self._pending.append(text)
+        self._pending_len += len(text)
+        self._last_char = text[-1]
+
+    def _drain(self) -> list[str]:
+        blocks: list[str] = []
+        now = self._clock()
+        while True:
+            block = self._next_block(now)
+            if not block:
+                return blocks
+            blocks.append(block)
+
+    def _scan(self, delta: str) -> None:
+        # Последний символ предыдущей дельты — для разделителей из двух символов на стыке
+        base = self._pending_len - len(self._last_char)
+        window = self._last_char + delta
+        for m in _BOUNDARY_RE.finditer(window):
+            if m.end() <= len(self._last_char):
+                continue
+            pos = base + m.end()
+            if pos <= 0:
+                continue
+            rank = _PARAGRAPH if m.group(1) else _SENTENCE if m.group(2) else _SPACE
+            bounds = self._bounds[rank]
+            if not bounds or bounds[-1] < pos:
+                bounds.append(pos)
+
+    def _last_bound(self, lo: int, hi: int, min_rank: int) -> int | None:
+        """Последняя граница в [lo, hi] с наибольшим рангом не ниже min_rank."""
+        for rank in (_PARAGRAPH, _SENTENCE, _SPACE):
+            if rank < min_rank:
+                break
+            bounds = self._bounds[rank]
+            i = bisect.bisect_right(bounds, hi) - 1
+            if i >= 0 and bounds[i] >= lo:
+                return bounds[i]
+        return None
+
+    def _next_block(self, now: float) -> str:
+        n = self._pending_len
+        if not n:
+            return ""
+        cut: int | None = None
+        if n >= self.min_chars:
+            cut = self._last_bound(self.min_chars, min(n, self.max_chars), _SENTENCE)
+        if cut is None and n > self.max_chars:
+            cut = self._last_bound(self.min_chars, self.max_chars, _SPACE) or self.max_chars
+        if (
+            cut is None
+            and self.max_wait_sec is not None
+            and self._pending_since is not None
+            and now - self._pending_since >= self.max_wait_sec
+        ):
+            cut = self._last_bound(1, min(n, self.max_chars), _SENTENCE)
+            if cut is not None:
+                self.time_flushes += 1
+        if cut is None:
+            return ""
+        return self._cut(cut)
+
+    def _cut(self, cut: int) -> str:
+        buffer = "".join(self._pending)
+        block, rest = buffer[:cut].strip(), buffer[cut:]
+        self._reset_pending(rest.lstrip())
+        # Границы остатка (после отрезанного и ведущих пробелов) сдвигаются к началу
+        shift = len(buffer) - self._pending_len
+        for rank, bounds in self._bounds.items():
+            self._bounds[rank] = [p - shift for p in bounds if p - shift > 0]
+        return block
+
+    def _reset_pending(self, rest: str) -> None:
+        self._pending = [rest] if rest else []
+        self._pending_len = len(rest)
+        self._pending_since = self._clock() if rest else None
+        if not rest:
+            for bounds in self._bounds.values():
+                bounds.clear()
+
+
+def split_reply(reply: str, min_chars: int, max_chars: int) -> list[str]:
+    """Готовый ответ → блоки так же, как при стриминге (для повтора из кэша)."""
+    seg = StreamSegmenter(min_chars, max_chars)
+    return seg.feed(reply) + seg.finish()
+
+
+_END = object()
+
+
+class _Raised:
+    __slots__ = ("error",)
+
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+def with_ticks(source: Iterator[T], interval: float) -> Iterator[T | None]:
+    """
+    Элементы source по мере поступления и None, если за interval секунд нового элемента не было.
+    source читается в отдельном потоке; закрытие генератора (break у потребителя) останавливает чтение
+    на следующем элементе. Исключение source пробрасывается потребителю.
+    """
+    q: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    def pump() -> None:
+        try:
+            for item in source:
+                if stop.is_set():
+                    break
+                q.put(item)
+        except BaseException as e:  # noqa: BLE001 — отдаём потребителю
+            q.put(_Raised(e))
+        finally:
+            close = getattr(source, "close", None)
+            if close is not None:
+                close()
+            q.put(_END)
+
+    threading.Thread(target=pump, name="stream-ticks", daemon=True).start()
+    try:
+        while True:
+            try:
+                item = q.get(timeout=interval)
+            except queue.Empty:
+                yield None
+                continue
+            if item is _END:
+                return
+            if isinstance(item, _Raised):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,123 @@
+"""
+Tests for AnswerCache: exact and semantic hits, TTL, LRU eviction, invalidation by index generation.
+"""
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import pytest
+
+from backend.answer_cache import AnswerCache, normalize_query
+
+# Игрушечные «эмбеддинги»: близкие формулировки — близкие векторы
+_VECTORS = {
+    "как добавить видео в плейлист": [1.0, 0.0, 0.0],
+    "как добавить видео в плейлист?": [1.0, 0.0, 0.0],
+    "как мне добавить видео в плейлист": [0.99, 0.1, 0.0],
+    "как добавить ролик в плейлист": [0.99, 0.1, 0.0],
+    "как удалить проект": [0.0, 1.0, 0.0],
+}
+
+
+def _embed(text: str) -> list[float]:
+    return _VECTORS.get(text.strip().lower(), [0.0, 0.0, 1.0])
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("  Как добавить  видео?  ", "как добавить видео"),
+        ("Ёлка", "елка"),
+        ("«Плейлист»", "плейлист"),
+        ("", ""),
+    ],
+)
+def test_normalize_query(text: str, expected: str) -> None:
+    assert normalize_query(text) == expected
+
+
+def test_exact_hit_after_normalization() -> None:
+    cache = AnswerCache(embed_fn=None)
+    cache.put("Как добавить видео в плейлист", "Ответ")
+    assert cache.get("  как ДОБАВИТЬ видео в плейлист? ") == "Ответ"
+    assert cache.stats()["hits_exact"] == 1
+
+
+def test_semantic_hit_above_threshold() -> None:
+    cache = AnswerCache(embed_fn=_embed, similarity_threshold=0.95)
+    cache.put("Как добавить видео в плейлист", "Ответ про плейлист")
+    assert cache.get("Как мне добавить видео в плейлист") == "Ответ про плейлист"
+    assert cache.get("Как удалить проект") is None
+    stats = cache.stats()
+    assert stats["hits_semantic"] == 1
+    assert stats["misses"] == 1
+
+
+def test_semantic_tier_embeds_the_text_search_embeds() -> None:
+    """Вектор запроса тот же, что у поиска (embed_query кэширует его) — промах кэша не стоит второго эмбеддинга."""
+    embedded: list[str] = []
+    cache = AnswerCache(embed_fn=lambda text: embedded.append(text) or _embed(text))
+    cache.put("Как удалить проект", "ответ")
+    assert cache.get("  Как добавить видео в плейлист? ") is None
+    assert embedded == ["Как удалить проект", "  Как добавить видео в плейлист? "]
+
+
+def test_semantic_disabled_by_threshold() -> None:
+    cache = AnswerCache(embed_fn=_embed, similarity_threshold=0.0)
+    cache.put("Как добавить видео в плейлист", "Ответ")
+    assert cache.get("Как мне добавить видео в плейлист") is None
+
+
+def test_ttl_expiry() -> None:
+    cache = AnswerCache(embed_fn=None, ttl_sec=10)
+    with patch("backend.answer_cache.time.monotonic", return_value=100.0):
+        cache.put("вопрос", "ответ")
+    with patch("backend.answer_cache.time.monotonic", return_value=105.0):
+        assert cache.get("вопрос") == "ответ"
+    with patch("backend.answer_cache.time.monotonic", return_value=111.0):
+        assert cache.get("вопрос") is None
+
+
+def test_expired_nearest_does_not_hide_valid_semantic_hit() -> None:
+    cache = AnswerCache(embed_fn=_embed, ttl_sec=10, similarity_threshold=0.95)
+    with patch("backend.answer_cache.time.monotonic", return_value=100.0):
+        cache.put("Как мне добавить видео в плейлист", "устаревший ответ")
+    with patch("backend.answer_cache.time.monotonic", return_value=108.0):
+        cache.put("Как добавить видео в плейлист", "свежий ответ")
+    with patch("backend.answer_cache.time.monotonic", return_value=112.0):
+        # Ближайший (тот же вектор) просрочен; живой сосед тоже выше порога
+        assert cache.get("Как добавить ролик в плейлист") == "свежий ответ"
+
+
+def test_lru_eviction() -> None:
+    cache = AnswerCache(embed_fn=None, max_size=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_empty_reply_not_cached() -> None:
+    cache = AnswerCache(embed_fn=None)
+    cache.put("вопрос", "  ")
+    assert cache.get("вопрос") is None
+
+
+def test_invalidated_when_generation_changes() -> None:
+    generation = {"value": 1}
+    cache = AnswerCache(embed_fn=None, generation_fn=lambda: generation["value"], generation_check_sec=0)
+    cache.put("вопрос", "ответ")
+    assert cache.get("вопрос") == "ответ"
+    generation["value"] = 2
+    assert cache.get("вопрос") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_explicit_invalidate() -> None:
+    cache = AnswerCache(embed_fn=_embed)
+    cache.put("как удалить проект", "ответ")
+    cache.invalidate()
+    assert cache.get("как удалить проект") is None
@@ -0,0 +1,183 @@
+"""
+Tests for Chatwoot client: retries on 429/5xx, ordered posting pipeline and typing indicator.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from unittest.mock import patch
+
+import httpx
+
+from backend import chatwoot_client
+from backend.chatwoot_client import MessagePoster, post_message
+
+
+def _configured():
+    return patch.multiple(
+        chatwoot_client,
+        CHATWOOT_BASE_URL="https://chatwoot.example",
+        CHATWOOT_ACCOUNT_ID="1",
+        CHATWOOT_API_ACCESS_TOKEN="token",
+    )
+
+
+def _mock_client(statuses: list[int], calls: list[httpx.Request]) -> httpx.Client:
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        return httpx.Response(status, json={"id": len(calls)})
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_post_message_retries_429_then_succeeds() -> None:
+    calls: list[httpx.Request] = []
+    client = _mock_client([429, 503, 200], calls)
+    with _configured(), patch.object(chatwoot_client, "_get_client", return_value=client), patch(
+        "backend.chatwoot_client.time.sleep"
+    ) as mock_sleep:
+        result = post_message(7, "hello")
+    assert result == {"id": 3}
+    assert len(calls) == 3
+    assert mock_sleep.call_count == 2
+    assert calls[0].headers["api_access_token"] == "token"
+    assert calls[0].url.path == "/api/v1/accounts/1/conversations/7/messages"
+
+
+def test_post_message_gives_up_after_retries() -> None:
+    calls: list[httpx.Request] = []
+    client = _mock_client([500], calls)
+    with _configured(), patch.object(chatwoot_client, "_get_client", return_value=client), patch.object(
+        chatwoot_client, "CHATWOOT_POST_RETRIES", 2
+    ), patch("backend.chatwoot_client.time.sleep"):
+        assert post_message(7, "hello") is None
+    assert len(calls) == 3
+
+
+def test_post_message_does_not_retry_4xx() -> None:
+    calls: list[httpx.Request] = []
+    client = _mock_client([404], calls)
+    with _configured(), patch.object(chatwoot_client, "_get_client", return_value=client), patch(
+        "backend.chatwoot_client.time.sleep"
+    ) as mock_sleep:
+        assert post_message(7, "hello") is None
+    assert len(calls) == 1
+    mock_sleep.assert_not_called()
+
+
+def _raising_client(exc: httpx.TransportError, calls: list[httpx.Request]) -> httpx.Client:
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            raise exc
+        return httpx.Response(200, json={"id": len(calls)})
+
+    return httpx.Client(transport=httpx.MockTransport(handler))
+
+
+def test_post_message_retries_when_request_was_not_sent() -> None:
+    calls: list[httpx.Request] = []
+    client = _raising_client(httpx.ConnectError("refused"), calls)
+    with _configured(), patch.object(chatwoot_client, "_get_client", return_value=client), patch(
+        "backend.chatwoot_client.time.sleep"
+    ):
+        assert post_message(7, "hello") == {"id": 2}
+    assert len(calls) == 2
+
+
+def test_post_message_does_not_resend_after_read_timeout() -> None:
+    """Ответ не дочитан — сообщение могло быть создано; повтор дал бы клиенту дубль."""
+    calls: list[httpx.Request] = []
+    client = _raising_client(httpx.ReadTimeout("slow"), calls)
+    with _configured(), patch.object(chatwoot_client, "_get_client", return_value=client), patch(
+        "backend.chatwoot_client.time.sleep"
+    ):
+        assert post_message(7, "hello") is None
+    assert len(calls) == 1
+
+
+def test_retry_delay_honours_retry_after() -> None:
+    response = httpx.Response(429, headers={"Retry-After": "2"})
+    assert chatwoot_client._retry_delay(0, response) == 2.0
+    assert 0 <= chatwoot_client._retry_delay(3) <= chatwoot_client.CHATWOOT_POST_BACKOFF_MAX
+
+
+def test_poster_keeps_order_within_conversation() -> None:
+    posted: dict[int, list[str]] = {}
+    lock = threading.Lock()
+
+    def fake_post(cid: int, content: str, **kw) -> dict:
+        time.sleep(0.001)
+        with lock:
+            posted.setdefault(cid, []).append(content)
+        return {"id": 1}
+
+    poster = MessagePoster(workers=3, queue_size=300, post_fn=fake_post)
+    futures = []
+    for i in range(20):
+        for cid in (1, 2, 3, 4):
+            futures.append(poster.submit(cid, f"{cid}-{i}"))
+    for f in futures:
+        assert f.result(timeout=5) == {"id": 1}
+    poster.close()
+    for cid in (1, 2, 3, 4):
+        assert posted[cid] == [f"{cid}-{i}" for i in range(20)]
+    stats = poster.stats()
+    assert stats["posted"] == 80
+    assert stats["failed"] == 0
+
+
+def test_poster_reports_failed_post() -> None:
+    poster = MessagePoster(workers=1, queue_size=10, post_fn=lambda cid, content, **kw: None)
+    assert poster.submit(5, "x").result(timeout=5) is None
+    poster.close()
+    assert poster.stats()["failed"] == 1
+
+
+def test_toggle_typing_posts_status() -> None:
+    calls: list[httpx.Request] = []
+    client = _mock_client([200], calls)
+    with _configured(), patch.object(chatwoot_client, "_get_client", return_value=client):
+        assert chatwoot_client.toggle_typing(7, True) is True
+    assert calls[0].url.path == "/api/v1/accounts/1/conversations/7/toggle_typing_status"
+    assert calls[0].read() == b'{"typing_status":"on"}'
+
+
+def test_poster_orders_typing_with_messages() -> None:
+    events: list[str] = []
+    poster = MessagePoster(
+        workers=2,
+        queue_size=100,
+        post_fn=lambda cid, content, **kw: events.append(content) or {"id": 1},
+        typing_fn=lambda cid, on, **kw: events.append("on" if on else "off") or True,
+    )
+    futures = [poster.submit_typing(3, True), poster.submit(3, "a"), poster.submit_typing(3, True), poster.submit(3, "b")]
+    futures.append(poster.submit_typing(3, False))
+    for f in futures:
+        f.result(timeout=5)
+    poster.close()
+    assert events == ["on", "a", "on", "b", "off"]
+    stats = poster.stats()
+    assert stats["posted"] == 2
+    assert stats["typing"] == 3
+
+
+def test_typing_toggle_skipped_instead_of_taking_block_capacity() -> None:
+    release = threading.Event()
+    poster = MessagePoster(
+        workers=1,
+        queue_size=4,
+        post_fn=lambda cid, content, **kw: release.wait(5) and {"id": 1},
+        typing_fn=lambda cid, on, **kw: True,
+    )
+    blocks = [poster.submit(3, "a")]
+    time.sleep(0.05)  # воркер занят первым блоком
+    blocks += [poster.submit(3, "b"), poster.submit(3, "c")]
+    assert poster.submit_typing(3, True).result(timeout=1) is False
+    blocks.append(poster.submit(3, "d"))
+    release.set()
+    assert all(f.result(timeout=5) for f in blocks)
+    poster.close()
+    stats = poster.stats()
+    assert stats["rejected"] == 0 and stats["typing_skipped"] == 1
@@ -4,6 +4,7 @@ Tests for Chatwoot webhook: support_mode parsing, webhook acceptance, and reply
 from __future__ import annotations
 
 import os
+import time
 from unittest.mock import patch
 
 import pytest
@@ -18,11 +19,17 @@ from backend.chatwoot_webhook import (
     _normalize_support_mode,
     _strip_html,
     _support_mode,
+    get_job_queue,
     router,
     set_reply_provider,
 )
 
 
+def _drain() -> None:
+    """Webhook jobs run on the job queue workers; wait for them inside the patch context."""
+    assert get_job_queue().join(timeout=5)
+
+
 # --- _normalize_support_mode ---
 
 
@@ -128,6 +135,7 @@ def test_webhook_accepts_message_created_incoming(client: TestClient) -> None:
                 "conversation": {"id": 42, "custom_attributes": {"support_mode": "bot"}},
             },
         )
+        _drain()
     assert r.status_code == 200
     assert r.json() == {"status": "ok"}
 
@@ -155,6 +163,48 @@ def test_webhook_skips_outgoing(client: TestClient) -> None:
     assert r.json() == {"status": "ok"}
 
 
+def test_webhook_skips_duplicate_delivery(client: TestClient) -> None:
+    """Повторная доставка того же message_id (account + bot webhook) обрабатывается один раз."""
+    set_reply_provider(lambda msg: "Reply")
+    body = {
+        "event": "message_created",
+        "message_type": "incoming",
+        "id": 555001,
+        "content": "Как загрузить видео?",
+        "conversation": {"id": 77, "custom_attributes": {"support_mode": "bot"}},
+    }
+    with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+        "backend.chatwoot_webhook.post_message", return_value={"id": 1}
+    ) as mock_post:
+        client.post("/chatwoot/webhook", json=body)
+        client.post("/chatwoot/webhook", json=body)
+        _drain()
+    assert mock_post.call_count == 1
+
+
+def test_webhook_full_queue_does_not_mark_message_seen(client: TestClient) -> None:
+    """503 при переполненной очереди: повторная доставка Chatwoot не отбрасывается как дубль."""
+    set_reply_provider(lambda msg: "Reply")
+    body = {
+        "event": "message_created",
+        "message_type": "incoming",
+        "id": 555002,
+        "content": "Как загрузить видео?",
+        "conversation": {"id": 78, "custom_attributes": {"support_mode": "bot"}},
+    }
+    queue = get_job_queue()
+    with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+        "backend.chatwoot_webhook.post_message", return_value={"id": 1}
+    ) as mock_post:
+        with patch.object(queue, "submit", return_value=False):
+            r = client.post("/chatwoot/webhook", json=body)
+        assert r.status_code == 503
+        r = client.post("/chatwoot/webhook", json=body)
+        _drain()
+    assert r.status_code == 200
+    assert mock_post.call_count == 1
+
+
 def test_webhook_process_posts_bot_reply(client: TestClient) -> None:
     set_reply_provider(lambda msg: f"Echo: {msg}")
     with patch("backend.chatwoot_webhook.is_configured", return_value=True) as mock_cfg, patch(
@@ -169,6 +219,7 @@ def test_webhook_process_posts_bot_reply(client: TestClient) -> None:
                 "conversation": {"id": 99, "custom_attributes": {"support_mode": "bot"}},
             },
         )
+        _drain()
     assert r.status_code == 200
     assert mock_post.call_count == 2
     first_call = mock_post.call_args_list[0]
@@ -245,6 +296,7 @@ def test_webhook_skips_email_only_does_not_post(client: TestClient) -> None:
                 "conversation": {"id": 5, "custom_attributes": {"support_mode": "bot"}},
             },
         )
+        _drain()
     assert r.status_code == 200
     mock_post.assert_not_called()
 
@@ -264,5 +316,59 @@ def test_webhook_skips_system_phrase_does_not_post(client: TestClient) -> None:
                 "conversation": {"id": 5, "custom_attributes": {"support_mode": "bot"}},
             },
         )
+        _drain()
     assert r.status_code == 200
     mock_post.assert_not_called()
+
+
+# --- stream mode ---
+
+
+def test_stream_reply_toggles_typing_and_records_first_block() -> None:
+    from backend import chatwoot_webhook
+    from backend.chatwoot_client import MessagePoster
+
+    events: list[str] = []
+    poster = MessagePoster(
+        workers=1,
+        queue_size=10,
+        post_fn=lambda cid, content, **kw: events.append(content) or {"id": 1},
+        typing_fn=lambda cid, on, **kw: events.append("on" if on else "off") or True,
+    )
+    def slow_blocks(msg: str):
+        yield "Первый блок."
+        time.sleep(0.2)  # пауза дольше STREAM_TYPING_DELAY_SEC — индикатор включается снова
+        yield "Второй блок."
+
+    set_reply_provider(lambda msg: "unused")
+    chatwoot_webhook.set_stream_reply_provider(slow_blocks)
+    before = chatwoot_webhook.stream_stats()
+    payload = WebhookPayload(
+        content="Вопрос", conversation={"id": 5, "custom_attributes": {"support_mode": "bot"}}
+    )
+    try:
+        with patch("backend.chatwoot_webhook.is_configured", return_value=True), patch(
+            "backend.chatwoot_webhook.get_poster", return_value=poster
+        ), patch.multiple(
+            chatwoot_webhook, STREAM_REPLY_ENABLED=True, STREAM_TYPING_INDICATOR=True, STREAM_TYPING_DELAY_SEC=0.05
+        ):
+            chatwoot_webhook._process_message(payload)
+    finally:
+        chatwoot_webhook.set_stream_reply_provider(None)
+        poster.close()
+    # После последнего блока стрим закончился — ни лишнего «on», ни «off»
+    assert events == ["on", "Первый блок.", "on", "Второй блок."]
+    stats = chatwoot_webhook.stream_stats()
+    assert stats["replies"] == before["replies"] + 1
+    assert stats["blocks"] == before["blocks"] + 2
+    assert stats["first_block_ms"]["count"] == before["first_block_ms"]["count"] + 1
+    assert stats["first_block_ms"]["p50"] <= stats["first_block_ms"]["p95"]
+
+
+def test_percentile_nearest_rank() -> None:
+    from backend.chatwoot_webhook import _percentile
+
+    values = [float(v) for v in range(1, 101)]
+    assert _percentile(values, 0.5) == 50.0
+    assert _percentile(values, 0.95) == 95.0
+    assert _percentile([7.0], 0.95) == 7.0
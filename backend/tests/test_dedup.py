@@ -0,0 +1,63 @@
+"""
+Tests for webhook dedup stores: TTL, bounded capacity without clear-all, shared SQLite file.
+"""
+from __future__ import annotations
+
+from pathlib import Path
+from unittest.mock import patch
+
+from backend.dedup import SeenKeys, SQLiteSeenKeys
+
+
+def test_duplicate_detected() -> None:
+    seen = SeenKeys(ttl_sec=60, capacity=100)
+    assert seen.seen_before((1, "10")) is False
+    assert seen.seen_before((1, "10")) is True
+    assert seen.seen_before((1, "11")) is False
+    assert seen.stats()["duplicates"] == 1
+
+
+def test_ttl_expiry() -> None:
+    seen = SeenKeys(ttl_sec=10, capacity=100, shards=1)
+    with patch("backend.dedup.time.monotonic", return_value=100.0):
+        assert seen.seen_before("a") is False
+    with patch("backend.dedup.time.monotonic", return_value=105.0):
+        assert seen.seen_before("a") is True
+    with patch("backend.dedup.time.monotonic", return_value=111.0):
+        assert seen.seen_before("a") is False
+
+
+def test_capacity_evicts_oldest_only() -> None:
+    seen = SeenKeys(ttl_sec=3600, capacity=3, shards=1)
+    for key in ("a", "b", "c", "d"):
+        assert seen.seen_before(key) is False
+    # "a" вытеснен, остальные по-прежнему считаются дубликатами
+    assert seen.seen_before("d") is True
+    assert seen.seen_before("c") is True
+    assert seen.seen_before("a") is False
+    assert seen.stats()["size"] == 3
+
+
+def test_sqlite_shared_between_instances(tmp_path: Path) -> None:
+    path = tmp_path / "seen.sqlite3"
+    worker_a = SQLiteSeenKeys(path, ttl_sec=60, capacity=100)
+    worker_b = SQLiteSeenKeys(path, ttl_sec=60, capacity=100)
+    assert worker_a.seen_before((7, "1")) is False
+    assert worker_b.seen_before((7, "1")) is True
+    assert worker_b.seen_before((7, "2")) is False
+
+
+def test_sqlite_prunes_to_capacity(tmp_path: Path) -> None:
+    seen = SQLiteSeenKeys(tmp_path / "seen.sqlite3", ttl_sec=3600, capacity=5, prune_every=1)
+    for i in range(20):
+        assert seen.seen_before(i) is False
+    assert seen.stats()["size"] == 5
+    assert seen.seen_before(19) is True
+
+
+def test_forget_allows_redelivery(tmp_path: Path) -> None:
+    for seen in (SeenKeys(ttl_sec=60, capacity=100), SQLiteSeenKeys(tmp_path / "seen.sqlite3", ttl_sec=60)):
+        assert seen.seen_before((1, "10")) is False
+        seen.forget((1, "10"))
+        assert seen.seen_before((1, "10")) is False
+        assert seen.seen_before((1, "10")) is True
@@ -0,0 +1,187 @@
+"""
+Tests for the webhook job queue: per-conversation serialization, backpressure, retries, SQLite replay.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+
+from backend.job_queue import Job, JobQueue, MemoryJobStore, SQLiteJobStore
+
+
+def test_jobs_of_one_conversation_run_in_order() -> None:
+    seen: list[int] = []
+    active: dict[int, int] = {}
+    overlaps: list[int] = []
+    lock = threading.Lock()
+
+    def handler(payload: dict) -> None:
+        cid = payload["cid"]
+        with lock:
+            active[cid] = active.get(cid, 0) + 1
+            if active[cid] > 1:
+                overlaps.append(cid)
+        time.sleep(0.002)
+        with lock:
+            active[cid] -= 1
+            if cid == 1:
+                seen.append(payload["n"])
+
+    q = JobQueue(handler, workers=4, max_pending=100)
+    for n in range(10):
+        for cid in (1, 2, 3):
+            assert q.submit({"cid": cid, "n": n}, conversation_id=cid)
+    assert q.join(timeout=5)
+    q.stop()
+    assert seen == list(range(10))
+    assert overlaps == []
+    assert q.stats()["processed"] == 30
+
+
+def test_different_conversations_run_in_parallel() -> None:
+    started = threading.Barrier(2, timeout=5)
+
+    def handler(payload: dict) -> None:
+        started.wait()
+
+    q = JobQueue(handler, workers=2, max_pending=10)
+    q.submit({}, conversation_id=1)
+    q.submit({}, conversation_id=2)
+    assert q.join(timeout=5)
+    q.stop()
+    assert q.stats()["failed"] == 0
+
+
+def test_rejects_when_full() -> None:
+    release = threading.Event()
+    q = JobQueue(lambda payload: release.wait(5), workers=1, max_pending=2)
+    assert q.submit({}, conversation_id=1)
+    assert q.submit({}, conversation_id=1)
+    assert not q.submit({}, conversation_id=1)
+    assert q.stats()["rejected"] == 1
+    release.set()
+    assert q.join(timeout=5)
+    q.stop()
+
+
+def test_handler_error_counted_and_queue_continues() -> None:
+    def handler(payload: dict) -> None:
+        if payload.get("fail"):
+            raise RuntimeError("boom")
+
+    q = JobQueue(handler, workers=1)
+    q.submit({"fail": True}, conversation_id=1)
+    q.submit({}, conversation_id=1)
+    assert q.join(timeout=5)
+    q.stop()
+    stats = q.stats()
+    assert stats["failed"] == 1
+    assert stats["processed"] == 1
+
+
+def test_failed_job_retried_before_next_job_of_conversation() -> None:
+    calls: list[str] = []
+
+    def handler(payload: dict) -> None:
+        calls.append(payload["n"])
+        if payload["n"] == "a" and calls.count("a") == 1:
+            raise RuntimeError("transient")
+
+    q = JobQueue(handler, workers=2, max_attempts=3)
+    q.submit({"n": "a"}, conversation_id=1)
+    q.submit({"n": "b"}, conversation_id=1)
+    assert q.join(timeout=5)
+    q.stop()
+    assert calls == ["a", "a", "b"]
+    stats = q.stats()
+    assert stats["retried"] == 1 and stats["processed"] == 2 and stats["failed"] == 0
+
+
+def test_sqlite_store_replays_unfinished_jobs(tmp_path: Path) -> None:
+    path = tmp_path / "jobs.sqlite3"
+    store = SQLiteJobStore(path, lease_sec=0.01)  # процесс «упал» — аренда истекла
+    store.add(Job(id="a", conversation_id=1, payload={"n": 1}))
+    store.add(Job(id="b", conversation_id=1, payload={"n": 2}))
+    store.add(Job(id="c", conversation_id=2, payload={"n": 3}, attempts=2))
+    store.close()
+    time.sleep(0.05)
+
+    handled: list[int] = []
+    q = JobQueue(lambda payload: handled.append(payload["n"]), store=SQLiteJobStore(path), workers=2, max_attempts=2)
+    q.start()
+    assert q.join(timeout=5)
+    q.stop()
+    assert handled == [1, 2]
+    assert q.stats()["replayed"] == 2
+    assert SQLiteJobStore(path, lease_sec=0.01).claim_expired() == []
+
+
+def test_sqlite_job_leased_by_live_worker_is_not_replayed(tmp_path: Path) -> None:
+    """Два воркера uvicorn на одном файле: задачу соседа, который её держит, второй не запускает."""
+    path = tmp_path / "jobs.sqlite3"
+    release = threading.Event()
+    handled: list[str] = []
+
+    def handler(payload: dict) -> None:
+        handled.append(payload["worker"])
+        release.wait(5)
+
+    first = JobQueue(handler, store=SQLiteJobStore(path, lease_sec=0.3), workers=1)
+    assert first.submit({"worker": "first"}, conversation_id=1)
+    second = JobQueue(handler, store=SQLiteJobStore(path, lease_sec=0.3), workers=1)
+    second.start()
+    time.sleep(0.6)  # дольше аренды: первый её продлевает, второй не забирает
+    release.set()
+    assert first.join(timeout=5) and second.join(timeout=5)
+    first.stop()
+    second.stop()
+    assert handled == ["first"]
+    assert second.stats()["replayed"] == 0
+
+
+def test_sqlite_job_of_dead_worker_is_claimed_by_one_sibling(tmp_path: Path) -> None:
+    path = tmp_path / "jobs.sqlite3"
+    dead = SQLiteJobStore(path, lease_sec=0.1)
+    dead.add(Job(id="a", conversation_id=1, payload={"n": 1}))
+    dead.close()
+    handled: list[int] = []
+    queues = [
+        JobQueue(lambda payload: handled.append(payload["n"]), store=SQLiteJobStore(path, lease_sec=0.1), workers=1)
+        for _ in range(2)
+    ]
+    for q in queues:
+        q.start()
+    deadline = time.monotonic() + 5
+    while not handled and time.monotonic() < deadline:
+        time.sleep(0.02)
+    time.sleep(0.2)
+    for q in queues:
+        assert q.join(timeout=5)
+        q.stop()
+    assert handled == [1]
+
+
+def test_slow_store_write_does_not_hold_queue_lock() -> None:
+    """Запись в хранилище (SQLite INSERT) идёт вне блокировки очереди: stats() и воркеры её не ждут."""
+    entered, release = threading.Event(), threading.Event()
+
+    class SlowStore(MemoryJobStore):
+        def add(self, job: Job) -> None:
+            entered.set()
+            release.wait(5)
+
+    q = JobQueue(lambda payload: None, store=SlowStore(), workers=1, max_pending=1)
+    q.start()
+    submitter = threading.Thread(target=q.submit, args=({},), kwargs={"conversation_id": 1})
+    submitter.start()
+    assert entered.wait(5)
+    stats_done = threading.Event()
+    threading.Thread(target=lambda: (q.stats(), stats_done.set()), daemon=True).start()
+    assert stats_done.wait(1)
+    assert not q.submit({}, conversation_id=2)  # место уже занято записываемой задачей
+    release.set()
+    submitter.join(5)
+    assert q.join(timeout=5)
+    q.stop()
+    assert q.stats()["processed"] == 1
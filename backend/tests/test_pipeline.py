@@ -0,0 +1,85 @@
+"""
+Tests for the pipelined chat path: LLM connection prewarm and per-stage timings.
+"""
+from __future__ import annotations
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from backend import main
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.models = SimpleNamespace(list=self._list)
+        self.calls = 0
+        self.options: dict = {}
+
+    def with_options(self, **options) -> "FakeClient":
+        self.options = options
+        return self
+
+    def _list(self) -> None:
+        self.calls += 1
+        raise RuntimeError("404 from a provider without /models")
+
+
+def test_prewarm_only_when_connection_may_be_idle(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = FakeClient()
+    monkeypatch.setattr(main, "_get_openai_client", lambda: client)
+    monkeypatch.setattr(main, "LLM_PREWARM", True)
+    monkeypatch.setattr(main, "_llm_last_used", 0.0)
+    assert main._prewarm_llm() is not None  # ошибка ответа не мешает: соединение уже открыто
+    assert client.calls == 1
+    assert client.options == {"max_retries": 0, "timeout": main.LLM_PREWARM_TIMEOUT_SEC}
+    # Сразу после вызова соединение в пуле живое — второй прогрев не нужен
+    assert main._prewarm_llm() is None
+    assert client.calls == 1
+    monkeypatch.setattr(main, "_llm_last_used", time.monotonic() - main.LLM_HTTP_KEEPALIVE_EXPIRY)
+    monkeypatch.setattr(main, "LLM_PREWARM", False)
+    assert main._prewarm_llm() is None
+
+
+def test_record_timings_aggregates_per_stage(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main, "_pipeline_stats", {})
+    main._record_timings("chat_stream", {"embed": 4.0, "qdrant": 10.0, "ttft": 300.0})
+    main._record_timings("chat_stream", {"embed": 2.0, "qdrant": 20.0, "ttft": 100.0})
+    metrics = main._pipeline_metrics()
+    assert metrics["chat_stream.qdrant"] == {"count": 2, "avg_ms": 15.0, "max_ms": 20.0}
+    assert metrics["chat_stream.ttft"]["avg_ms"] == 200.0
+
+
+def test_stream_rag_reply_flushes_on_deadline_while_llm_is_silent(monkeypatch: pytest.MonkeyPatch) -> None:
+    def slow_llm(rag_context: str, message: str):
+        yield "Короткий ответ. Дал"
+        time.sleep(0.4)
+        yield "ьше. "
+
+    monkeypatch.setattr(main, "_cache_get", lambda message: None)
+    monkeypatch.setattr(main, "_cache_put", lambda message, reply: None)
+    monkeypatch.setattr(main, "rag_search_hits", lambda message, timings=None: [])
+    monkeypatch.setattr(main, "_rag_context", lambda message, hits: "")
+    monkeypatch.setattr(main, "_prewarm_llm", lambda: None)
+    monkeypatch.setattr(main, "_stream_llm_content", slow_llm)
+    monkeypatch.setattr(main, "STREAM_MIN_CHARS", 200)
+    monkeypatch.setattr(main, "STREAM_MAX_WAIT_SEC", 0.1)
+    t0 = time.perf_counter()
+    stream = main.stream_rag_reply("вопрос")
+    assert next(stream) == "Короткий ответ."
+    assert time.perf_counter() - t0 < 0.35  # не дожидаясь следующей дельты
+    assert list(stream) == ["Дальше."]
+
+
+def test_stream_rag_reply_does_not_wait_for_slow_prewarm(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main, "_cache_get", lambda message: None)
+    monkeypatch.setattr(main, "_cache_put", lambda message, reply: None)
+    monkeypatch.setattr(main, "rag_search_hits", lambda message, timings=None: [])
+    monkeypatch.setattr(main, "_rag_context", lambda message, hits: "")
+    monkeypatch.setattr(main, "_prewarm_llm", lambda: time.sleep(1.0))
+    monkeypatch.setattr(main, "_stream_llm_content", lambda rag_context, message: iter(["Ответ готов. "]))
+    monkeypatch.setattr(main, "LLM_PREWARM_WAIT_SEC", 0.05)
+    t0 = time.perf_counter()
+    assert list(main.stream_rag_reply("вопрос")) == ["Ответ готов."]
+    assert time.perf_counter() - t0 < 0.5
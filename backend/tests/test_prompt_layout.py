@@ -0,0 +1,58 @@
+"""
+Tests for LLM message assembly: static cacheable system prefix, trailing context message, usage logging.
+"""
+from __future__ import annotations
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from backend import main
+from backend.prompts import SYSTEM_PROMPT
+
+
+def test_static_prefix_is_identical_across_requests() -> None:
+    a = main._build_messages("контекст А", "вопрос 1")
+    b = main._build_messages("совсем другой контекст", "вопрос 2")
+    assert json.dumps(a[0], ensure_ascii=False) == json.dumps(b[0], ensure_ascii=False)
+    assert a[0]["content"] == SYSTEM_PROMPT
+    assert "{{RAG_CONTEXT}}" not in SYSTEM_PROMPT
+    assert a[1]["content"].endswith("контекст А\n")
+    assert a[2] == {"role": "user", "content": "вопрос 1"}
+
+
+def test_stream_usage_auto_only_for_openai(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main, "LLM_STREAM_USAGE", "auto")
+    monkeypatch.delenv("LLM_API_BASE_URL", raising=False)
+    assert "stream_options" in main._completion_kwargs(stream=True)
+    monkeypatch.setenv("LLM_API_BASE_URL", "https://api.openai.com/v1")
+    assert "stream_options" in main._completion_kwargs(stream=True)
+    monkeypatch.setenv("LLM_API_BASE_URL", "https://llm.example.com/v1")
+    assert "stream_options" not in main._completion_kwargs(stream=True)
+    monkeypatch.setattr(main, "LLM_STREAM_USAGE", "true")
+    assert "stream_options" in main._completion_kwargs(stream=True)
+
+
+def test_completion_kwargs_cache_hints(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main, "LLM_PROMPT_CACHE", "none")
+    assert "extra_body" not in main._completion_kwargs()
+    monkeypatch.setattr(main, "LLM_PROMPT_CACHE", "key")
+    assert main._completion_kwargs()["extra_body"] == {"prompt_cache_key": main.LLM_PROMPT_CACHE_KEY}
+    monkeypatch.setattr(main, "LLM_STREAM_USAGE", "true")
+    assert main._completion_kwargs(stream=True)["stream_options"] == {"include_usage": True}
+    monkeypatch.setattr(main, "LLM_PROMPT_CACHE", "cache_control")
+    content = main._system_message()["content"]
+    assert content[0]["text"] == SYSTEM_PROMPT and content[0]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_record_usage_counts_cached_tokens(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main, "_llm_usage", {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+    usage = SimpleNamespace(
+        prompt_tokens=2000, completion_tokens=100, prompt_tokens_details=SimpleNamespace(cached_tokens=1536)
+    )
+    main._record_usage(usage, "llm")
+    main._record_usage(SimpleNamespace(prompt_tokens=1000, completion_tokens=50, prompt_tokens_details=None), "llm")
+    stats = main._llm_usage_stats()
+    assert stats["calls"] == 2 and stats["cached_tokens"] == 1536
+    assert stats["cached_ratio"] == pytest.approx(1536 / 3000, abs=1e-3)
@@ -0,0 +1,140 @@
+"""
+Tests for the incremental stream segmenter: boundary, size and time flush policies, sources marker.
+"""
+from __future__ import annotations
+
+import time
+from typing import Iterator
+
+import pytest
+
+from backend.stream_segmenter import StreamSegmenter, split_reply, with_ticks
+
+SENTENCE = "Видео загружается через кнопку «Загрузить» в проекте. "
+
+
+def _deltas(text: str, size: int = 3) -> list[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_blocks_end_on_sentence_boundaries() -> None:
+    seg = StreamSegmenter(min_chars=80, max_chars=300)
+    blocks: list[str] = []
+    for d in _deltas(SENTENCE * 6):
+        blocks += seg.feed(d)
+    blocks += seg.finish()
+    assert all(b.endswith(".") for b in blocks)
+    assert all(80 <= len(b) <= 300 for b in blocks[:-1])
+    assert " ".join(blocks) == (SENTENCE * 6).strip()
+
+
+def test_paragraph_boundary_preferred() -> None:
+    text = "Первый абзац про плеер, довольно длинный. Ещё предложение.\n\nВторой абзац. " + SENTENCE * 3
+    blocks = split_reply(text, min_chars=40, max_chars=120)
+    assert blocks[0] == "Первый абзац про плеер, довольно длинный. Ещё предложение."
+
+
+def test_size_policy_cuts_without_boundaries() -> None:
+    seg = StreamSegmenter(min_chars=10, max_chars=50)
+    blocks: list[str] = []
+    for d in _deltas("слово " * 40):
+        blocks += seg.feed(d)
+    blocks += seg.finish()
+    assert len(blocks) > 1 and all(len(b) <= 50 for b in blocks)
+    assert " ".join(blocks) == ("слово " * 40).strip()
+
+
+def test_sources_marker_split_across_deltas_stops_blocks() -> None:
+    seg = StreamSegmenter(min_chars=20, max_chars=200)
+    blocks: list[str] = []
+    for d in ["Ответ. " * 5, "Источ", "ники:\nhttps://docs/a. Ещё. " * 3]:
+        blocks += seg.feed(d)
+    assert seg.sources_started
+    assert not any("Источ" in b for b in blocks)
+    tail = seg.finish()
+    assert len(tail) == 1 and tail[0].startswith("Источники:")
+
+
+def test_split_reply_keeps_sources_in_last_block() -> None:
+    reply = SENTENCE * 5 + "\n\nИсточники:\nhttps://docs/a"
+    blocks = split_reply(reply, min_chars=60, max_chars=200)
+    assert blocks[-1].endswith("Источники:\nhttps://docs/a")
+    assert all("Источники:" not in b for b in blocks[:-1])
+
+
+def test_time_policy_flushes_short_block_at_boundary() -> None:
+    clock = FakeClock()
+    seg = StreamSegmenter(min_chars=200, max_chars=400, max_wait_sec=1.0, clock=clock)
+    assert seg.feed("Короткое начало. Продолж") == []
+    assert seg.poll() == []
+    clock.now = 1.5
+    assert seg.poll() == ["Короткое начало."]
+    assert seg.pending_chars == len("Продолж")
+    # Без границы — ждём следующую, даже после дедлайна
+    clock.now = 5.0
+    assert seg.poll() == []
+    assert seg.feed("ение. ") == ["Продолжение."]
+
+
+def test_feed_work_is_linear_in_stream_length() -> None:
+    # Детерминированно вместо замера времени: каждый символ сканируется один раз, буфер не растёт
+    class CountingSegmenter(StreamSegmenter):
+        scanned = 0
+        joined = 0
+
+        def _scan(self, delta: str) -> None:
+            CountingSegmenter.scanned += len(delta)
+            super()._scan(delta)
+
+        def _cut(self, cut: int) -> str:
+            CountingSegmenter.joined += self.pending_chars
+            return super()._cut(cut)
+
+    text = SENTENCE * 800
+    seg = CountingSegmenter(min_chars=120, max_chars=450)
+    for d in _deltas(text, 4):
+        seg.feed(d)
+        assert seg.pending_chars <= seg.max_chars
+    assert CountingSegmenter.scanned == len(text)
+    # Склейка при разрезе касается только текущего блока (<= max_chars + дельта), а не всего ответа
+    blocks = len(text) // seg.min_chars
+    assert CountingSegmenter.joined <= blocks * (seg.max_chars + 4)
+
+
+def test_with_ticks_yields_none_while_source_is_silent() -> None:
+    def slow() -> Iterator[str]:
+        yield "a"
+        time.sleep(0.12)
+        yield "b"
+
+    items = list(with_ticks(slow(), 0.02))
+    assert items[0] == "a" and items[-1] == "b"
+    assert None in items
+
+
+def test_with_ticks_propagates_source_error() -> None:
+    def broken() -> Iterator[str]:
+        yield "a"
+        raise RuntimeError("llm down")
+
+    ticks = with_ticks(broken(), 0.05)
+    assert next(ticks) == "a"
+    with pytest.raises(RuntimeError, match="llm down"):
+        list(ticks)
+
+
+def test_time_flush_is_counted() -> None:
+    clock = FakeClock()
+    seg = StreamSegmenter(min_chars=200, max_chars=400, max_wait_sec=1.0, clock=clock)
+    seg.feed("Первое. ")
+    clock.now = 2.0
+    assert seg.poll() == ["Первое."]
+    assert seg.time_flushes == 1
@@ -20,7 +20,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
 
-from backend.prompts import SYSTEM_PROMPT_TEMPLATE
+from backend.prompts import CONTEXT_MESSAGE_TEMPLATE, SYSTEM_PROMPT
 from rag.search import search as rag_search
 
 # Конфиг LLM из env (LLM_API_KEY или OPENAI_API_KEY). Читаем при каждом запросе — на случай смены env.
@@ -138,13 +138,18 @@ def _clean_reply(reply: str) -> str:
     return (cleaned_before + "\n\n" + sources_block.strip()).strip()
 
 
+def _system_content(rag_text: str) -> str:
+    """Системный промпт и результаты поиска одним системным сообщением."""
+    return SYSTEM_PROMPT + "\n" + CONTEXT_MESSAGE_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text)
+
+
 @app.post("/chat", response_model=ChatResponse)
 def chat(request: ChatRequest) -> ChatResponse:
     message = (request.message or "").strip()
     if not message:
         raise HTTPException(status_code=400, detail="Укажите message")
     rag_text = rag_search(message)
-    system_content = SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text)
+    system_content = _system_content(rag_text)
     try:
         reply = _call_llm(system_content, message)
     except Exception as e:
@@ -160,7 +165,7 @@ def chat_stream(request: ChatRequest) -> StreamingResponse:
     if not message:
         raise HTTPException(status_code=400, detail="Укажите message")
     rag_text = rag_search(message)
-    system_content = SYSTEM_PROMPT_TEMPLATE.replace("{{RAG_CONTEXT}}", rag_text)
+    system_content = _system_content(rag_text)
 
     def generate() -> Any:
         try:
@@ -13,12 +13,11 @@ import mcp.types as types
 from mcp.server.lowlevel import Server
 from mcp.server.stdio import stdio_server
 
-from rag.search import search as rag_search
+from rag.search import asearch as rag_asearch, awarm_up as rag_awarm_up
 
 
 async def _search_async(query: str, limit: int = 5) -> str:
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, rag_search, query)
+    return await rag_asearch(query)
 
 
 def main() -> int:
@@ -63,12 +62,17 @@ def main() -> int:
             return [types.TextContent(type="text", text=f"Ошибка поиска: {e}\n\n{tb}")]
 
     async def run_server() -> None:
-        async with stdio_server() as (read_stream, write_stream):
-            await app.run(
-                read_stream,
-                write_stream,
-                app.create_initialization_options(),
-            )
+        # Прогрев моделей и Qdrant параллельно с рукопожатием MCP: первый поиск не ждёт загрузку
+        warm_task = asyncio.create_task(rag_awarm_up())
+        try:
+            async with stdio_server() as (read_stream, write_stream):
+                await app.run(
+                    read_stream,
+                    write_stream,
+                    app.create_initialization_options(),
+                )
+        finally:
+            warm_task.cancel()
 
     asyncio.run(run_server())
     return 0
@@ -1,4 +1,5 @@
 # RAG: поиск по Qdrant с эмбеддингом и ре-ранжированием.
-from rag.search import search
+from rag.results import SearchHit, render_hits
+from rag.search import asearch, asearch_hits, search, search_hits
 
-__all__ = ["search"]
+__all__ = ["SearchHit", "asearch", "asearch_hits", "render_hits", "search", "search_hits"]
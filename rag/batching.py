@@ -0,0 +1,156 @@
+"""
+Микро-батчинг для моделей: одиночные запросы из разных потоков собираются в один батч.
+Запросы, пришедшие в течение окна window_ms (но не больше max_batch штук), уходят в модель
+одним вызовом fn(batch); каждый вызывающий получает свой результат через Future.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Sequence
+
+logger = logging.getLogger(__name__)
+
+BatchFn = Callable[[list[Any]], Sequence[Any]]
+
+
+class MicroBatcher:
+    """
+    Очередь + один фоновый поток, который собирает батчи и вызывает fn.
+    fn получает список элементов и должен вернуть список результатов той же длины и в том же порядке.
+    """
+
+    def __init__(
+        self,
+        fn: BatchFn,
+        *,
+        window_ms: float = 5.0,
+        max_batch: int = 32,
+        name: str = "batcher",
+    ) -> None:
+        self._fn = fn
+        self._window = max(0.0, window_ms) / 1000.0
+        self._max_batch = max(1, max_batch)
+        self._name = name
+        self._queue: queue.Queue[tuple[Any, Future] | None] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._last_batch_size = 0
+        self._max_batch_seen = 0
+        self._busy_sec = 0.0
+
+    @property
+    def window_ms(self) -> float:
+        return self._window * 1000.0
+
+    @property
+    def max_batch(self) -> int:
+        return self._max_batch
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Ставит элемент в очередь; результат — в возвращённом Future."""
+        fut: Future = Future()
+        self._ensure_started()
+        self._queue.put((item, fut))
+        return fut
+
+    def submit_many(self, items: Iterable[Any]) -> list[Future]:
+        """Ставит несколько элементов подряд (попадут в один или соседние батчи)."""
+        self._ensure_started()
+        futures: list[Future] = []
+        for item in items:
+            fut: Future = Future()
+            self._queue.put((item, fut))
+            futures.append(fut)
+        return futures
+
+    def run(self, item: Any, timeout: float | None = None) -> Any:
+        """Синхронно: поставить в очередь и дождаться результата."""
+        return self.submit(item).result(timeout=timeout)
+
+    def close(self) -> None:
+        """Останавливает фоновый поток (элементы, уже стоящие в очереди, будут обработаны)."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            batches, items = self._batches, self._items
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": batches,
+                "items": items,
+                "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+                "last_batch_size": self._last_batch_size,
+                "max_batch_size_seen": self._max_batch_seen,
+                "busy_sec": round(self._busy_sec, 3),
+                "window_ms": self.window_ms,
+                "max_batch": self._max_batch,
+            }
+
+    def _collect(self, first: tuple[Any, Future]) -> tuple[list[tuple[Any, Future]], bool]:
+        """Добирает батч до max_batch в пределах окна. Возвращает (batch, stop)."""
+        batch = [first]
+        deadline = time.monotonic() + self._window
+        while len(batch) < self._max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+            # Future, отменённые вызывающим, не отправляем в модель
+            batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            try:
+                results = self._fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"{self._name}: fn returned {len(results)} results for batch of {len(batch)}"
+                    )
+            except BaseException as e:
+                logger.exception("%s: batch of %s failed", self._name, len(batch))
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            finally:
+                self._record(len(batch), time.perf_counter() - t0)
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+
+    def _record(self, size: int, elapsed: float) -> None:
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._last_batch_size = size
+            self._max_batch_seen = max(self._max_batch_seen, size)
+            self._busy_sec += elapsed
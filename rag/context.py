@@ -0,0 +1,266 @@
+"""
+Сборка контекста для промпта LLM из SearchHit с бюджетом токенов.
+
+- Фрагменты одного источника, перекрывающиеся текстом (индексатор режет с перекрытием CHUNK_OVERLAP)
+  или вложенные друг в друга, склеиваются в один; соседние фрагменты источника идут одним блоком.
+- Почти одинаковые фрагменты (Jaccard по словам >= CONTEXT_DEDUP_THRESHOLD) остаются в одном экземпляре.
+- Фрагменты добавляются в порядке ранжирования, пока помещаются в CONTEXT_MAX_TOKENS; последний
+  не поместившийся обрезается (по строкам, внутри строки — по предложениям или словам), если от бюджета
+  осталось хотя бы CONTEXT_MIN_PASSAGE_TOKENS.
+
+Токены считает tiktoken (CONTEXT_TOKENIZER), если установлен; иначе — оценка по числу слов и знаков.
+build_context() возвращает текст и отчёт: сколько токенов было бы у render_hits() и сколько сэкономлено.
+"""
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Sequence
+
+from rag.lexical import tokenize
+from rag.results import SearchHit, render_hits
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_MAX_TOKENS = int(os.environ.get("CONTEXT_MAX_TOKENS", "2000"))
+CONTEXT_MIN_PASSAGE_TOKENS = int(os.environ.get("CONTEXT_MIN_PASSAGE_TOKENS", "64"))
+CONTEXT_DEDUP_THRESHOLD = float(os.environ.get("CONTEXT_DEDUP_THRESHOLD", "0.9"))
+CONTEXT_TOKENIZER = os.environ.get("CONTEXT_TOKENIZER", "o200k_base")
+# Минимальная длина совпадения конца одного фрагмента с началом другого, чтобы считать их перекрытием
+_MIN_OVERLAP_CHARS = 20
+_APPROX_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+# Границы для обрезки внутри строки: после конца предложения / после слова (позиция — начало пробелов или конец)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?…])(?:\s+|$)")
+_WORD_END_RE = re.compile(r"(?<=\S)(?:\s+|$)")
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "hits": 0, "passages": 0, "merged": 0, "deduped": 0, "dropped": 0, "tokens": 0, "saved_tokens": 0}
+
+
+@functools.lru_cache(maxsize=1)
+def _get_token_counter() -> Callable[[str], int]:
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding(CONTEXT_TOKENIZER)
+    except Exception as e:  # не установлен или нет словаря офлайн
+        logger.info("tiktoken unavailable (%s), using approximate token count", e)
+        return lambda text: len(_APPROX_TOKEN_RE.findall(text))
+    return lambda text: len(encoding.encode_ordinary(text))
+
+
+def count_tokens(text: str) -> int:
+    return _get_token_counter()(text)
+
+
+@dataclass(slots=True)
+class Passage:
+    """Фрагмент контекста: один или несколько склеенных хитов одного источника."""
+
+    source: str
+    section: str
+    text: str
+    hit_ids: list[Any] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class BuiltContext:
+    text: str
+    tokens: int
+    raw_tokens: int
+    passages: list[Passage]
+    merged: int = 0
+    deduped: int = 0
+    dropped: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.raw_tokens - self.tokens)
+
+
+def _overlap_merge(first: str, second: str) -> str | None:
+    """first + second без общей части, если конец first совпадает с началом second; иначе None."""
+    probe = second[:_MIN_OVERLAP_CHARS]
+    if len(probe) < _MIN_OVERLAP_CHARS:
+        return None
+    pos = first.find(probe)
+    while pos != -1:
+        tail = first[pos:]
+        if second.startswith(tail):
+            return first + second[len(tail):]
+        pos = first.find(probe, pos + 1)
+    return None
+
+
+def merge_texts(a: str, b: str) -> str | None:
+    """Склейка двух фрагментов одного источника: вложение или перекрытие в любом порядке; None — не склеиваются."""
+    if b in a:
+        return a
+    if a in b:
+        return b
+    return _overlap_merge(a, b) or _overlap_merge(b, a)
+
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _group(hits: Sequence[SearchHit]) -> tuple[list[Passage], int]:
+    """Хиты → фрагменты: склейка внутри источника, порядок — по лучшему хиту источника."""
+    by_source: dict[str, list[Passage]] = {}
+    merged = 0
+    for hit in hits:
+        passages = by_source.setdefault(hit.source, [])
+        for p in passages:
+            text = merge_texts(p.text, hit.content)
+            if text is not None:
+                p.text = text
+                p.hit_ids.append(hit.id)
+                merged += 1
+                break
+        else:
+            passages.append(Passage(hit.source, hit.section, hit.content, [hit.id]))
+    # Склейка могла сделать соседними фрагменты, не перекрывавшиеся попарно при добавлении
+    for source, passages in by_source.items():
+        i = 0
+        while i < len(passages):
+            j = i + 1
+            while j < len(passages):
+                text = merge_texts(passages[i].text, passages[j].text)
+                if text is not None:
+                    passages[i].text = text
+                    passages[i].hit_ids.extend(passages.pop(j).hit_ids)
+                    merged += 1
+                    j = i + 1
+                else:
+                    j += 1
+            i += 1
+    return [p for passages in by_source.values() for p in passages], merged
+
+
+def _dedupe(passages: list[Passage], threshold: float) -> tuple[list[Passage], int]:
+    kept: list[Passage] = []
+    kept_tokens: list[set[str]] = []
+    for p in passages:
+        tokens = set(tokenize(p.text))
+        if any(_jaccard(tokens, other) >= threshold for other in kept_tokens):
+            continue
+        kept.append(p)
+        kept_tokens.append(tokens)
+    return kept, len(passages) - len(kept)
+
+
+def _prefix_within(text: str, boundary: re.Pattern[str], max_tokens: int) -> str:
+    """Самое длинное начало text, оканчивающееся на границе boundary и не длиннее max_tokens."""
+    best = ""
+    for m in boundary.finditer(text):
+        prefix = text[: m.start()].rstrip()
+        if count_tokens(prefix) > max_tokens:
+            break
+        best = prefix
+    return best
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """
+    Начало текста не длиннее max_tokens: целые строки, затем — предложения строки, которая целиком не влезла.
+    Если не влезло ни одной строки и ни одного предложения, режется по словам.
+    """
+    out: list[str] = []
+    used = 0
+    for line in text.splitlines(keepends=True):
+        n = count_tokens(line)
+        if used + n <= max_tokens:
+            out.append(line)
+            used += n
+            continue
+        rest = max_tokens - used
+        part = _prefix_within(line, _SENTENCE_END_RE, rest)
+        if not part and not out:
+            part = _prefix_within(line, _WORD_END_RE, rest)
+        if part:
+            out.append(part)
+        break
+    return "".join(out).rstrip()
+
+
+def _render_entry(i: int, source: str, section: str, texts: list[str]) -> str:
+    lines = [f"{i}. {section}", f"   Источник: {source}"]
+    lines.extend(f"   Текст: {t}" for t in texts if t)
+    return "\n".join(lines)
+
+
+def build_context(
+    query: str,
+    hits: Sequence[SearchHit],
+    max_tokens: int | None = None,
+    dedup_threshold: float | None = None,
+) -> BuiltContext:
+    """Текст блока «Результаты поиска» для промпта в пределах бюджета токенов + отчёт об экономии."""
+    q = query.strip()
+    budget = max_tokens if max_tokens is not None else CONTEXT_MAX_TOKENS
+    threshold = dedup_threshold if dedup_threshold is not None else CONTEXT_DEDUP_THRESHOLD
+    raw_tokens = count_tokens(render_hits(q, hits))
+    if not hits:
+        text = render_hits(q, hits)
+        return BuiltContext(text, raw_tokens, raw_tokens, [])
+
+    passages, merged = _group(hits)
+    passages, deduped = _dedupe(passages, threshold)
+
+    header = f"Результаты по запросу «{q}»:"
+    used = count_tokens(header)
+    text_prefix = count_tokens("   Текст: ") + 1  # + перевод строки
+    # Блоки по источникам в порядке первого фрагмента; внутри источника — фрагменты по рангу
+    entries: dict[str, tuple[str, list[str]]] = {}
+    kept: list[Passage] = []
+    dropped = 0
+    for p in passages:
+        # Заголовок блока источника + разделитель блоков
+        entry_overhead = 0 if p.source in entries else count_tokens(_render_entry(0, p.source, p.section, [])) + 1
+        cost = entry_overhead + text_prefix + count_tokens(p.text)
+        text = p.text
+        if used + cost > budget:
+            remaining = budget - used - entry_overhead - text_prefix
+            if remaining < CONTEXT_MIN_PASSAGE_TOKENS:
+                dropped += 1
+                continue
+            text = _truncate(p.text, remaining)
+            if not text:
+                dropped += 1
+                continue
+            cost = entry_overhead + text_prefix + count_tokens(text)
+        entries.setdefault(p.source, (p.section, []))[1].append(text)
+        kept.append(p)
+        used += cost
+
+    blocks = [header] + [
+        _render_entry(i, source, section, texts) for i, (source, (section, texts)) in enumerate(entries.items(), 1)
+    ]
+    text = "\n\n".join(blocks)
+    built = BuiltContext(text, count_tokens(text), raw_tokens, kept, merged, deduped, dropped)
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["hits"] += len(hits)
+        _stats["passages"] += len(kept)
+        _stats["merged"] += merged
+        _stats["deduped"] += deduped
+        _stats["dropped"] += dropped
+        _stats["tokens"] += built.tokens
+        _stats["saved_tokens"] += built.saved_tokens
+    return built
+
+
+def context_stats() -> dict[str, Any]:
+    """Счётчики сборки контекста: фрагменты, склейки, дубли, токены и сэкономленные токены."""
+    with _stats_lock:
+        out: dict[str, Any] = dict(_stats)
+    out["max_tokens"] = CONTEXT_MAX_TOKENS
+    out["avg_saved_tokens"] = round(out["saved_tokens"] / out["requests"], 1) if out["requests"] else 0.0
+    return out
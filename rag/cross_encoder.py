@@ -0,0 +1,126 @@
+"""
+Кросс-энкодер для ре-ранжирования: ONNX-модель fastembed (TextCrossEncoder), без torch.
+
+- Модель загружается один раз (load() — при старте приложения), дальше запросы её не ждут.
+- Пары (запрос, фрагмент) от одновременных запросов собираются MicroBatcher в общие батчи.
+- Бюджет задержки: по скользящему среднему стоимости одной пары считается, сколько кандидатов
+  успевает оцениться за CROSS_ENCODER_BUDGET_MS; лишние (хвост первичного ранжирования) не оцениваются.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Sequence
+
+import numpy as np
+
+from rag.batching import MicroBatcher
+
+logger = logging.getLogger(__name__)
+
+# Модель fastembed; для русскоязычной базы есть многоязычные, в т.ч. int8: BAAI/bge-reranker-v2-m3-int8
+CROSS_ENCODER_MODEL = os.environ.get("CROSS_ENCODER_MODEL", "Xenova/ms-marco-MiniLM-L-6-v2")
+CROSS_ENCODER_THREADS = int(os.environ.get("CROSS_ENCODER_THREADS", "0")) or None
+# Батчинг пар между запросами: окно (мс) и максимум пар в батче
+CROSS_ENCODER_BATCH_WINDOW_MS = float(os.environ.get("CROSS_ENCODER_BATCH_WINDOW_MS", "5"))
+CROSS_ENCODER_BATCH_MAX_PAIRS = int(os.environ.get("CROSS_ENCODER_BATCH_MAX_PAIRS", "64"))
+# Бюджет на оценку кандидатов одного запроса (мс); 0 — оценивать всех
+CROSS_ENCODER_BUDGET_MS = float(os.environ.get("CROSS_ENCODER_BUDGET_MS", "150"))
+# Вес нового замера в скользящем среднем стоимости пары
+_EMA_ALPHA = 0.2
+
+_model: Any = None
+_model_lock = threading.Lock()
+_batcher: MicroBatcher | None = None
+_batcher_lock = threading.Lock()
+_pair_sec: float | None = None
+_stats_lock = threading.Lock()
+_capped = 0
+_requests = 0
+
+
+def _get_model() -> Any:
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from fastembed.rerank.cross_encoder import TextCrossEncoder
+
+                t0 = time.perf_counter()
+                _model = TextCrossEncoder(model_name=CROSS_ENCODER_MODEL, threads=CROSS_ENCODER_THREADS)
+                logger.info("cross-encoder %s loaded in %.2fs", CROSS_ENCODER_MODEL, time.perf_counter() - t0)
+    return _model
+
+
+def _score_pairs(pairs: list[tuple[str, str]]) -> list[float]:
+    """Батч пар одним вызовом модели; обновляет среднюю стоимость пары."""
+    global _pair_sec
+    t0 = time.perf_counter()
+    scores = [float(s) for s in _get_model().rerank_pairs(pairs, batch_size=max(1, len(pairs)))]
+    per_pair = (time.perf_counter() - t0) / max(1, len(pairs))
+    with _stats_lock:
+        _pair_sec = per_pair if _pair_sec is None else (1 - _EMA_ALPHA) * _pair_sec + _EMA_ALPHA * per_pair
+    return scores
+
+
+def _get_batcher() -> MicroBatcher:
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(
+                    _score_pairs,
+                    window_ms=CROSS_ENCODER_BATCH_WINDOW_MS,
+                    max_batch=CROSS_ENCODER_BATCH_MAX_PAIRS,
+                    name="cross-encoder",
+                )
+    return _batcher
+
+
+def load() -> None:
+    """Загрузить модель и прогреть ONNX одной парой (вызывается при старте)."""
+    _score_pairs([("warm up", "warm up")])
+
+
+def is_loaded() -> bool:
+    return _model is not None
+
+
+def candidate_cap(minimum: int) -> int | None:
+    """Сколько кандидатов укладывается в бюджет (не меньше minimum); None — без ограничения."""
+    if CROSS_ENCODER_BUDGET_MS <= 0 or _pair_sec is None or _pair_sec <= 0:
+        return None
+    return max(minimum, int(CROSS_ENCODER_BUDGET_MS / 1000.0 / _pair_sec))
+
+
+def score(query: str, passages: Sequence[str]) -> np.ndarray:
+    """Скоры релевантности фрагментов запросу (через общий батчер)."""
+    if not passages:
+        return np.zeros(0, dtype=np.float32)
+    futures = _get_batcher().submit_many([(query, p) for p in passages])
+    return np.asarray([f.result() for f in futures], dtype=np.float32)
+
+
+def note_request(capped: bool) -> None:
+    global _capped, _requests
+    with _stats_lock:
+        _requests += 1
+        _capped += int(capped)
+
+
+def stats() -> dict[str, Any]:
+    with _stats_lock:
+        pair_ms = None if _pair_sec is None else round(_pair_sec * 1000.0, 3)
+        out: dict[str, Any] = {
+            "model": CROSS_ENCODER_MODEL,
+            "loaded": _model is not None,
+            "pair_ms": pair_ms,
+            "budget_ms": CROSS_ENCODER_BUDGET_MS,
+            "requests": _requests,
+            "capped": _capped,
+        }
+    if _batcher is not None:
+        out["batcher"] = _batcher.stats()
+    return out
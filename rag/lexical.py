@@ -0,0 +1,63 @@
+"""
+Лексический индекс для гибридного поиска: BM25 через разреженные векторы Qdrant.
+
+Токен → стабильный ID (crc32, одинаковый в индексаторе и в поиске). Вектор документа — BM25-вес
+частоты термина с нормализацией по длине; IDF считает сам Qdrant (Modifier.IDF у разреженного вектора).
+Вектор запроса — по 1.0 на каждый уникальный токен, так что скор = сумма BM25 совпавших терминов.
+"""
+from __future__ import annotations
+
+import re
+import zlib
+from collections import Counter
+
+SPARSE_VECTOR_NAME = "bm25"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Средняя длина чанка в токенах (~600 символов). Константа, а не статистика корпуса:
+# при инкрементальной индексации старые векторы не пересчитываются.
+BM25_AVG_DOC_LEN = 80.0
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Токены в нижнем регистре (та же нормализация, что у keyword-реранка)."""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def token_id(token: str) -> int:
+    """Стабильный 32-битный ID токена (hash() в Python рандомизирован между процессами)."""
+    return zlib.crc32(token.encode("utf-8"))
+
+
+def token_ids(text: str) -> list[int]:
+    """Отсортированные уникальные ID токенов (payload token_ids для keyword-реранка без регулярок)."""
+    return sorted({token_id(tok) for tok in tokenize(text)})
+
+
+def document_vector(
+    text: str,
+    *,
+    k1: float = BM25_K1,
+    b: float = BM25_B,
+    avg_doc_len: float = BM25_AVG_DOC_LEN,
+) -> tuple[list[int], list[float]]:
+    """Разреженный BM25-вектор чанка: (indices, values), indices по возрастанию."""
+    tokens = tokenize(text)
+    if not tokens:
+        return [], []
+    norm = k1 * (1.0 - b + b * len(tokens) / avg_doc_len)
+    weights: dict[int, float] = {}
+    for tok, tf in Counter(tokens).items():
+        tid = token_id(tok)
+        # Коллизии crc32 редки; частоты совпавших ID складываются
+        weights[tid] = weights.get(tid, 0.0) + tf
+    indices = sorted(weights)
+    return indices, [weights[i] * (k1 + 1.0) / (weights[i] + norm) for i in indices]
+
+
+def query_vector(text: str) -> tuple[list[int], list[float]]:
+    """Разреженный вектор запроса: уникальные токены с весом 1.0."""
+    indices = token_ids(text)
+    return indices, [1.0] * len(indices)
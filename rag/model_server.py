@@ -0,0 +1,240 @@
+"""
+Общий процесс моделей для нескольких воркеров uvicorn: эмбеддер и кросс-энкодер загружаются один раз,
+воркеры обращаются к нему по Unix-сокету (MODEL_SERVER_SOCKET) через ModelClient — тонкий клиент в rag.search.
+
+Запросы всех воркеров попадают в одни и те же MicroBatcher'ы (эмбеддинг запросов, пары кросс-энкодера),
+так что батчинг работает между процессами, а память не растёт с числом воркеров.
+
+Протокол: кадр = 4 байта длины (big-endian) + JSON. Запрос {"op": ...}, ответ — результат или {"error": ...}.
+  ping                                   → {"ok": true}
+  embed   {"texts": [...]}               → {"vectors": [[...], ...]}
+  rerank  {"query", "passages", "limit"} → {"scores": [...]} (только для первых кандидатов, укладывающихся в бюджет)
+  stats                                  → {"embedding": {...}, "cross_encoder": {...}}
+
+Запуск: python -m rag.model_server --socket /tmp/rag-models.sock
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from typing import Any
+
+from rag import cross_encoder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/rag-models.sock"
+_HEADER = struct.Struct(">I")
+_MAX_FRAME = 64 * 1024 * 1024
+
+
+class ModelServerError(RuntimeError):
+    """Сервер моделей недоступен или вернул ошибку."""
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("model server connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_frame(sock: socket.socket, obj: dict[str, Any]) -> None:
+    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_frame(sock: socket.socket) -> dict[str, Any]:
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > _MAX_FRAME:
+        raise ConnectionError(f"model server frame too large: {size} bytes")
+    return json.loads(_recv_exact(sock, size))
+
+
+# --- сервер ---
+
+
+def _search_module() -> Any:
+    import rag.search  # noqa: F401  (в пакете имя rag.search перекрыто функцией search)
+
+    return sys.modules["rag.search"]
+
+
+def _embed(texts: list[str]) -> list[list[float]]:
+    search_mod = _search_module()
+    if search_mod.EMBED_BATCH_MAX_SIZE <= 1:
+        vectors = search_mod._embed_batch(texts)
+    else:
+        futures = search_mod._get_query_batcher().submit_many(texts)
+        vectors = [f.result() for f in futures]
+    return [list(v) for v in vectors]
+
+
+def _rerank(query: str, passages: list[str], limit: int) -> list[float]:
+    cap = cross_encoder.candidate_cap(limit)
+    candidates = passages[:cap] if cap is not None and cap < len(passages) else passages
+    cross_encoder.note_request(capped=len(candidates) < len(passages))
+    return [float(s) for s in cross_encoder.score(query, candidates)]
+
+
+def _stats() -> dict[str, Any]:
+    return {"embedding": _search_module().embedding_stats(), "cross_encoder": cross_encoder.stats()}
+
+
+def handle_request(request: dict[str, Any]) -> dict[str, Any]:
+    """Один запрос протокола → ответ; исключения превращаются в {"error": ...}."""
+    op = request.get("op")
+    try:
+        if op == "ping":
+            return {"ok": True}
+        if op == "embed":
+            return {"vectors": _embed(list(request["texts"]))}
+        if op == "rerank":
+            return {"scores": _rerank(request["query"], list(request["passages"]), int(request.get("limit", 0)))}
+        if op == "stats":
+            return _stats()
+        return {"error": f"unknown op: {op!r}"}
+    except Exception as e:
+        logger.exception("model server: %s failed", op)
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        # Соединение постоянное: клиент держит пул и шлёт запросы по одному
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (ConnectionError, OSError):
+                return
+            send_frame(self.request, handle_request(request))
+
+
+class ModelServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str) -> None:
+        if os.path.exists(path):
+            os.unlink(path)  # сокет от прошлого запуска
+        super().__init__(path, _Handler)
+        self.path = path
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def load_models(cross_encoder_enabled: bool) -> None:
+    """Загрузить и прогреть модели до приёма соединений."""
+    _search_module()._embed_batch(["warm up"])
+    if cross_encoder_enabled:
+        cross_encoder.load()
+
+
+# --- клиент ---
+
+
+class ModelClient:
+    """
+    Тонкий потокобезопасный клиент: пул постоянных соединений (по одному на одновременный вызов).
+    Оборванное соединение (перезапуск сервера) переоткрывается один раз; запрос, упавший по таймауту, не повторяется.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0) -> None:
+        self.path = path
+        self.timeout = timeout
+        self._pool: queue.LifoQueue[socket.socket] = queue.LifoQueue()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise ModelServerError(f"model server {self.path} unavailable: {e}") from e
+        return sock
+
+    def _call(self, request: dict[str, Any]) -> dict[str, Any]:
+        for attempt in range(2):
+            try:
+                sock = self._pool.get_nowait()
+                reused = True
+            except queue.Empty:
+                sock, reused = self._connect(), False
+            try:
+                send_frame(sock, request)
+                response = recv_frame(sock)
+            except (ConnectionError, OSError) as e:
+                sock.close()
+                # Повтор — только если сервер закрыл простаивавшее соединение (сброс или EOF). Таймаут
+                # (TimeoutError — тоже OSError) значит, что запрос уже выполняется: повтор удвоил бы и ожидание, и работу
+                if reused and attempt == 0 and isinstance(e, ConnectionError):
+                    continue
+                raise ModelServerError(f"model server {self.path}: {e}") from e
+            self._pool.put(sock)
+            if "error" in response:
+                raise ModelServerError(response["error"])
+            return response
+        raise ModelServerError(f"model server {self.path}: no response")
+
+    def ping(self) -> bool:
+        return bool(self._call({"op": "ping"}).get("ok"))
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return self._call({"op": "embed", "texts": texts})["vectors"]
+
+    def rerank(self, query: str, passages: list[str], limit: int) -> list[float]:
+        """Скоры первых len(result) фрагментов (сервер отрезает хвост по бюджету кросс-энкодера)."""
+        return self._call({"op": "rerank", "query": query, "passages": passages, "limit": limit})["scores"]
+
+    def stats(self) -> dict[str, Any]:
+        return self._call({"op": "stats"})
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Общий сервер моделей (эмбеддинг, кросс-энкодер) по Unix-сокету")
+    parser.add_argument("--socket", default=os.environ.get("MODEL_SERVER_SOCKET") or DEFAULT_SOCKET)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    # Сам сервер считает модели локально, а не через сокет
+    search_mod = _search_module()
+    search_mod.MODEL_SERVER_SOCKET = ""
+    load_models(search_mod.USE_CROSS_ENCODER)
+
+    server = ModelServer(args.socket)
+    logger.info("model server listening on %s", args.socket)
+    thread = threading.Thread(target=server.serve_forever, name="model-server", daemon=True)
+    thread.start()
+    try:
+        thread.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
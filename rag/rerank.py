@@ -0,0 +1,148 @@
+"""
+Векторизованное ре-ранжирование кандидатов (NumPy).
+
+Сигналы кандидата — строка матрицы (n, 4): vector (скор Qdrant), keyword (доля токенов запроса в чанке),
+heading (доля токенов запроса в заголовке), source (априорный вес раздела). Итоговый скор — signals @ weights,
+топ-k — argpartition. Для подбора весов (scripts/check_relevance.py --sweep) сигналы многих запросов
+складываются в один тензор и ранжируются сразу для всей сетки весов, без повторных запросов к Qdrant.
+"""
+from __future__ import annotations
+
+from typing import Any, NamedTuple, Sequence
+
+import numpy as np
+
+from rag.lexical import token_ids
+
+SIGNALS = ("vector", "keyword", "heading", "source")
+
+
+class Weights(NamedTuple):
+    vector: float = 0.6
+    keyword: float = 0.4
+    heading: float = 0.0
+    source: float = 0.0
+
+    @classmethod
+    def from_alpha(cls, alpha: float, heading: float = 0.0, source: float = 0.0) -> Weights:
+        """alpha * vector + (1 - alpha) * keyword (+ heading, source) — как RERANK_ALPHA."""
+        return cls(alpha, 1.0 - alpha, heading, source)
+
+    def array(self) -> np.ndarray:
+        return np.asarray(self, dtype=np.float32)
+
+
+def overlap(query_ids: Sequence[int], id_lists: Sequence[Sequence[int]]) -> np.ndarray:
+    """
+    Доля ID токенов запроса, встречающихся в каждом списке, за один проход:
+    все списки склеиваются в массив, np.isin + np.add.reduceat по границам списков.
+    """
+    n = len(id_lists)
+    q = np.unique(np.asarray(query_ids, dtype=np.int64))
+    if not q.size or not n:
+        return np.zeros(n, dtype=np.float32)
+    lengths = np.fromiter((len(ids) for ids in id_lists), dtype=np.int64, count=n)
+    flat = np.fromiter((t for ids in id_lists for t in ids), dtype=np.int64, count=int(lengths.sum()))
+    if not flat.size:
+        return np.zeros(n, dtype=np.float32)
+    hits = np.isin(flat, q).astype(np.float32)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    counts = np.zeros(n, dtype=np.float32)
+    nonempty = lengths > 0
+    counts[nonempty] = np.add.reduceat(hits, starts[nonempty])
+    return counts / q.size
+
+
+def source_priors(payloads: Sequence[dict[str, Any]], priors: dict[str, float] | None) -> np.ndarray:
+    """Априорный вес по префиксу section (самый длинный совпавший префикс), иначе 0."""
+    out = np.zeros(len(payloads), dtype=np.float32)
+    if not priors:
+        return out
+    prefixes = sorted(priors, key=len, reverse=True)
+    for i, payload in enumerate(payloads):
+        section = payload.get("section") or ""
+        for prefix in prefixes:
+            if section.startswith(prefix):
+                out[i] = priors[prefix]
+                break
+    return out
+
+
+def candidate_signals(
+    query: str,
+    hits: Sequence[Any],
+    priors: dict[str, float] | None = None,
+) -> np.ndarray:
+    """Матрица сигналов (len(hits), 4) в порядке SIGNALS."""
+    payloads = [getattr(h, "payload", None) or {} for h in hits]
+    query_ids = token_ids(query)
+    # token_ids пишет индексатор; для старых точек — токенизация content
+    content_ids = [
+        p["token_ids"] if p.get("token_ids") is not None else token_ids((p.get("content") or "").strip())
+        for p in payloads
+    ]
+    signals = np.empty((len(hits), len(SIGNALS)), dtype=np.float32)
+    signals[:, 0] = [float(getattr(h, "score", 0.0) or 0.0) for h in hits]
+    signals[:, 1] = overlap(query_ids, content_ids)
+    signals[:, 2] = overlap(query_ids, [token_ids(p.get("heading") or "") for p in payloads])
+    signals[:, 3] = source_priors(payloads, priors)
+    return signals
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Индексы k лучших скоров по убыванию; при равенстве — исходный порядок (как стабильная сортировка)."""
+    n = scores.shape[0]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.arange(n) if k == n else np.argpartition(-scores, k - 1)[:k]
+    return idx[np.lexsort((idx, -scores[idx]))]
+
+
+def rerank(
+    query: str,
+    hits: Sequence[Any],
+    weights: Weights,
+    k: int | None = None,
+    priors: dict[str, float] | None = None,
+) -> list[Any]:
+    """Хиты по убыванию signals @ weights, не больше k."""
+    if not hits:
+        return []
+    scores = candidate_signals(query, hits, priors) @ weights.array()
+    return [hits[i] for i in top_k(scores, len(hits) if k is None else k)]
+
+
+def stack(signal_list: Sequence[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Сигналы нескольких запросов → тензор (Q, N, 4) с дополнением нулями и маска настоящих кандидатов (Q, N)."""
+    q = len(signal_list)
+    n = max((s.shape[0] for s in signal_list), default=0)
+    tensor = np.zeros((q, n, len(SIGNALS)), dtype=np.float32)
+    mask = np.zeros((q, n), dtype=bool)
+    for i, s in enumerate(signal_list):
+        tensor[i, : s.shape[0]] = s
+        mask[i, : s.shape[0]] = True
+    return tensor, mask
+
+
+def sweep_positions(
+    tensor: np.ndarray,
+    mask: np.ndarray,
+    relevant: np.ndarray,
+    weight_grid: np.ndarray,
+) -> np.ndarray:
+    """
+    Позиция (1-based) лучшего релевантного кандидата для каждой комбинации весов и запроса: (W, Q), 0 — не найден.
+    tensor (Q, N, 4), mask и relevant (Q, N), weight_grid (W, 4). Равные скоры — в пользу более раннего кандидата.
+    """
+    scores = np.einsum("qns,ws->wqn", tensor, weight_grid.astype(np.float32))
+    scores = np.where(mask[None], scores, -np.inf)
+    rel = relevant & mask
+    rel_scores = np.where(rel[None], scores, -np.inf)
+    best = rel_scores.argmax(axis=2)  # первый релевантный среди лучших
+    best_score = np.take_along_axis(rel_scores, best[..., None], axis=2)
+    n = scores.shape[2]
+    order = np.arange(n)[None, None, :]
+    ahead = (scores > best_score) | ((scores == best_score) & (order < best[..., None]))
+    positions = ahead.sum(axis=2) + 1
+    return np.where(rel.any(axis=1)[None], positions, 0)
@@ -0,0 +1,79 @@
+"""
+Структурированные результаты поиска: SearchHit вместо готового текста.
+
+Потребители (бэкенд, MCP, скрипты) работают с полями хита — id, скоры по сигналам, раздел, источник,
+заголовок, текст и позиции совпадений с запросом; текст для LLM/MCP собирает отдельный render_hits()
+с кэшем, так что повторный рендер тех же хитов ничего не стоит.
+"""
+from __future__ import annotations
+
+import functools
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Sequence
+
+RENDER_CACHE_SIZE = int(os.environ.get("RENDER_CACHE_SIZE", "256"))
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass(frozen=True, slots=True)
+class SearchHit:
+    """
+    Один результат поиска. score — итоговый скор ранжирования; scores — сигналы, из которых он получен
+    (vector или rrf, keyword, heading, source, cross_encoder). matches — позиции (start, end) слов запроса в content.
+    Хешируется по id, score и тексту (scores и matches в сравнении не участвуют).
+    """
+
+    id: Any
+    score: float
+    section: str
+    source: str
+    heading: str
+    content: str
+    scores: dict[str, float] = field(default_factory=dict, compare=False)
+    matches: tuple[tuple[int, int], ...] = field(default=(), compare=False)
+
+
+def match_spans(query: str, content: str) -> tuple[tuple[int, int], ...]:
+    """Позиции слов content, совпадающих (без учёта регистра) со словами запроса."""
+    words = {w.lower() for w in _WORD_RE.findall(query)}
+    if not words:
+        return ()
+    return tuple(m.span() for m in _WORD_RE.finditer(content) if m.group().lower() in words)
+
+
+def hit_from_point(query: str, point: Any, score: float, scores: dict[str, float]) -> SearchHit:
+    """SearchHit из точки Qdrant (ScoredPoint или аналог с id и payload)."""
+    payload = getattr(point, "payload", None) or {}
+    content = (payload.get("content") or "").strip()
+    return SearchHit(
+        id=getattr(point, "id", None),
+        score=float(score),
+        section=payload.get("section") or "",
+        source=payload.get("source") or "",
+        heading=payload.get("heading") or "",
+        content=content,
+        scores=scores,
+        matches=match_spans(query, content),
+    )
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render(query: str, hits: tuple[SearchHit, ...]) -> str:
+    if not hits:
+        return f"По запросу «{query}» ничего не найдено."
+    lines = [f"Результаты по запросу «{query}»:\n"]
+    for i, hit in enumerate(hits, 1):
+        lines.append(f"{i}. (score: {hit.score:.3f}) {hit.section}")
+        lines.append(f"   Источник: {hit.source}")
+        if hit.content:
+            lines.append(f"   Текст: {hit.content}")
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+def render_hits(query: str, hits: Sequence[SearchHit]) -> str:
+    """Текст с нумерованными результатами (section, source, content) для LLM/MCP."""
+    return _render(query.strip(), tuple(hits))
@@ -1,28 +1,83 @@
 """
 Поиск по базе знаний (Qdrant): эмбеддинг запроса, векторный поиск, ре-ранжирование.
 Используется MCP-сервером и веб-бэкендом.
+
+search_hits()/asearch_hits() возвращают список SearchHit (rag.results); search()/asearch() — тот же
+результат, отрендеренный в текст для LLM/MCP.
+
+MODEL_SERVER_SOCKET: эмбеддинг и кросс-энкодер считает общий процесс rag.model_server (один на все
+воркеры uvicorn), здесь — только тонкий клиент.
+
+HYBRID_SEARCH=1: плотный поиск и BM25 (разреженный вектор, см. rag.lexical) одним батч-запросом,
+списки объединяются reciprocal rank fusion — точное совпадение термина находится, даже если
+чанка нет в плотном топ-LIMIT_FIRST.
 """
 from __future__ import annotations
 
+import asyncio
+import copy
 import functools
+import json
+import logging
 import os
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
+import numpy as np
+
+from rag import cross_encoder
+from rag.batching import MicroBatcher
+from rag.lexical import SPARSE_VECTOR_NAME, query_vector
+from rag.rerank import SIGNALS, Weights, candidate_signals, rerank, top_k
+from rag.results import SearchHit, hit_from_point, render_hits
+
+logger = logging.getLogger(__name__)
+
 # Конфиг из env
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
 COLLECTION_NAME = os.environ.get("COLLECTION_NAME", "papers")
 VECTOR_NAME = "fast-all-minilm-l6-v2"
+# Ключ метаданных коллекции, куда индексатор пишет поколение индекса
+INDEX_GENERATION_KEY = "index_generation"
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
 LIMIT_FIRST = int(os.environ.get("LIMIT_FIRST", "20"))
 LIMIT_FINAL = int(os.environ.get("LIMIT_FINAL", "5"))
 RERANK_ALPHA = float(os.environ.get("RERANK_ALPHA", "0.6"))
+# Дополнительные сигналы реранка (rag.rerank): совпадение с заголовком и априорный вес раздела
+RERANK_HEADING_WEIGHT = float(os.environ.get("RERANK_HEADING_WEIGHT", "0"))
+RERANK_SOURCE_WEIGHT = float(os.environ.get("RERANK_SOURCE_WEIGHT", "0"))
+# JSON {"префикс section": вес}, например {"api": 1.0}
+RERANK_SOURCE_PRIORS: dict[str, float] = json.loads(os.environ.get("RERANK_SOURCE_PRIORS") or "{}")
 CACHE_MAX_SIZE = int(os.environ.get("CACHE_MAX_SIZE", "200"))
 USE_CROSS_ENCODER = os.environ.get("USE_CROSS_ENCODER", "").lower() in ("1", "true", "yes")
+# Гибридный поиск: нужна коллекция с разреженным вектором bm25 (scripts/index_to_qdrant.py --full)
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "").lower() in ("1", "true", "yes")
+LIMIT_SPARSE = int(os.environ.get("LIMIT_SPARSE", str(LIMIT_FIRST)))
+RRF_K = int(os.environ.get("RRF_K", "60"))
+# Микро-батчинг эмбеддинга запросов: окно ожидания (мс) и максимальный размер батча (1 — без батчинга)
+EMBED_BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", "32"))
+# Потоки для CPU-работы asearch (эмбеддинг, кросс-энкодер), чтобы не занимать default executor
+SEARCH_EXECUTOR_WORKERS = int(os.environ.get("SEARCH_EXECUTOR_WORKERS", "4"))
+# Unix-сокет общего сервера моделей (python -m rag.model_server); пусто — модели в этом процессе
+MODEL_SERVER_SOCKET = os.environ.get("MODEL_SERVER_SOCKET", "")
+MODEL_SERVER_TIMEOUT_SEC = float(os.environ.get("MODEL_SERVER_TIMEOUT_SEC", "30"))
+# Прогрев при старте: пробный запрос и пауза между повторами, пока Qdrant/модель недоступны
+WARMUP_QUERY = os.environ.get("WARMUP_QUERY", "Как загрузить видео?")
+WARMUP_RETRY_MAX_SEC = float(os.environ.get("WARMUP_RETRY_MAX_SEC", "30"))
 
 _embedder: Any = None
 _qdrant_client: Any = None
-_cross_encoder: Any = None
+_async_qdrant_client: Any = None
+_search_executor: ThreadPoolExecutor | None = None
+_query_batcher: MicroBatcher | None = None
+_query_batcher_lock = threading.Lock()
+_model_client: Any = None
+_model_client_lock = threading.Lock()
+_warm_state: dict[str, Any] = {"ready": False, "attempts": 0, "error": None, "timings_ms": {}}
 
 
 def _get_embedder() -> Any:
@@ -41,6 +96,35 @@ def _get_qdrant_client() -> Any:
     return _qdrant_client
 
 
+def _get_async_qdrant_client() -> Any:
+    global _async_qdrant_client
+    if _async_qdrant_client is None:
+        from qdrant_client import AsyncQdrantClient
+        _async_qdrant_client = AsyncQdrantClient(url=QDRANT_URL)
+    return _async_qdrant_client
+
+
+def _get_model_client() -> Any:
+    global _model_client
+    if _model_client is None:
+        with _model_client_lock:
+            if _model_client is None:
+                from rag.model_server import ModelClient
+
+                _model_client = ModelClient(MODEL_SERVER_SOCKET, timeout=MODEL_SERVER_TIMEOUT_SEC)
+    return _model_client
+
+
+def _get_search_executor() -> ThreadPoolExecutor:
+    global _search_executor
+    if _search_executor is None:
+        _search_executor = ThreadPoolExecutor(
+            max_workers=max(1, SEARCH_EXECUTOR_WORKERS),
+            thread_name_prefix="rag-search",
+        )
+    return _search_executor
+
+
 def _tokenize(text: str) -> set[str]:
     return set(re.findall(r"\w+", text.lower()))
 
@@ -57,17 +141,11 @@ def _rerank_by_keyword(
     query: str,
     hits: list[Any],
     alpha: float = RERANK_ALPHA,
+    limit: int | None = None,
 ) -> list[Any]:
-    scored: list[tuple[float, Any]] = []
-    for hit in hits:
-        payload = getattr(hit, "payload", None) or {}
-        content = (payload.get("content") or "").strip()
-        vec_score = float(getattr(hit, "score", 0.0))
-        kw_score = _keyword_score(query, content)
-        combined = alpha * vec_score + (1.0 - alpha) * kw_score
-        scored.append((combined, hit))
-    scored.sort(key=lambda x: -x[0])
-    return [hit for _, hit in scored]
+    """alpha * vector + (1 - alpha) * keyword (+ заголовок и раздел с весами из env), см. rag.rerank."""
+    weights = Weights.from_alpha(alpha, RERANK_HEADING_WEIGHT, RERANK_SOURCE_WEIGHT)
+    return rerank(query, hits, weights, limit, RERANK_SOURCE_PRIORS)
 
 
 def _rerank_by_cross_encoder(
@@ -75,31 +153,333 @@ def _rerank_by_cross_encoder(
     hits: list[Any],
     limit: int = LIMIT_FINAL,
 ) -> list[Any]:
-    global _cross_encoder
-    if _cross_encoder is None:
-        try:
-            from sentence_transformers import CrossEncoder
-            _cross_encoder = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-        except Exception:
-            return _rerank_by_keyword(query, hits)[:limit]
-    payloads = [getattr(h, "payload", None) or {} for h in hits]
-    contents = [(p.get("content") or "").strip() for p in payloads]
-    pairs = [(query, c) for c in contents]
-    scores = _cross_encoder.predict(pairs)
-    scored = list(zip(scores, hits))
-    scored.sort(key=lambda x: -float(x[0]))
-    return [h for _, h in scored[:limit]]
+    """
+    Кросс-энкодер (rag.cross_encoder): пары батчатся с другими запросами; если все кандидаты
+    не укладываются в бюджет задержки, оцениваются только первые по первичному ранжированию.
+    """
+    return _cross_encoder_ranking(query, hits, limit)[0]
+
+
+def _cross_encoder_ranking(query: str, hits: list[Any], limit: int) -> tuple[list[Any], np.ndarray | None]:
+    """(хиты по скору кросс-энкодера, их скоры); при недоступной модели — keyword-реранк и None."""
+    try:
+        if MODEL_SERVER_SOCKET:
+            # Бюджет применяет сервер моделей: скоры только для первых кандидатов
+            contents = [((getattr(h, "payload", None) or {}).get("content") or "").strip() for h in hits]
+            scores = np.asarray(_get_model_client().rerank(query, contents, limit), dtype=np.float32)
+            candidates = hits[: len(scores)]
+        else:
+            cap = cross_encoder.candidate_cap(limit)
+            candidates = hits[:cap] if cap is not None and cap < len(hits) else hits
+            cross_encoder.note_request(capped=len(candidates) < len(hits))
+            contents = [((getattr(h, "payload", None) or {}).get("content") or "").strip() for h in candidates]
+            scores = cross_encoder.score(query, contents)
+    except Exception as e:
+        logger.warning("cross-encoder unavailable, falling back to keyword rerank: %s", e)
+        return _rerank_by_keyword(query, hits, limit=limit), None
+    order = top_k(scores, limit)
+    return [candidates[i] for i in order], scores[order]
+
+
+def load_cross_encoder() -> bool:
+    """Загрузить и прогреть кросс-энкодер заранее (при старте), если USE_CROSS_ENCODER. False — не загружен."""
+    if not USE_CROSS_ENCODER:
+        return False
+    if MODEL_SERVER_SOCKET:
+        return True  # модель держит сервер моделей
+    try:
+        cross_encoder.load()
+    except Exception as e:
+        logger.warning("cross-encoder %s not loaded: %s", cross_encoder.CROSS_ENCODER_MODEL, e)
+        return False
+    return True
+
+
+def cross_encoder_stats() -> dict[str, Any]:
+    """Метрики кросс-энкодера: модель, стоимость пары, ограничения по бюджету, батчи."""
+    if not USE_CROSS_ENCODER:
+        return {"enabled": False}
+    if MODEL_SERVER_SOCKET:
+        return {"enabled": True, **_model_server_stats("cross_encoder")}
+    return {"enabled": True, **cross_encoder.stats()}
+
+
+def _embed_batch(texts: list[str]) -> list[tuple[float, ...]]:
+    """Эмбеддинг батча текстов одним вызовом модели (повторы внутри батча считаются один раз)."""
+    unique = list(dict.fromkeys(texts))
+    vectors = _get_embedder().embed(unique, batch_size=max(1, len(unique)))
+    by_text: dict[str, tuple[float, ...]] = {}
+    for text, v in zip(unique, vectors):
+        by_text[text] = tuple(v.tolist() if hasattr(v, "tolist") else v)
+    return [by_text[t] for t in texts]
+
+
+def _get_query_batcher() -> MicroBatcher:
+    global _query_batcher
+    if _query_batcher is None:
+        with _query_batcher_lock:
+            if _query_batcher is None:
+                _query_batcher = MicroBatcher(
+                    _embed_batch,
+                    window_ms=EMBED_BATCH_WINDOW_MS,
+                    max_batch=EMBED_BATCH_MAX_SIZE,
+                    name="query-embedder",
+                )
+    return _query_batcher
+
+
+def _model_server_stats(section: str) -> dict[str, Any]:
+    try:
+        stats = _get_model_client().stats()[section]
+    except Exception as e:
+        return {"model_server": MODEL_SERVER_SOCKET, "error": str(e)}
+    return {"model_server": MODEL_SERVER_SOCKET, **stats}
+
+
+def embedding_stats() -> dict[str, Any]:
+    """Метрики батчера эмбеддинга запросов: глубина очереди, размеры батчей."""
+    if MODEL_SERVER_SOCKET:
+        return _model_server_stats("embedding")
+    if EMBED_BATCH_MAX_SIZE <= 1:
+        return {"batching": False}
+    return {"batching": True, **_get_query_batcher().stats()}
 
 
 @functools.lru_cache(maxsize=CACHE_MAX_SIZE)
 def _embed_query_cached(query: str) -> tuple[float, ...]:
-    vectors = list(_get_embedder().embed([query]))
-    v = vectors[0]
-    if hasattr(v, "tolist"):
-        v = v.tolist()
+    if MODEL_SERVER_SOCKET:
+        return tuple(_get_model_client().embed([query])[0])
+    if EMBED_BATCH_MAX_SIZE <= 1:
+        return _embed_batch([query])[0]
+    return _get_query_batcher().run(query)
+
+
+def embed_query(query: str) -> tuple[float, ...]:
+    """Эмбеддинг запроса (тот же кэш и батчер, что у search())."""
+    return _embed_query_cached(query.strip())
+
+
+def collection_generation() -> Any:
+    """
+    «Поколение» коллекции для инвалидации кэшей: index_generation из метаданных коллекции — индексатор
+    пишет новое значение после каждого успешного запуска. Без метаданных (Qdrant < 1.16) — число точек.
+    """
+    info = _get_qdrant_client().get_collection(COLLECTION_NAME)
+    metadata = getattr(info.config, "metadata", None) or {}
+    generation = metadata.get(INDEX_GENERATION_KEY)
+    if generation is not None:
+        return generation
+    return int(getattr(info, "points_count", 0) or 0)
+
+
+def _with_score(hit: Any, score: float) -> Any:
+    if hasattr(hit, "model_copy"):
+        return hit.model_copy(update={"score": score})
+    hit = copy.copy(hit)
+    hit.score = score
+    return hit
+
+
+def _rrf_fuse(result_lists: list[list[Any]], k: int = RRF_K, limit: int | None = None) -> list[Any]:
+    """
+    Reciprocal rank fusion: скор точки = сумма 1 / (k + ранг) по спискам, где она есть.
+    Точки сравниваются по id; у результата score — RRF-скор.
+    """
+    fused: dict[Any, float] = {}
+    first: dict[Any, Any] = {}
+    for hits in result_lists:
+        for rank, hit in enumerate(hits, 1):
+            pid = getattr(hit, "id", None)
+            fused[pid] = fused.get(pid, 0.0) + 1.0 / (k + rank)
+            first.setdefault(pid, hit)
+    order = sorted(fused, key=lambda pid: -fused[pid])
+    if limit is not None:
+        order = order[:limit]
+    return [_with_score(first[pid], fused[pid]) for pid in order]
+
+
+def _query_requests(q: str, v: list[float], lf: int, hybrid: bool) -> list[Any]:
+    """Запросы для query_batch_points: плотный и (в гибридном режиме) BM25."""
+    from qdrant_client.models import QueryRequest, SparseVector
+
+    requests = [QueryRequest(query=v, using=VECTOR_NAME, limit=lf, with_payload=True)]
+    if hybrid:
+        indices, values = query_vector(q)
+        if indices:
+            requests.append(
+                QueryRequest(
+                    query=SparseVector(indices=indices, values=values),
+                    using=SPARSE_VECTOR_NAME,
+                    limit=LIMIT_SPARSE,
+                    with_payload=True,
+                )
+            )
+    return requests
+
+
+def _fuse_responses(responses: list[Any], lf: int) -> list[Any]:
+    lists = [getattr(r, "points", []) or [] for r in responses]
+    if len(lists) == 1:
+        return lists[0]
+    return _rrf_fuse(lists, RRF_K, limit=lf)
+
+
+def _resolve_params(
+    limit_first: int | None,
+    limit_final: int | None,
+    alpha: float | None,
+    use_cross_encoder: bool | None,
+) -> tuple[int, int, float, bool]:
+    return (
+        limit_first if limit_first is not None else LIMIT_FIRST,
+        limit_final if limit_final is not None else LIMIT_FINAL,
+        alpha if alpha is not None else RERANK_ALPHA,
+        use_cross_encoder if use_cross_encoder is not None else USE_CROSS_ENCODER,
+    )
+
+
+def _rank(q: str, results: list[Any], lfinal: int, a: float, use_ce: bool, hybrid: bool = False) -> list[SearchHit]:
+    """
+    Ре-ранжирование кандидатов → SearchHit. Сигналы (rag.rerank) пересчитываются только для
+    финальных хитов, чтобы отдать их в scores; итоговый score — тот, по которому хиты упорядочены.
+    """
+    ce_scores = None
+    if use_ce:
+        ranked, ce_scores = _cross_encoder_ranking(q, results, lfinal)
+    elif hybrid:
+        # Лексический сигнал уже учтён BM25 в RRF
+        ranked = results[:lfinal]
+    else:
+        ranked = _rerank_by_keyword(q, results, alpha=a, limit=lfinal)
+    if not ranked:
+        return []
+    signals = candidate_signals(q, ranked, RERANK_SOURCE_PRIORS)
+    combined = signals @ Weights.from_alpha(a, RERANK_HEADING_WEIGHT, RERANK_SOURCE_WEIGHT).array()
+    names = ("rrf" if hybrid else "vector",) + SIGNALS[1:]
+    hits: list[SearchHit] = []
+    for i, point in enumerate(ranked):
+        scores = dict(zip(names, signals[i].tolist()))
+        if ce_scores is not None:
+            scores["cross_encoder"] = float(ce_scores[i])
+            final = scores["cross_encoder"]
+        else:
+            final = float(signals[i, 0] if hybrid else combined[i])
+        hits.append(hit_from_point(q, point, final, scores))
+    return hits
+
+
+def _elapsed_ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000.0, 2)
+
+
+def retrieve(query: str, limit_first: int | None = None, timings: dict[str, float] | None = None) -> list[Any]:
+    """
+    Кандидаты до ре-ранжирования (точки Qdrant): плотный поиск или гибрид с RRF.
+    timings — если задан, туда пишется время стадий embed и qdrant (мс).
+    """
+    q = query.strip()
+    lf = limit_first if limit_first is not None else LIMIT_FIRST
+    client = _get_qdrant_client()
+    t0 = time.perf_counter()
+    v = list(_embed_query_cached(q))
+    t1 = time.perf_counter()
+    if HYBRID_SEARCH:
+        responses = client.query_batch_points(
+            collection_name=COLLECTION_NAME, requests=_query_requests(q, v, lf, hybrid=True)
+        )
+        results = _fuse_responses(responses, lf)
+    else:
+        response = client.query_points(
+            collection_name=COLLECTION_NAME,
+            query=v,
+            using=VECTOR_NAME,
+            limit=lf,
+            with_payload=True,
+        )
+        results = getattr(response, "points", []) or []
+    if timings is not None:
+        timings["embed"] = round((t1 - t0) * 1000.0, 2)
+        timings["qdrant"] = _elapsed_ms(t1)
+    return results
+
+
+async def aretrieve(query: str, limit_first: int | None = None, timings: dict[str, float] | None = None) -> list[Any]:
+    """retrieve() через AsyncQdrantClient; эмбеддинг — в пуле потоков SEARCH_EXECUTOR_WORKERS."""
+    q = query.strip()
+    lf = limit_first if limit_first is not None else LIMIT_FIRST
+    loop = asyncio.get_running_loop()
+    t0 = time.perf_counter()
+    v = list(await loop.run_in_executor(_get_search_executor(), _embed_query_cached, q))
+    t1 = time.perf_counter()
+    client = _get_async_qdrant_client()
+    if HYBRID_SEARCH:
+        responses = await client.query_batch_points(
+            collection_name=COLLECTION_NAME, requests=_query_requests(q, v, lf, hybrid=True)
+        )
+        results = _fuse_responses(responses, lf)
     else:
-        v = list(v)
-    return tuple(v)
+        response = await client.query_points(
+            collection_name=COLLECTION_NAME,
+            query=v,
+            using=VECTOR_NAME,
+            limit=lf,
+            with_payload=True,
+        )
+        results = getattr(response, "points", []) or []
+    if timings is not None:
+        timings["embed"] = round((t1 - t0) * 1000.0, 2)
+        timings["qdrant"] = _elapsed_ms(t1)
+    return results
+
+
+def search_hits(
+    query: str,
+    limit_first: int | None = None,
+    limit_final: int | None = None,
+    alpha: float | None = None,
+    use_cross_encoder: bool | None = None,
+    timings: dict[str, float] | None = None,
+) -> list[SearchHit]:
+    """
+    Синхронный поиск: эмбеддинг (с кэшем) + Qdrant + ре-ранжирование → список SearchHit.
+    timings — если задан, туда пишется время стадий embed, qdrant, rerank (мс).
+    """
+    q = query.strip()
+    lf, lfinal, a, use_ce = _resolve_params(limit_first, limit_final, alpha, use_cross_encoder)
+    results = retrieve(q, lf, timings)
+    t0 = time.perf_counter()
+    hits = _rank(q, results, lfinal, a, use_ce, HYBRID_SEARCH) if results else []
+    if timings is not None:
+        timings["rerank"] = _elapsed_ms(t0)
+    return hits
+
+
+async def asearch_hits(
+    query: str,
+    limit_first: int | None = None,
+    limit_final: int | None = None,
+    alpha: float | None = None,
+    use_cross_encoder: bool | None = None,
+    timings: dict[str, float] | None = None,
+) -> list[SearchHit]:
+    """
+    Асинхронный поиск: то же, что search_hits(), но запрос к Qdrant идёт через AsyncQdrantClient,
+    а эмбеддинг и кросс-энкодер — в ограниченном пуле потоков (SEARCH_EXECUTOR_WORKERS).
+    """
+    q = query.strip()
+    lf, lfinal, a, use_ce = _resolve_params(limit_first, limit_final, alpha, use_cross_encoder)
+    results = await aretrieve(q, lf, timings)
+    t0 = time.perf_counter()
+    if not results:
+        hits: list[SearchHit] = []
+    elif use_ce:
+        loop = asyncio.get_running_loop()
+        hits = await loop.run_in_executor(_get_search_executor(), _rank, q, results, lfinal, a, use_ce, HYBRID_SEARCH)
+    else:
+        hits = _rank(q, results, lfinal, a, use_ce, HYBRID_SEARCH)
+    if timings is not None:
+        timings["rerank"] = _elapsed_ms(t0)
+    return hits
 
 
 def search(
@@ -113,39 +493,76 @@ def search(
     Синхронный поиск: эмбеддинг (с кэшем) + Qdrant + ре-ранжирование.
     Возвращает текст с нумерованными результатами (section, source, content).
     """
-    q = query.strip()
-    lf = limit_first if limit_first is not None else LIMIT_FIRST
-    lfinal = limit_final if limit_final is not None else LIMIT_FINAL
-    a = alpha if alpha is not None else RERANK_ALPHA
-    use_ce = use_cross_encoder if use_cross_encoder is not None else USE_CROSS_ENCODER
+    return render_hits(query, search_hits(query, limit_first, limit_final, alpha, use_cross_encoder))
 
-    client = _get_qdrant_client()
-    v = list(_embed_query_cached(q))
-    response = client.query_points(
-        collection_name=COLLECTION_NAME,
-        query=v,
-        using=VECTOR_NAME,
-        limit=lf,
-        with_payload=True,
-    )
-    results = getattr(response, "points", []) or []
-    if not results:
-        return f"По запросу «{q}» ничего не найдено."
-    if use_ce:
-        results = _rerank_by_cross_encoder(q, results, limit=lfinal)
+
+async def asearch(
+    query: str,
+    limit_first: int | None = None,
+    limit_final: int | None = None,
+    alpha: float | None = None,
+    use_cross_encoder: bool | None = None,
+) -> str:
+    """Асинхронный search(): asearch_hits() + рендер в текст."""
+    return render_hits(query, await asearch_hits(query, limit_first, limit_final, alpha, use_cross_encoder))
+
+
+def _require_cross_encoder() -> None:
+    # load_cross_encoder() глушит ошибку (поиск тогда ранжирует по ключевым словам); прогрев не должен считать это готовностью
+    if not load_cross_encoder():
+        raise RuntimeError(f"cross-encoder {cross_encoder.CROSS_ENCODER_MODEL} not loaded")
+
+
+def warm_up() -> dict[str, float]:
+    """
+    Синхронный прогрев: модель эмбеддинга (или связь с сервером моделей), пробный эмбеддинг (ONNX), соединение с Qdrant,
+    кросс-энкодер (если включён) и пробный поиск целиком. Возвращает время шагов (мс); ошибки пробрасывает.
+    """
+    timings: dict[str, float] = {}
+
+    def step(name: str, fn: Any) -> None:
+        t0 = time.perf_counter()
+        fn()
+        timings[name] = round((time.perf_counter() - t0) * 1000.0, 1)
+
+    if MODEL_SERVER_SOCKET:
+        step("model_server", _get_model_client().ping)
     else:
-        results = _rerank_by_keyword(q, results, alpha=a)[:lfinal]
-
-    lines = [f"Результаты по запросу «{q}»:\n"]
-    for i, hit in enumerate(results, 1):
-        score = getattr(hit, "score", None)
-        payload = getattr(hit, "payload", None) or {}
-        section = payload.get("section", "")
-        source = payload.get("source", "")
-        content = payload.get("content", "").strip()
-        lines.append(f"{i}. (score: {score:.3f}) {section}")
-        lines.append(f"   Источник: {source}")
-        if content:
-            lines.append(f"   Текст: {content}")
-        lines.append("")
-    return "\n".join(lines).strip()
+        step("embedder_load", _get_embedder)
+    step("embed", lambda: embed_query(WARMUP_QUERY))
+    step("qdrant", lambda: _get_qdrant_client().get_collection(COLLECTION_NAME))
+    if USE_CROSS_ENCODER:
+        step("cross_encoder", _require_cross_encoder)
+    step("search", lambda: search(WARMUP_QUERY, limit_final=1))
+    return timings
+
+
+async def awarm_up() -> dict[str, float]:
+    """
+    Прогрев для приложений на asyncio: warm_up() в пуле потоков + соединение AsyncQdrantClient.
+    Повторяет с растущей паузой, пока не получится (Qdrant может подняться позже приложения).
+    Состояние — warm_status().
+    """
+    loop = asyncio.get_running_loop()
+    delay = 1.0
+    while True:
+        _warm_state["attempts"] += 1
+        try:
+            t0 = time.perf_counter()
+            timings = await loop.run_in_executor(_get_search_executor(), warm_up)
+            await _get_async_qdrant_client().get_collection(COLLECTION_NAME)
+            timings["total"] = round((time.perf_counter() - t0) * 1000.0, 1)
+        except Exception as e:
+            _warm_state["error"] = f"{type(e).__name__}: {e}"
+            logger.warning("warm-up attempt %s failed: %s; retry in %.0fs", _warm_state["attempts"], e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, WARMUP_RETRY_MAX_SEC)
+            continue
+        _warm_state.update(ready=True, error=None, timings_ms=timings)
+        logger.info("warm-up done: %s", timings)
+        return timings
+
+
+def warm_status() -> dict[str, Any]:
+    """{ready, attempts, error, timings_ms} — для /ready."""
+    return dict(_warm_state)
@@ -0,0 +1,82 @@
+"""
+Tests for MicroBatcher: batching of concurrent requests, per-caller results, errors, metrics.
+"""
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from rag.batching import MicroBatcher
+
+
+def test_run_returns_own_result() -> None:
+    batcher = MicroBatcher(lambda items: [x * 2 for x in items], window_ms=1, max_batch=8)
+    try:
+        assert batcher.run(21) == 42
+    finally:
+        batcher.close()
+
+
+def test_concurrent_submits_are_batched() -> None:
+    sizes: list[int] = []
+
+    def fn(items: list[int]) -> list[int]:
+        sizes.append(len(items))
+        return [x + 1 for x in items]
+
+    batcher = MicroBatcher(fn, window_ms=50, max_batch=4)
+    try:
+        futures = batcher.submit_many(range(10))
+        assert [f.result(timeout=5) for f in futures] == list(range(1, 11))
+    finally:
+        batcher.close()
+    assert sum(sizes) == 10
+    assert max(sizes) <= 4
+    assert len(sizes) < 10
+
+
+def test_results_routed_to_callers_across_threads() -> None:
+    batcher = MicroBatcher(lambda items: [f"v:{x}" for x in items], window_ms=20, max_batch=16)
+    results: dict[int, str] = {}
+
+    def worker(i: int) -> None:
+        results[i] = batcher.run(i, timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    batcher.close()
+    assert results == {i: f"v:{i}" for i in range(20)}
+
+
+def test_exception_propagates_to_all_callers() -> None:
+    def fn(items: list[int]) -> list[int]:
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(fn, window_ms=20, max_batch=8)
+    try:
+        futures = batcher.submit_many([1, 2])
+        for f in futures:
+            with pytest.raises(ValueError):
+                f.result(timeout=5)
+        # После ошибки батчер продолжает работать
+        assert batcher.stats()["batches"] >= 1
+    finally:
+        batcher.close()
+
+
+def test_stats() -> None:
+    batcher = MicroBatcher(lambda items: items, window_ms=30, max_batch=5)
+    try:
+        for f in batcher.submit_many(range(5)):
+            f.result(timeout=5)
+    finally:
+        batcher.close()
+    stats = batcher.stats()
+    assert stats["items"] == 5
+    assert stats["queue_depth"] == 0
+    assert stats["max_batch_size_seen"] <= 5
+    assert stats["max_batch"] == 5
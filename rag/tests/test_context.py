@@ -0,0 +1,71 @@
+"""
+Tests for token-budgeted context assembly (rag.context).
+"""
+from __future__ import annotations
+
+from rag.context import build_context, count_tokens, merge_texts
+from rag.results import SearchHit, render_hits
+
+BODY = "\n".join(f"Строка {i}: настройки плеера и загрузка видео, пункт {i}." for i in range(30))
+
+
+def _hit(pid: int, content: str, source: str = "https://docs/a", score: float = 1.0) -> SearchHit:
+    return SearchHit(pid, score, source.rsplit("/", 1)[-1], source, "", content)
+
+
+def test_merge_texts_overlap_and_containment() -> None:
+    a, b = BODY[:600], BODY[500:1100]
+    assert merge_texts(a, b) == BODY[:1100]
+    assert merge_texts(b, a) == BODY[:1100]
+    assert merge_texts(BODY[:600], BODY[100:300]) == BODY[:600]
+    assert merge_texts(BODY[:300], BODY[600:900]) is None
+
+
+def test_overlapping_chunks_of_one_source_are_merged() -> None:
+    hits = [_hit(1, BODY[:600]), _hit(2, "Оплата картой и счёт для юрлиц.", "https://docs/b"), _hit(3, BODY[500:1100])]
+    built = build_context("загрузка видео", hits, max_tokens=10_000)
+    assert built.merged == 1
+    assert [p.hit_ids for p in built.passages] == [[1, 3], [2]]
+    assert built.text.count(BODY[500:600]) == 1
+    assert built.text.index("https://docs/a") < built.text.index("https://docs/b")
+    assert built.saved_tokens > 0
+    assert built.raw_tokens == count_tokens(render_hits("загрузка видео", hits))
+
+
+def test_near_duplicates_are_dropped() -> None:
+    text = "Чтобы добавить видео в плейлист, откройте плейлист и нажмите «Добавить видео»."
+    hits = [_hit(1, text), _hit(2, text + " ", "https://docs/copy")]
+    built = build_context("плейлист", hits, max_tokens=10_000)
+    assert built.deduped == 1
+    assert "https://docs/copy" not in built.text
+
+
+def test_budget_truncates_and_drops() -> None:
+    hits = [_hit(1, BODY), _hit(2, BODY.replace("плеера", "проекта"), "https://docs/b")]
+    built = build_context("видео", hits, max_tokens=200, dedup_threshold=1.1)
+    assert built.tokens <= 200
+    assert built.dropped == 1
+    assert "Строка 0:" in built.text and "Строка 29:" not in built.text
+
+
+def test_empty_hits_render_not_found() -> None:
+    built = build_context("что-то", [])
+    assert built.text == "По запросу «что-то» ничего не найдено."
+    assert built.saved_tokens == 0
+
+
+def test_long_single_line_is_cut_inside_the_line() -> None:
+    line = " ".join(f"Предложение {i} про настройки плеера." for i in range(100))
+    built = build_context("плеер", [_hit(1, line)], max_tokens=200)
+    assert built.passages and built.tokens <= 200
+    assert "Предложение 0 про настройки плеера." in built.text
+    assert built.text.endswith(".")  # по границе предложения, а не посреди слова
+
+
+def test_truncate_falls_back_to_words_without_sentence_breaks() -> None:
+    from rag.context import _truncate
+
+    text = "слово " * 300
+    cut = _truncate(text, 50)
+    assert cut and count_tokens(cut) <= 50
+    assert cut.split() == ["слово"] * len(cut.split())
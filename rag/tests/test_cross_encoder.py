@@ -0,0 +1,87 @@
+"""
+Tests for the batched cross-encoder (rag.cross_encoder) and its use in rag.search reranking.
+"""
+from __future__ import annotations
+
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from rag import cross_encoder
+
+search_mod = sys.modules["rag.search"]
+
+
+class FakeCrossEncoder:
+    """Скор = число слов запроса во фрагменте; запоминает размеры батчей."""
+
+    def __init__(self) -> None:
+        self.batches: list[int] = []
+
+    def rerank_pairs(self, pairs, batch_size: int = 64):
+        self.batches.append(len(pairs))
+        return [float(sum(w in p for w in q.split())) for q, p in pairs]
+
+
+@pytest.fixture
+def fake_model(monkeypatch: pytest.MonkeyPatch) -> FakeCrossEncoder:
+    model = FakeCrossEncoder()
+    monkeypatch.setattr(cross_encoder, "_model", model)
+    monkeypatch.setattr(cross_encoder, "_pair_sec", None)
+    monkeypatch.setattr(cross_encoder, "_batcher", None)
+    monkeypatch.setattr(cross_encoder, "CROSS_ENCODER_BATCH_WINDOW_MS", 20.0)
+    yield model
+    if cross_encoder._batcher is not None:
+        cross_encoder._batcher.close()
+
+
+def _hit(pid: int, content: str) -> SimpleNamespace:
+    return SimpleNamespace(id=pid, score=0.5, payload={"content": content})
+
+
+def test_rerank_orders_by_cross_encoder_score(fake_model: FakeCrossEncoder) -> None:
+    hits = [_hit(1, "оплата"), _hit(2, "субтитры видео"), _hit(3, "видео")]
+    ranked = search_mod._rerank_by_cross_encoder("субтитры видео", hits, limit=2)
+    assert [h.id for h in ranked] == [2, 3]
+
+
+def test_pairs_from_concurrent_requests_share_batches(fake_model: FakeCrossEncoder) -> None:
+    barrier = threading.Barrier(4)
+
+    def worker() -> None:
+        barrier.wait()
+        cross_encoder.score("видео", ["видео", "плеер", "видео плеер"])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(fake_model.batches) == 12
+    assert max(fake_model.batches) > 3
+
+
+def test_latency_budget_caps_candidates(fake_model: FakeCrossEncoder, monkeypatch: pytest.MonkeyPatch) -> None:
+    # 10 мс на пару при бюджете 50 мс — оцениваются только 5 первых кандидатов
+    monkeypatch.setattr(cross_encoder, "CROSS_ENCODER_BUDGET_MS", 50.0)
+    monkeypatch.setattr(cross_encoder, "_pair_sec", 0.010)
+    monkeypatch.setattr(cross_encoder, "_score_pairs", lambda pairs: [0.0] * len(pairs))
+    assert cross_encoder.candidate_cap(3) == 5
+    assert cross_encoder.candidate_cap(8) == 8
+    hits = [_hit(i, "видео") for i in range(20)]
+    monkeypatch.setattr(cross_encoder, "_batcher", None)
+    ranked = search_mod._rerank_by_cross_encoder("видео", hits, limit=3)
+    assert [h.id for h in ranked] == [0, 1, 2]
+    assert cross_encoder.stats()["capped"] >= 1
+
+
+def test_falls_back_to_keyword_rerank_when_model_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+    def broken(query, passages):
+        raise RuntimeError("no model")
+
+    monkeypatch.setattr(cross_encoder, "score", broken)
+    hits = [_hit(1, "оплата"), _hit(2, "субтитры")]
+    ranked = search_mod._rerank_by_cross_encoder("субтитры", hits, limit=1)
+    assert [h.id for h in ranked] == [2]
@@ -0,0 +1,29 @@
+"""
+Tests for the index generation used to invalidate the answer cache.
+"""
+from __future__ import annotations
+
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+search_mod = sys.modules["rag.search"]
+
+
+def _client(metadata: dict | None, points_count: int) -> SimpleNamespace:
+    info = SimpleNamespace(config=SimpleNamespace(metadata=metadata), points_count=points_count)
+    return SimpleNamespace(get_collection=lambda name: info)
+
+
+def test_generation_from_collection_metadata(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Правка страницы: столько же точек, но другой хеш манифеста
+    monkeypatch.setattr(search_mod, "_get_qdrant_client", lambda: _client({"index_generation": "a1"}, 10))
+    before = search_mod.collection_generation()
+    monkeypatch.setattr(search_mod, "_get_qdrant_client", lambda: _client({"index_generation": "b2"}, 10))
+    assert search_mod.collection_generation() != before
+
+
+def test_generation_falls_back_to_point_count(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(search_mod, "_get_qdrant_client", lambda: _client(None, 42))
+    assert search_mod.collection_generation() == 42
@@ -0,0 +1,62 @@
+"""
+Tests for BM25 sparse vectors (rag.lexical) and reciprocal rank fusion in rag.search.
+"""
+from __future__ import annotations
+
+import sys
+import zlib
+from types import SimpleNamespace
+
+from rag.lexical import document_vector, query_vector, token_id, tokenize
+
+search_mod = sys.modules["rag.search"]
+
+
+def test_tokenize_lowercases_words() -> None:
+    assert tokenize("Загрузка ВИДЕО, API-ключ!") == ["загрузка", "видео", "api", "ключ"]
+
+
+def test_token_id_is_stable() -> None:
+    # crc32, не hash(): ID должен совпадать в индексаторе и в поиске
+    assert token_id("видео") == zlib.crc32("видео".encode("utf-8"))
+    assert 0 <= token_id("видео") < 2 ** 32
+    assert token_id("видео") != token_id("плеер")
+
+
+def test_document_vector_bm25_saturation_and_length() -> None:
+    indices, values = document_vector("видео видео видео плеер")
+    assert indices == sorted(indices)
+    weights = dict(zip(indices, values))
+    assert weights[token_id("видео")] > weights[token_id("плеер")]
+    # Насыщение: вес не больше k1 + 1
+    assert all(0 < w < 2.2 for w in values)
+    short = dict(zip(*document_vector("видео плеер")))
+    long_doc = dict(zip(*document_vector("видео плеер " + "слово " * 200)))
+    assert short[token_id("видео")] > long_doc[token_id("видео")]
+
+
+def test_document_vector_empty() -> None:
+    assert document_vector("  ...  ") == ([], [])
+
+
+def test_query_vector_unique_tokens() -> None:
+    indices, values = query_vector("видео видео плеер")
+    assert len(indices) == 2
+    assert values == [1.0, 1.0]
+
+
+def test_rrf_fuse_combines_rankings() -> None:
+    def hit(pid: int, score: float) -> SimpleNamespace:
+        return SimpleNamespace(id=pid, score=score, payload={})
+
+    dense = [hit(1, 0.9), hit(2, 0.8), hit(3, 0.7)]
+    sparse = [hit(3, 12.0), hit(4, 9.0), hit(1, 2.0)]
+    fused = search_mod._rrf_fuse([dense, sparse], k=60)
+    ids = [h.id for h in fused]
+    # 1 и 3 есть в обоих списках — выше тех, что только в одном
+    assert set(ids[:2]) == {1, 3}
+    assert set(ids) == {1, 2, 3, 4}
+    assert fused[0].score == 1 / 61 + 1 / 63
+    assert dense[0].score == 0.9  # исходные хиты не меняются
+    assert len(search_mod._rrf_fuse([dense, sparse], k=60, limit=2)) == 2
+
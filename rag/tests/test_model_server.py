@@ -0,0 +1,108 @@
+"""
+Tests for the shared model server (rag.model_server) and the rag.search client path.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from rag import cross_encoder, model_server
+
+search_mod = sys.modules["rag.search"]
+
+
+class FakeCrossEncoder:
+    def rerank_pairs(self, pairs, batch_size: int = 64):
+        return [float(sum(w in p for w in q.split())) for q, p in pairs]
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch: pytest.MonkeyPatch):
+    embedded: list[list[str]] = []
+
+    def fake_embed_batch(texts: list[str]) -> list[tuple[float, ...]]:
+        embedded.append(list(texts))
+        return [(float(len(t)), 1.0) for t in texts]
+
+    monkeypatch.setattr(search_mod, "_embed_batch", fake_embed_batch)
+    monkeypatch.setattr(search_mod, "EMBED_BATCH_MAX_SIZE", 1)
+    monkeypatch.setattr(cross_encoder, "_model", FakeCrossEncoder())
+    monkeypatch.setattr(cross_encoder, "_pair_sec", None)
+    monkeypatch.setattr(cross_encoder, "_batcher", None)
+    path = os.path.join(str(tmp_path), "models.sock")
+    srv = model_server.ModelServer(path)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    client = model_server.ModelClient(path, timeout=5.0)
+    yield SimpleNamespace(path=path, client=client, embedded=embedded)
+    client.close()
+    srv.shutdown()
+    srv.server_close()
+    if cross_encoder._batcher is not None:
+        cross_encoder._batcher.close()
+
+
+def test_embed_and_rerank_over_socket(server) -> None:
+    assert server.client.ping()
+    assert server.client.embed(["abc", "de"]) == [[3.0, 1.0], [2.0, 1.0]]
+    scores = server.client.rerank("субтитры видео", ["оплата", "субтитры видео", "видео"], limit=2)
+    assert scores == [0.0, 2.0, 1.0]
+    assert "cross_encoder" in server.client.stats()
+
+
+def test_server_errors_are_raised_on_client(server) -> None:
+    with pytest.raises(model_server.ModelServerError, match="unknown op"):
+        server.client._call({"op": "nope"})
+
+
+def test_unavailable_server_raises(tmp_path) -> None:
+    client = model_server.ModelClient(os.path.join(str(tmp_path), "missing.sock"))
+    with pytest.raises(model_server.ModelServerError):
+        client.ping()
+
+
+def test_search_uses_model_server(server, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(search_mod, "MODEL_SERVER_SOCKET", server.path)
+    monkeypatch.setattr(search_mod, "_model_client", server.client)
+    search_mod._embed_query_cached.cache_clear()
+    # Эмбеддинг считает сервер (в тесте — тот же процесс, но через сокет)
+    assert search_mod.embed_query("  видео ") == (5.0, 1.0)
+    assert server.embedded == [["видео"]]
+    hits = [
+        SimpleNamespace(id=1, score=0.5, payload={"content": "оплата"}),
+        SimpleNamespace(id=2, score=0.5, payload={"content": "субтитры видео"}),
+    ]
+    ranked = search_mod._rerank_by_cross_encoder("субтитры видео", hits, limit=1)
+    assert [h.id for h in ranked] == [2]
+    search_mod._embed_query_cached.cache_clear()
+
+
+def test_timeout_on_reused_connection_is_not_resent(server, monkeypatch: pytest.MonkeyPatch) -> None:
+    assert server.client.ping()  # соединение в пуле
+    calls = {"n": 0}
+    real_handle = model_server.handle_request
+
+    def slow_handle(request):
+        calls["n"] += 1
+        time.sleep(0.5)
+        return real_handle(request)
+
+    monkeypatch.setattr(model_server, "handle_request", slow_handle)
+    server.client.timeout = 0.1
+    server.client._pool.queue[0].settimeout(0.1)
+    with pytest.raises(model_server.ModelServerError):
+        server.client.ping()
+    time.sleep(0.6)
+    assert calls["n"] == 1
+
+
+def test_reset_connection_is_retried_once(server) -> None:
+    assert server.client.ping()
+    stale = server.client._pool.queue[0]
+    stale.shutdown(2)  # как если бы сервер перезапустили: EOF на старом соединении
+    assert server.client.ping()
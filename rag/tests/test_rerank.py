@@ -0,0 +1,82 @@
+"""
+Tests for the vectorized rerank engine (rag.rerank): keyword overlap, weights, top-k, weight sweeps.
+"""
+from __future__ import annotations
+
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+from rag.lexical import token_ids
+from rag.rerank import Weights, candidate_signals, overlap, rerank, stack, sweep_positions, top_k
+
+search_mod = sys.modules["rag.search"]
+
+
+def _hit(pid: int, score: float, content: str, heading: str = "", section: str = "", with_ids: bool = True):
+    payload = {"content": content, "heading": heading, "section": section}
+    if with_ids:
+        payload["token_ids"] = token_ids(content)
+    return SimpleNamespace(id=pid, score=score, payload=payload)
+
+
+def test_overlap_matches_regex_keyword_score() -> None:
+    query = "загрузить видео по API"
+    contents = ["Как загрузить видео через API Kinescope: метод upload.", "", "оплата тарифа"]
+    got = overlap(token_ids(query), [token_ids(c) for c in contents])
+    expected = [search_mod._keyword_score(query, c) for c in contents]
+    assert np.allclose(got, expected)
+    assert overlap([], [[1, 2]]).tolist() == [0.0]
+
+
+def test_payload_without_token_ids_falls_back_to_content() -> None:
+    hits = [_hit(1, 0.5, "загрузить видео", with_ids=False), _hit(2, 0.5, "загрузить видео")]
+    signals = candidate_signals("загрузить видео", hits)
+    assert signals[0, 1] == signals[1, 1] == 1.0
+
+
+def test_rerank_matches_python_sort_including_ties() -> None:
+    query = "настроить субтитры"
+    hits = [
+        _hit(1, 0.80, "про плеер"),
+        _hit(2, 0.70, "как настроить субтитры"),
+        _hit(3, 0.80, "про плеер"),
+        _hit(4, 0.60, "субтитры"),
+    ]
+    alpha = 0.6
+    expected = sorted(
+        hits, key=lambda h: -(alpha * h.score + (1 - alpha) * search_mod._keyword_score(query, h.payload["content"]))
+    )
+    assert [h.id for h in rerank(query, hits, Weights.from_alpha(alpha))] == [h.id for h in expected]
+    assert [h.id for h in rerank(query, hits, Weights.from_alpha(alpha), k=2)] == [h.id for h in expected[:2]]
+
+
+def test_heading_and_source_signals() -> None:
+    hits = [_hit(1, 0.5, "текст", heading="DRM шифрование", section="api/drm"), _hit(2, 0.5, "текст", section="faq")]
+    signals = candidate_signals("как работает drm", hits, priors={"api": 0.5, "api/drm": 1.0})
+    assert signals[0, 2] > 0 and signals[1, 2] == 0
+    assert signals[:, 3].tolist() == [1.0, 0.0]
+    assert [h.id for h in rerank("как работает drm", hits, Weights(0, 0, 1, 0))] == [1, 2]
+
+
+def test_top_k_order() -> None:
+    scores = np.array([0.1, 0.9, 0.5, 0.9, 0.3], dtype=np.float32)
+    assert top_k(scores, 3).tolist() == [1, 3, 2]
+    assert top_k(scores, 10).tolist() == [1, 3, 2, 4, 0]
+
+
+def test_sweep_positions_matches_rerank() -> None:
+    rng = np.random.default_rng(0)
+    signal_list = [rng.random((n, 4)).astype(np.float32) for n in (5, 3, 4)]
+    tensor, mask = stack(signal_list)
+    relevant = np.zeros(mask.shape, dtype=bool)
+    relevant[0, 2] = relevant[1, 0] = True  # у третьего запроса релевантных нет
+    grid = np.array([[1, 0, 0, 0], [0.3, 0.7, 0, 0], [0, 0, 1, 0.5]], dtype=np.float32)
+    positions = sweep_positions(tensor, mask, relevant, grid)
+    assert positions.shape == (3, 3)
+    for w, weights in enumerate(grid):
+        for q, (signals, rel_idx) in enumerate(zip(signal_list[:2], (2, 0))):
+            order = top_k(signals @ weights, signals.shape[0]).tolist()
+            assert positions[w, q] == order.index(rel_idx) + 1
+        assert positions[w, 2] == 0
@@ -0,0 +1,58 @@
+"""
+Tests for structured search results (rag.results) and search_hits in rag.search.
+"""
+from __future__ import annotations
+
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+from rag.results import SearchHit, _render, hit_from_point, match_spans, render_hits
+
+search_mod = sys.modules["rag.search"]
+
+
+def _point(pid: int, score: float, content: str, section: str = "docs/video") -> SimpleNamespace:
+    payload = {"content": content, "section": section, "source": f"https://example.com/{pid}", "heading": "Видео"}
+    return SimpleNamespace(id=pid, score=score, payload=payload)
+
+
+def test_search_hit_is_slotted_and_hashable() -> None:
+    hit = hit_from_point("загрузка видео", _point(1, 0.5, " Загрузка видео в плеер "), 0.7, {"vector": 0.5})
+    assert not hasattr(hit, "__dict__")
+    assert hit.content == "Загрузка видео в плеер"
+    assert hit.matches == ((0, 8), (9, 14))
+    # scores не участвуют в сравнении и хеше
+    assert hit == SearchHit(1, 0.7, "docs/video", "https://example.com/1", "Видео", "Загрузка видео в плеер")
+    assert hash(hit) == hash(SearchHit(1, 0.7, "docs/video", "https://example.com/1", "Видео", "Загрузка видео в плеер"))
+
+
+def test_match_spans_ignores_case() -> None:
+    assert match_spans("API", "api и Api") == ((0, 3), (6, 9))
+    assert match_spans("...", "текст") == ()
+
+
+def test_render_hits_is_cached() -> None:
+    hits = [hit_from_point("видео", _point(1, 0.5, "видео"), 0.5, {})]
+    _render.cache_clear()
+    text = render_hits(" видео ", hits)
+    assert text.startswith("Результаты по запросу «видео»")
+    assert "1. (score: 0.500) docs/video" in text
+    assert render_hits("видео", list(hits)) is text
+    assert _render.cache_info().hits == 1
+    assert render_hits("пусто", []) == "По запросу «пусто» ничего не найдено."
+
+
+def test_search_hits_carry_signal_scores(monkeypatch: pytest.MonkeyPatch) -> None:
+    points = [_point(1, 0.9, "оплата подписки"), _point(2, 0.6, "загрузка видео"), _point(3, 0.5, "видео")]
+    monkeypatch.setattr(search_mod, "retrieve", lambda q, lf, timings=None: points)
+    monkeypatch.setattr(search_mod, "HYBRID_SEARCH", False)
+    hits = search_mod.search_hits("загрузка видео", limit_final=2, alpha=0.5, use_cross_encoder=False)
+    assert [h.id for h in hits] == [2, 3]
+    assert hits[0].scores["vector"] == pytest.approx(0.6)
+    assert hits[0].scores["keyword"] == pytest.approx(1.0)
+    assert hits[0].score == pytest.approx(0.5 * 0.6 + 0.5 * 1.0)
+    assert search_mod.search("загрузка видео", limit_final=2, alpha=0.5, use_cross_encoder=False) == render_hits(
+        "загрузка видео", hits
+    )
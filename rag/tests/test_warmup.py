@@ -0,0 +1,66 @@
+"""
+Tests for startup warm-up in rag.search (retries until Qdrant and models are available).
+"""
+from __future__ import annotations
+
+import asyncio
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+search_mod = sys.modules["rag.search"]
+
+
+class FakeAsyncClient:
+    async def get_collection(self, name: str) -> None:
+        return None
+
+
+def test_awarm_up_retries_until_ready(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = {"n": 0}
+
+    def flaky_warm_up() -> dict[str, float]:
+        calls["n"] += 1
+        if calls["n"] < 3:
+            raise ConnectionError("qdrant is not up yet")
+        return {"search": 1.0}
+
+    async def no_sleep(delay: float) -> None:
+        return None
+
+    monkeypatch.setattr(search_mod, "_warm_state", {"ready": False, "attempts": 0, "error": None, "timings_ms": {}})
+    monkeypatch.setattr(search_mod, "warm_up", flaky_warm_up)
+    monkeypatch.setattr(search_mod, "_get_async_qdrant_client", lambda: FakeAsyncClient())
+    monkeypatch.setattr(search_mod.asyncio, "sleep", no_sleep)
+
+    assert not search_mod.warm_status()["ready"]
+    timings = asyncio.run(search_mod.awarm_up())
+    status = search_mod.warm_status()
+    assert status["ready"] and status["attempts"] == 3 and status["error"] is None
+    assert "total" in timings and status["timings_ms"] == timings
+
+
+def test_warm_up_runs_every_stage(monkeypatch: pytest.MonkeyPatch) -> None:
+    seen: list[str] = []
+    monkeypatch.setattr(search_mod, "_get_embedder", lambda: seen.append("embedder"))
+    monkeypatch.setattr(search_mod, "embed_query", lambda q: seen.append("embed"))
+    client = SimpleNamespace(get_collection=lambda name: seen.append("qdrant"))
+    monkeypatch.setattr(search_mod, "_get_qdrant_client", lambda: client)
+    monkeypatch.setattr(search_mod, "USE_CROSS_ENCODER", False)
+    monkeypatch.setattr(search_mod, "search", lambda q, limit_final=None: seen.append("search"))
+    timings = search_mod.warm_up()
+    assert seen == ["embedder", "embed", "qdrant", "search"]
+    assert set(timings) == {"embedder_load", "embed", "qdrant", "search"}
+
+
+def test_warm_up_fails_when_cross_encoder_not_loaded(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(search_mod, "_get_embedder", lambda: None)
+    monkeypatch.setattr(search_mod, "embed_query", lambda q: None)
+    monkeypatch.setattr(search_mod, "_get_qdrant_client", lambda: SimpleNamespace(get_collection=lambda name: None))
+    monkeypatch.setattr(search_mod, "MODEL_SERVER_SOCKET", "")
+    monkeypatch.setattr(search_mod, "USE_CROSS_ENCODER", True)
+    monkeypatch.setattr(search_mod, "load_cross_encoder", lambda: False)
+    monkeypatch.setattr(search_mod, "search", lambda q, limit_final=None: None)
+    with pytest.raises(RuntimeError, match="cross-encoder"):
+        search_mod.warm_up()
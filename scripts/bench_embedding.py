@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк эмбеддинга для индексатора: chunks/sec в зависимости от числа процессов (--workers индексатора).
+Берёт чанки из docs_crawl (как index_to_qdrant.py, без Qdrant), эмбеддит их в текущем процессе и в
+пуле из N процессов, печатает скорость, ускорение и проверяет, что порядок и векторы совпадают с базовым прогоном.
+
+  python scripts/bench_embedding.py --limit 2000 --workers 1,2,4
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from index_to_qdrant import (  # noqa: E402
+    DOCS_DIR,
+    EMBED_BATCH,
+    EMBED_INFLIGHT_PER_WORKER,
+    EMBEDDING_MODEL,
+    EmbedPool,
+    TextEmbedding,
+    iter_chunks,
+    iter_embedded,
+)
+
+
+def load_texts(limit: int) -> list[str]:
+    texts: list[str] = []
+    if DOCS_DIR.exists():
+        for _, item in iter_chunks(DOCS_DIR):
+            texts.append(item["content"])
+            if len(texts) >= limit:
+                break
+    if not texts:
+        print(f"No chunks in {DOCS_DIR}, using synthetic text", file=sys.stderr)
+        texts = [f"Как загрузить видео номер {i} в Kinescope и настроить плеер?" * 8 for i in range(limit)]
+    return texts
+
+
+def run(texts: list[str], workers: int, batch: int) -> tuple[float, np.ndarray]:
+    """Время эмбеддинга (без загрузки модели) и матрица векторов в порядке texts."""
+    batches = [texts[i : i + batch] for i in range(0, len(texts), batch)]
+    if workers <= 1:
+        embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
+        list(embedder.embed(["warm up"]))
+        t0 = time.perf_counter()
+        vectors = [v for _, vs in iter_embedded(batches, lambda b: embedder.embed(b, batch_size=batch)) for v in vs]
+        return time.perf_counter() - t0, np.asarray(vectors)
+    with EmbedPool(workers, batch_size=batch) as pool:
+        pool.warm_up()
+        t0 = time.perf_counter()
+        vectors = [
+            v for _, vs in iter_embedded(batches, pool.submit, workers * EMBED_INFLIGHT_PER_WORKER) for v in vs
+        ]
+        return time.perf_counter() - t0, np.asarray(vectors)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embedding throughput vs number of worker processes.")
+    parser.add_argument("--limit", type=int, default=2000, help="chunks to embed")
+    parser.add_argument("--embed-batch", type=int, default=EMBED_BATCH, help="chunks per embedding call")
+    parser.add_argument(
+        "--workers",
+        default=",".join(str(n) for n in sorted({1, 2, max(1, (os.cpu_count() or 1))})),
+        help="comma-separated worker counts, 1 = in-process",
+    )
+    args = parser.parse_args()
+
+    texts = load_texts(args.limit)
+    counts = [int(n) for n in args.workers.split(",") if n.strip()]
+    print(f"{len(texts)} chunks, batch {args.embed_batch}, cpu {os.cpu_count()}, model {EMBEDDING_MODEL}")
+    print(f"{'workers':>7} {'sec':>8} {'chunks/s':>10} {'speedup':>8}  order")
+
+    base_rate = 0.0
+    base_vectors: np.ndarray | None = None
+    for n in counts:
+        sec, vectors = run(texts, n, args.embed_batch)
+        rate = len(texts) / sec if sec > 0 else 0.0
+        if base_vectors is None:
+            base_rate, base_vectors = rate, vectors
+        same = vectors.shape == base_vectors.shape and np.allclose(vectors, base_vectors, atol=1e-4)
+        speedup = rate / base_rate if base_rate else 0.0
+        print(f"{n:>7} {sec:8.2f} {rate:10.1f} {speedup:7.2f}x  {'ok' if same else 'MISMATCH'}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
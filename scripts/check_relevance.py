@@ -3,120 +3,92 @@
 Проверка релевантности поиска для типовых запросов.
 Загружает тесты из relevance_tests.json, выполняет поиск (как MCP),
 проверяет, что ожидаемый источник в топ-N, выводит отчёт и рекомендации.
+Кандидаты — rag.search.retrieve (тот же эмбеддинг и запрос к Qdrant, что у поиска, включая HYBRID_SEARCH),
+ре-ранжирование — тем же движком (rag.rerank) с весами из params. С HYBRID_SEARCH, как и в rag.search._rank,
+порядок — RRF-слияние без ключевого ре-ранжирования (BM25 уже учтён), веса на позиции не влияют.
+
+--sweep: кандидаты каждого запроса берутся из Qdrant один раз, затем весь перебор весов
+(vector, keyword, heading, source) считается векторно по ним — таблица лучших комбинаций.
+С HYBRID_SEARCH поиск эти веса не применяет, так что таблица гипотетическая: что дало бы
+ключевое ре-ранжирование поверх RRF-кандидатов.
 """
 from __future__ import annotations
 
+import argparse
 import json
-import os
-import re
 import sys
+import time
 from pathlib import Path
 
-# Конфиг (как в MCP-сервере)
-QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
-COLLECTION_NAME = os.environ.get("COLLECTION_NAME", "papers")
-VECTOR_NAME = "fast-all-minilm-l6-v2"
-EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag.rerank import Weights, candidate_signals, rerank, stack, sweep_positions  # noqa: E402
+from rag.search import HYBRID_SEARCH, retrieve  # noqa: E402
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 TESTS_FILE = SCRIPT_DIR / "relevance_tests.json"
 
 
-def _tokenize(text: str) -> set[str]:
-    return set(re.findall(r"\w+", text.lower()))
-
-
-def _keyword_score(query: str, content: str) -> float:
-    q = _tokenize(query)
-    if not q:
-        return 0.0
-    c = _tokenize(content)
-    return len(q & c) / len(q)
-
-
-def run_search(
-    query: str,
-    embedder,
-    client,
-    limit_first: int = 20,
-    limit_final: int = 5,
-    alpha: float = 0.6,
-):
-    """Поиск: эмбеддинг + Qdrant + ре-ранжирование по словам. Возвращает список hit с payload."""
-    vectors = list(embedder.embed([query]))
-    v = vectors[0].tolist() if hasattr(vectors[0], "tolist") else list(vectors[0])
-    response = client.query_points(
-        collection_name=COLLECTION_NAME,
-        query=v,
-        using=VECTOR_NAME,
-        limit=limit_first,
-        with_payload=True,
-    )
-    hits = getattr(response, "points", []) or []
-    if not hits:
-        return []
-    # Ре-ранжирование
-    scored = []
-    for hit in hits:
-        payload = getattr(hit, "payload", None) or {}
-        content = (payload.get("content") or "").strip()
-        vec_s = float(getattr(hit, "score", 0.0))
-        kw_s = _keyword_score(query, content)
-        combined = alpha * vec_s + (1.0 - alpha) * kw_s
-        scored.append((combined, hit))
-    scored.sort(key=lambda x: -x[0])
-    return [hit for _, hit in scored[:limit_final]]
-
-
-def run_search_full(
-    query: str,
-    embedder,
-    client,
-    limit_first: int,
-    alpha: float,
-):
-    """Поиск с ре-ранжированием, возвращает полный список (топ limit_first) для анализа позиций."""
-    vectors = list(embedder.embed([query]))
-    v = vectors[0].tolist() if hasattr(vectors[0], "tolist") else list(vectors[0])
-    response = client.query_points(
-        collection_name=COLLECTION_NAME,
-        query=v,
-        using=VECTOR_NAME,
-        limit=limit_first,
-        with_payload=True,
-    )
-    hits = getattr(response, "points", []) or []
-    scored = []
-    for hit in hits:
-        payload = getattr(hit, "payload", None) or {}
-        content = (payload.get("content") or "").strip()
-        vec_s = float(getattr(hit, "score", 0.0))
-        kw_s = _keyword_score(query, content)
-        combined = alpha * vec_s + (1.0 - alpha) * kw_s
-        scored.append((combined, hit))
-    scored.sort(key=lambda x: -x[0])
-    return [hit for _, hit in scored]
-
-
-def find_expected_position(
-    query: str,
-    embedder,
-    client,
-    expected_contains: str,
-    limit_first: int,
-    alpha: float,
-) -> int | None:
+def is_expected(hit, expected_contains: str) -> bool:
+    payload = getattr(hit, "payload", None) or {}
+    section = (payload.get("section") or "") + " " + (payload.get("source") or "")
+    return expected_contains.lower() in section.lower()
+
+
+def find_expected_position(ranked: list, expected_contains: str) -> int | None:
     """Позиция (1-based) ожидаемого источника после ре-ранжирования, или None."""
-    ranked = run_search_full(query, embedder, client, limit_first, alpha)
     for i, hit in enumerate(ranked, 1):
-        payload = getattr(hit, "payload", None) or {}
-        section = (payload.get("section") or "") + " " + (payload.get("source") or "")
-        if expected_contains.lower() in section.lower():
+        if is_expected(hit, expected_contains):
             return i
     return None
 
 
-def main() -> int:
+def weight_grid(with_priors: bool) -> np.ndarray:
+    """Сетка весов (vector, keyword, heading, source): alpha 0..1 шаг 0.05 × вес заголовка × вес раздела."""
+    alphas = np.round(np.arange(0.0, 1.0001, 0.05), 2)
+    headings = (0.0, 0.1, 0.2, 0.3)
+    sources = (0.0, 0.1, 0.2, 0.3) if with_priors else (0.0,)
+    return np.array(
+        [Weights.from_alpha(float(a), h, src) for a in alphas for h in headings for src in sources],
+        dtype=np.float32,
+    )
+
+
+def sweep(cases: list[tuple[dict, str, list]], priors: dict[str, float] | None, top: int) -> None:
+    """Перебор весов по уже полученным кандидатам: pass-rate и MRR для каждой комбинации."""
+    signal_list = [candidate_signals(query, hits, priors) for _, query, hits in cases]
+    tensor, mask = stack(signal_list)
+    relevant = np.zeros(mask.shape, dtype=bool)
+    for i, (tc, _, hits) in enumerate(cases):
+        for j, hit in enumerate(hits):
+            relevant[i, j] = is_expected(hit, tc.get("expected_section_contains", ""))
+    expected_top = np.array([tc["expected_in_top"] for tc, _, _ in cases])
+    grid = weight_grid(bool(priors))
+    t0 = time.perf_counter()
+    positions = sweep_positions(tensor, mask, relevant, grid)
+    elapsed = time.perf_counter() - t0
+    passed = ((positions > 0) & (positions <= expected_top[None])).sum(axis=1)
+    mrr = np.where(positions > 0, 1.0 / np.maximum(positions, 1), 0.0).mean(axis=1)
+    order = np.lexsort((-mrr, -passed))[:top]
+    if HYBRID_SEARCH:
+        print(
+            "HYBRID_SEARCH: поиск ранжирует по RRF без этих весов — таблица гипотетическая "
+            "(ключевое ре-ранжирование поверх RRF-кандидатов), а не позиции в проде"
+        )
+    print(f"Перебор весов: {len(grid)} комбинаций × {len(cases)} запросов за {elapsed * 1000:.1f} мс")
+    print(f"{'vector':>7} {'keyword':>8} {'heading':>8} {'source':>7} {'passed':>7} {'MRR':>6}")
+    for i in order:
+        w = grid[i]
+        print(f"{w[0]:7.2f} {w[1]:8.2f} {w[2]:8.2f} {w[3]:7.2f} {passed[i]:>4}/{len(cases):<2} {mrr[i]:6.3f}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Check search relevance on relevance_tests.json.")
+    parser.add_argument("--sweep", action="store_true", help="sweep rerank weights over candidates fetched once")
+    parser.add_argument("--top", type=int, default=15, help="weight combinations to print with --sweep")
+    args = parser.parse_args(argv)
+
     if not TESTS_FILE.exists():
         print(f"Файл тестов не найден: {TESTS_FILE}", file=sys.stderr)
         return 1
@@ -129,16 +101,14 @@ def main() -> int:
     limit_first = params.get("limit_first", 20)
     limit_final = params.get("limit_final", 5)
     alpha = params.get("rerank_alpha", 0.6)
+    weights = Weights.from_alpha(alpha, params.get("rerank_heading_weight", 0.0), params.get("rerank_source_weight", 0.0))
+    priors = params.get("source_priors") or None
 
     print("Загрузка модели и подключение к Qdrant...", flush=True)
-    from fastembed import TextEmbedding
-    from qdrant_client import QdrantClient
-
-    embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
-    client = QdrantClient(url=QDRANT_URL)
 
     passed = 0
     failed = []
+    cases: list[tuple[dict, str, list]] = []
 
     for tc in tests:
         tid = tc.get("id", "?")
@@ -150,36 +120,19 @@ def main() -> int:
             print(f"  [{tid}] пропущен: нет query или expected_section_contains")
             continue
 
-        results = run_search(
-            query,
-            embedder,
-            client,
-            limit_first=limit_first,
-            limit_final=limit_final,
-            alpha=alpha,
-        )
-
-        found_at = None
-        for i, hit in enumerate(results, 1):
-            payload = getattr(hit, "payload", None) or {}
-            section = (payload.get("section") or "") + " " + (payload.get("source") or "")
-            if expected_contains.lower() in section.lower():
-                found_at = i
-                break
-
-        if found_at is None:
-            pos_in_full = find_expected_position(
-                query, embedder, client, expected_contains, limit_first, alpha
-            )
-        else:
-            pos_in_full = found_at
+        # Один запрос к Qdrant на тест: полное ранжирование кандидатов, топ limit_final — его начало
+        hits = retrieve(query, limit_first)
+        cases.append(({**tc, "expected_in_top": expected_in_top}, query, hits))
+        if args.sweep:
+            continue
+        # Как rag.search._rank: в гибриде кандидаты уже упорядочены RRF и ключевой ре-ранк не применяется
+        ranked = hits if HYBRID_SEARCH else rerank(query, hits, weights, priors=priors)
+        pos_in_full = find_expected_position(ranked, expected_contains)
+        found_at = pos_in_full if pos_in_full is not None and pos_in_full <= limit_final else None
 
-        if (found_at is not None and found_at <= expected_in_top) or (
-            pos_in_full is not None and pos_in_full <= expected_in_top
-        ):
+        if pos_in_full is not None and pos_in_full <= expected_in_top:
             passed += 1
-            display_pos = found_at if found_at is not None else pos_in_full
-            print(f"  [OK] {tid}: «{query[:50]}...» — ожидаемый источник на месте {display_pos}")
+            print(f"  [OK] {tid}: «{query[:50]}...» — ожидаемый источник на месте {pos_in_full}")
         else:
             failed.append(
                 {
@@ -193,6 +146,10 @@ def main() -> int:
             pos_msg = f" (в топ-{limit_first} на позиции {pos_in_full})" if pos_in_full else " (не найден в топе)"
             print(f"  [FAIL] {tid}: «{query[:50]}...» — ожидаемый источник не в топ-{expected_in_top}{pos_msg}")
 
+    if args.sweep:
+        sweep(cases, priors, args.top)
+        return 0
+
     print()
     print(f"Итого: {passed}/{len(tests)} тестов пройдено.")
     if failed:
@@ -201,7 +158,9 @@ def main() -> int:
         for f in failed:
             tid = f["id"]
             pos = f.get("position_in_candidates")
-            if pos is not None and pos > limit_final:
+            if pos is not None and pos > limit_final and HYBRID_SEARCH:
+                print(f"  - {tid}: ожидаемый результат на позиции {pos} после RRF. Веса ре-ранжирования в гибриде не применяются — проверьте RRF_K и BM25-индекс или отключите HYBRID_SEARCH.")
+            elif pos is not None and pos > limit_final:
                 print(f"  - {tid}: ожидаемый результат на позиции {pos}. Можно снизить RERANK_ALPHA (например до 0.5) в relevance_tests.json params или в env MCP.")
             else:
                 print(f"  - {tid}: ожидаемый раздел не попал в топ-{limit_first}. Проверьте формулировку запроса или добавьте контент в индекс.")
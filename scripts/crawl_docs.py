@@ -2,14 +2,39 @@
 """
 Краул базы знаний https://docs.kinescope.ru/ с сохранением в .md с иерархией.
 Сохраняет страницы в docs_crawl/<path>/index.md по URL.
+
+--async — конкурентный краул на asyncio + httpx (пул соединений): обход в ширину с учётом глубины,
+ограничение числа одновременных запросов и частоты запросов к хосту, повторы с backoff.
+
+Инкрементально: для каждого URL в docs_crawl/.http_cache.json хранятся ETag, Last-Modified, хэш HTML и ссылки.
+Следующий краул шлёт If-None-Match / If-Modified-Since; на 304 или тот же хэш страница не разбирается
+и не перезаписывается (ссылки берутся из кэша). Список изменённых/исчезнувших страниц пишется
+в docs_crawl/.crawl_changes.json — его читает index_to_qdrant.py --changed-only. --no-cache — полный краул.
+
+Очередь URL сразу заполняется из sitemap.xml (если он есть), ссылки со страниц её только дополняют.
+Разбор HTML и конвертация в Markdown в режиме --async идут в пуле процессов параллельно с загрузкой;
+парсер — lxml, если установлен (иначе html.parser). В конце печатается pages/sec стадий fetch, parse, convert.
 """
 from __future__ import annotations
 
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import random
 import re
 import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
 
+import httpx
 import requests
 from bs4 import BeautifulSoup
 from markdownify import markdownify as md
@@ -21,6 +46,23 @@ REQUEST_HEADERS = {
     "Accept": "text/html,application/xhtml+xml",
 }
 CHUNK_SIZE = 8192
+HTTP_CACHE_PATH = OUTPUT_DIR / ".http_cache.json"
+CHANGES_PATH = OUTPUT_DIR / ".crawl_changes.json"
+# Асинхронный режим: одновременных запросов, запросов в секунду на хост, повторы (429/5xx/сеть)
+CONCURRENCY = 8
+RATE_PER_HOST = 5.0
+RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+TIMEOUT = 30.0
+# Процессов для HTML → Markdown (--async); парсер BeautifulSoup: auto = lxml, если установлен
+CONVERT_WORKERS = os.cpu_count() or 1
+HTML_PARSER = "auto"
+SITEMAP_PATH = "/sitemap.xml"
+SITEMAP_MAX_FILES = 50
+_RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Страница удалена с сайта — только по такому ответу (или по исчезновению из sitemap) её .md удаляется
+_GONE_STATUSES = frozenset({404, 410})
 
 
 def normalize_path(url_path: str) -> str:
@@ -30,6 +72,15 @@ def normalize_path(url_path: str) -> str:
     return path.replace("//", "/")
 
 
+def normalize_link(full: str) -> str | None:
+    """Абсолютный URL → BASE_URL + путь без завершающего /; None для чужих хостов."""
+    parsed = urlparse(full)
+    if parsed.netloc != urlparse(BASE_URL).netloc:
+        return None
+    path = parsed.path.rstrip("/") or "/"
+    return BASE_URL + path if path.startswith("/") else None
+
+
 def get_links_from_page(soup: BeautifulSoup, base: str) -> set[str]:
     """Собирает все внутренние ссылки на docs.kinescope.ru."""
     links: set[str] = set()
@@ -37,13 +88,9 @@ def get_links_from_page(soup: BeautifulSoup, base: str) -> set[str]:
         href = a["href"].strip()
         if href.startswith("#") or href.startswith("mailto:") or href.startswith("javascript:"):
             continue
-        full = urljoin(base, href)
-        parsed = urlparse(full)
-        if parsed.netloc != urlparse(BASE_URL).netloc:
-            continue
-        path = parsed.path.rstrip("/") or "/"
-        if path.startswith("/"):
-            links.add(BASE_URL + path)
+        link = normalize_link(urljoin(base, href))
+        if link:
+            links.add(link)
     return links
 
 
@@ -59,21 +106,287 @@ def html_to_markdown(soup: BeautifulSoup) -> str:
     return md(str(main), heading_style="ATX", strip=["a"])
 
 
-def fetch_page(url: str) -> str | None:
-    """Загружает HTML страницы."""
+def resolve_parser(name: str = HTML_PARSER) -> str:
+    """auto → lxml, если установлен, иначе встроенный html.parser."""
+    if name != "auto":
+        return name
+    try:
+        import lxml  # noqa: F401
+    except ImportError:
+        return "html.parser"
+    return "lxml"
+
+
+def convert_page(html: str, url: str, parser: str = "html.parser") -> tuple[set[str], str, float, float]:
+    """
+    Ссылки и Markdown страницы + время разбора и конвертации (сек).
+    Функция верхнего уровня от строки HTML — выполняется в пуле процессов.
+    """
+    t0 = time.perf_counter()
+    soup = BeautifulSoup(html, parser)
+    links = get_links_from_page(soup, url)
+    t1 = time.perf_counter()
+    content_md = html_to_markdown(soup)
+    return links, content_md, t1 - t0, time.perf_counter() - t1
+
+
+class CrawlStats:
+    """Страницы и время работы по стадиям fetch / parse / convert."""
+
+    STAGES = ("fetch", "parse", "convert")
+
+    def __init__(self) -> None:
+        self.items = {name: 0 for name in self.STAGES}
+        self.busy_sec = {name: 0.0 for name in self.STAGES}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, sec: float) -> None:
+        with self._lock:
+            self.items[stage] += 1
+            self.busy_sec[stage] += sec
+
+    def report(self, wall_sec: float) -> str:
+        lines = []
+        for name in self.STAGES:
+            items, busy = self.items[name], self.busy_sec[name]
+            busy_rate = items / busy if busy > 0 else 0.0
+            wall_rate = items / wall_sec if wall_sec > 0 else 0.0
+            lines.append(
+                f"  {name:<7} {items:>6} pages  busy {busy:7.2f}s  "
+                f"{busy_rate:8.1f}/s busy  {wall_rate:8.1f}/s wall"
+            )
+        return "\n".join(lines)
+
+
+def parse_sitemap(xml_text: str) -> tuple[list[str], list[str]]:
+    """<loc> из sitemap.xml: (страницы, вложенные sitemap из sitemapindex)."""
     try:
-        r = requests.get(url, headers=REQUEST_HEADERS, timeout=30)
+        root = ET.fromstring(xml_text.encode("utf-8"))
+    except ET.ParseError as e:
+        print(f"  sitemap unreadable: {e}", file=sys.stderr)
+        return [], []
+    pages: list[str] = []
+    sitemaps: list[str] = []
+    is_index = root.tag.endswith("sitemapindex")
+    for el in root.iter():
+        if el.tag.endswith("loc") and el.text:
+            (sitemaps if is_index else pages).append(el.text.strip())
+    return pages, sitemaps
+
+
+def _sitemap_links(pages: list[str]) -> set[str]:
+    return {link for link in (normalize_link(u) for u in pages) if link}
+
+
+def sitemap_urls() -> tuple[set[str], bool]:
+    """
+    Страницы из BASE_URL/sitemap.xml (с вложенными sitemap); пусто, если sitemap нет.
+    Второе значение — sitemap прочитан целиком (без ошибок и лимита файлов).
+    """
+    todo = [BASE_URL + SITEMAP_PATH]
+    found: set[str] = set()
+    for _ in range(SITEMAP_MAX_FILES):
+        if not todo:
+            break
+        try:
+            r = requests.get(todo.pop(0), headers=REQUEST_HEADERS, timeout=30)
+            if r.status_code != 200:
+                return found, False
+        except requests.RequestException:
+            return found, False
+        pages, nested = parse_sitemap(r.text)
+        found |= _sitemap_links(pages)
+        todo.extend(nested)
+    return found, not todo
+
+
+async def asitemap_urls(client: httpx.AsyncClient, limiter: HostRateLimiter) -> tuple[set[str], bool]:
+    """Async-версия sitemap_urls()."""
+    todo = [BASE_URL + SITEMAP_PATH]
+    found: set[str] = set()
+    for _ in range(SITEMAP_MAX_FILES):
+        if not todo:
+            break
+        url = todo.pop(0)
+        await limiter.wait(urlparse(url).netloc)
+        try:
+            r = await client.get(url)
+            if r.status_code != 200:
+                return found, False
+        except httpx.HTTPError:
+            return found, False
+        pages, nested = parse_sitemap(r.text)
+        found |= _sitemap_links(pages)
+        todo.extend(nested)
+    return found, not todo
+
+
+def path_key_for(url: str) -> str:
+    return urlparse(url).path.rstrip("/") or "index"
+
+
+def md_path_for(path_key: str) -> Path:
+    """Файл docs_crawl/<path>/index.md для страницы."""
+    parts = path_key.strip("/").split("/") if path_key != "index" else ["index"]
+    safe_parts = [re.sub(r"[^\w\-.]", "_", p) for p in parts if p]
+    if not safe_parts or safe_parts == ["index"]:
+        return OUTPUT_DIR / "index" / "index.md"
+    return OUTPUT_DIR / Path(*safe_parts) / "index.md"
+
+
+def content_hash(html: str) -> str:
+    return hashlib.sha256(html.encode("utf-8")).hexdigest()
+
+
+class HttpCache:
+    """
+    Валидаторы и результат разбора по URL: {etag, last_modified, hash, links}.
+    Условные заголовки шлются, только если .md страницы на диске — иначе её нужно скачать заново.
+    Заодно помнит итоги текущего краула: ответы 404/410 (gone), sitemap (если прочитан целиком)
+    и число сбоев загрузки/разбора.
+    """
+
+    def __init__(self, path: Path = HTTP_CACHE_PATH) -> None:
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        self.visited: set[str] = set()
+        self.gone: set[str] = set()
+        self.sitemap: set[str] = set()
+        self.failures = 0
+        self.unchanged = 0
+        self._lock = threading.Lock()
+        if path.exists():
+            try:
+                self.entries = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"HTTP cache unreadable ({e}), ignoring: {path}", file=sys.stderr)
+
+    def request_headers(self, url: str) -> dict[str, str]:
+        self.visited.add(url)
+        entry = self.entries.get(url)
+        if not entry or not md_path_for(path_key_for(url)).exists():
+            return {}
+        headers: dict[str, str] = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def cached_links(
+        self, url: str, status: int, html: str | None, etag: str | None, last_modified: str | None
+    ) -> set[str] | None:
+        """Ссылки из кэша, если страница не изменилась (304 или тот же хэш); иначе None."""
+        entry = self.entries.get(url)
+        if entry is None or not md_path_for(path_key_for(url)).exists():
+            return None
+        if status != 304 and (html is None or content_hash(html) != entry.get("hash")):
+            return None
+        with self._lock:
+            if etag:
+                entry["etag"] = etag
+            if last_modified:
+                entry["last_modified"] = last_modified
+            self.unchanged += 1
+        return set(entry.get("links") or [])
+
+    def put(self, url: str, html: str, etag: str | None, last_modified: str | None, links: set[str]) -> None:
+        entry = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "hash": content_hash(html),
+            "links": sorted(links),
+        }
+        with self._lock:
+            self.entries[url] = entry
+
+    def mark_gone(self, url: str) -> None:
+        with self._lock:
+            self.gone.add(url)
+
+    def mark_failed(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+    def removed(self, full_crawl: bool = True) -> list[str]:
+        """
+        URL из прошлого краула, которых больше нет: ответ 404/410, либо (полный обход с sitemap) страница
+        пропала из sitemap и краул до неё не дошёл. Просто недостигнутая страница удалённой не считается —
+        её хаб мог не загрузиться.
+        """
+        unlisted = full_crawl and bool(self.sitemap)
+        return sorted(
+            u for u in self.entries
+            if u in self.gone or (unlisted and u not in self.sitemap and u not in self.visited)
+        )
+
+    def save(self, prune: bool = True) -> None:
+        """prune — забыть удалённые URL (см. removed())."""
+        if prune:
+            for url in self.removed():
+                del self.entries[url]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.entries, ensure_ascii=False, indent=0), encoding="utf-8")
+        tmp.replace(self.path)
+
+
+def process_page(
+    url: str,
+    status: int,
+    html: str | None,
+    etag: str | None,
+    last_modified: str | None,
+    cache: HttpCache | None,
+    parser: str = "html.parser",
+    stats: CrawlStats | None = None,
+) -> tuple[set[str], str | None]:
+    """Ссылки и Markdown страницы. Markdown None — страница не изменилась, разбор пропущен."""
+    if cache is not None:
+        links = cache.cached_links(url, status, html, etag, last_modified)
+        if links is not None:
+            return links, None
+    if html is None:
+        return set(), None
+    links, content_md, parse_sec, convert_sec = convert_page(html, url, parser)
+    if stats is not None:
+        stats.add("parse", parse_sec)
+        stats.add("convert", convert_sec)
+    if cache is not None:
+        cache.put(url, html, etag, last_modified, links)
+    return links, content_md
+
+
+def fetch_page(url: str, headers: dict[str, str] | None = None) -> requests.Response | None:
+    """Загружает страницу; ответ 200, 304 (на условный запрос) или 404/410; None — ошибка."""
+    try:
+        r = requests.get(url, headers={**REQUEST_HEADERS, **(headers or {})}, timeout=30)
+        if r.status_code == 304 or r.status_code in _GONE_STATUSES:
+            return r
         r.raise_for_status()
-        return r.text
+        return r
     except requests.RequestException as e:
         print(f"  skip {url}: {e}", file=sys.stderr)
         return None
 
 
-def crawl() -> list[tuple[str, str, str]]:
-    """Краулит сайт, возвращает список (url, path_key, markdown)."""
+def crawl(
+    cache: HttpCache | None = None,
+    *,
+    parser: str = "html.parser",
+    use_sitemap: bool = True,
+    stats: CrawlStats | None = None,
+) -> list[tuple[str, str, str]]:
+    """Краулит сайт, возвращает список (url, path_key, markdown) изменившихся страниц."""
     seen: set[str] = set()
     to_visit = {BASE_URL + "/"}
+    if use_sitemap:
+        from_sitemap, complete = sitemap_urls()
+        if from_sitemap:
+            print(f"  sitemap: {len(from_sitemap)} pages", flush=True)
+        to_visit |= from_sitemap
+        if cache is not None and complete:
+            cache.sitemap = from_sitemap
     results: list[tuple[str, str, str]] = []
 
     while to_visit:
@@ -81,18 +394,37 @@ def crawl() -> list[tuple[str, str, str]]:
         if url in seen:
             continue
         seen.add(url)
-        parsed = urlparse(url)
-        path_key = parsed.path.rstrip("/") or "index"
+        path_key = path_key_for(url)
 
-        html = fetch_page(url)
-        if not html:
+        t0 = time.perf_counter()
+        r = fetch_page(url, cache.request_headers(url) if cache is not None else None)
+        if stats is not None:
+            stats.add("fetch", time.perf_counter() - t0)
+        if r is None:
+            if cache is not None:
+                cache.mark_failed()
+            continue
+        if r.status_code in _GONE_STATUSES:
+            print(f"  {path_key} (gone: {r.status_code})", flush=True)
+            if cache is not None:
+                cache.mark_gone(url)
             continue
 
-        soup = BeautifulSoup(html, "html.parser")
-        new_links = get_links_from_page(soup, url)
+        html = r.text if r.status_code != 304 else None
+        try:
+            new_links, content_md = process_page(
+                url, r.status_code, html, r.headers.get("ETag"), r.headers.get("Last-Modified"), cache, parser, stats
+            )
+        except Exception as e:
+            print(f"  skip {url}: convert failed: {e!r}", file=sys.stderr)
+            if cache is not None:
+                cache.mark_failed()
+            continue
         to_visit.update(new_links - seen)
 
-        content_md = html_to_markdown(soup)
+        if content_md is None:
+            print(f"  {path_key} (unchanged)", flush=True)
+            continue
         if content_md.strip():
             results.append((url, path_key, content_md))
         print(f"  {path_key}", flush=True)
@@ -100,29 +432,332 @@ def crawl() -> list[tuple[str, str, str]]:
     return results
 
 
+class HostRateLimiter:
+    """Не чаще rate запросов в секунду к одному хосту (равномерно, без всплесков)."""
+
+    def __init__(self, rate: float) -> None:
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next: dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host: str) -> None:
+        if not self._interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self._interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None = None) -> float:
+    """Retry-After, если сервер его прислал, иначе экспоненциальный backoff с jitter."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+async def afetch_page(
+    client: httpx.AsyncClient,
+    url: str,
+    limiter: HostRateLimiter,
+    retries: int = RETRIES,
+    headers: dict[str, str] | None = None,
+) -> httpx.Response | None:
+    """Загружает страницу (200, 304 или 404/410); 429/5xx и сетевые ошибки повторяются, остальные ошибки — None."""
+    host = urlparse(url).netloc
+    for attempt in range(retries + 1):
+        last_try = attempt == retries
+        await limiter.wait(host)
+        try:
+            r = await client.get(url, headers=headers)
+            if r.status_code == 304 or r.status_code in _GONE_STATUSES:
+                return r
+            if r.status_code in _RETRY_STATUSES and not last_try:
+                delay = _retry_delay(attempt, r)
+                print(f"  retry {url}: status {r.status_code}, in {delay:.1f}s", file=sys.stderr)
+                await asyncio.sleep(delay)
+                continue
+            r.raise_for_status()
+            return r
+        except httpx.HTTPStatusError as e:
+            print(f"  skip {url}: {e.response.status_code}", file=sys.stderr)
+            return None
+        except httpx.TransportError as e:
+            if last_try:
+                print(f"  skip {url}: {e!r}", file=sys.stderr)
+                return None
+            await asyncio.sleep(_retry_delay(attempt))
+        except httpx.HTTPError as e:
+            print(f"  skip {url}: {e!r}", file=sys.stderr)
+            return None
+    return None
+
+
+async def acrawl(
+    *,
+    concurrency: int = CONCURRENCY,
+    rate_per_host: float = RATE_PER_HOST,
+    max_depth: int | None = None,
+    retries: int = RETRIES,
+    cache: HttpCache | None = None,
+    parser: str = "html.parser",
+    convert_workers: int = CONVERT_WORKERS,
+    use_sitemap: bool = True,
+    stats: CrawlStats | None = None,
+) -> list[tuple[str, str, str]]:
+    """
+    Асинхронный краул в ширину: (url, path_key, markdown) изменившихся страниц, как crawl().
+    До concurrency запросов одновременно; URL в очередь попадает один раз, с глубиной от стартовой страницы
+    (страницы из sitemap — глубина 1). HTML → Markdown — в пуле из convert_workers процессов
+    (1 — в потоке), так что загрузка следующих страниц не ждёт конвертации.
+    """
+    start = BASE_URL + "/"
+    seen: set[str] = {start}
+    frontier: deque[tuple[str, int]] = deque([(start, 0)])
+    results: list[tuple[str, str, str]] = []
+    limiter = HostRateLimiter(rate_per_host)
+    wakeup = asyncio.Condition()
+    active = 0
+    n = max(1, concurrency)
+    limits = httpx.Limits(max_connections=n, max_keepalive_connections=n)
+
+    loop = asyncio.get_running_loop()
+    pool = (
+        ProcessPoolExecutor(max_workers=convert_workers, mp_context=multiprocessing.get_context("spawn"))
+        if convert_workers > 1
+        else None
+    )
+
+    async def convert(html: str, url: str) -> tuple[set[str], str]:
+        if pool is not None:
+            links, content_md, parse_sec, convert_sec = await loop.run_in_executor(
+                pool, convert_page, html, url, parser
+            )
+        else:
+            links, content_md, parse_sec, convert_sec = await asyncio.to_thread(convert_page, html, url, parser)
+        if stats is not None:
+            stats.add("parse", parse_sec)
+            stats.add("convert", convert_sec)
+        return links, content_md
+
+    async with httpx.AsyncClient(
+        headers=REQUEST_HEADERS, timeout=TIMEOUT, limits=limits, follow_redirects=True
+    ) as client:
+        if use_sitemap:
+            from_sitemap, complete = await asitemap_urls(client, limiter)
+            if from_sitemap:
+                print(f"  sitemap: {len(from_sitemap)} pages", flush=True)
+            if cache is not None and complete:
+                cache.sitemap = from_sitemap
+            if max_depth is None or max_depth >= 1:
+                for link in sorted(from_sitemap - seen):
+                    seen.add(link)
+                    frontier.append((link, 1))
+
+        async def worker() -> None:
+            nonlocal active
+            while True:
+                async with wakeup:
+                    # Пусто и никто не работает — новых ссылок уже не будет
+                    await wakeup.wait_for(lambda: frontier or not active)
+                    if not frontier:
+                        wakeup.notify_all()
+                        return
+                    url, depth = frontier.popleft()
+                    active += 1
+                try:
+                    headers = cache.request_headers(url) if cache is not None else None
+                    t0 = time.perf_counter()
+                    r = await afetch_page(client, url, limiter, retries, headers)
+                    if stats is not None:
+                        stats.add("fetch", time.perf_counter() - t0)
+                    links: set[str] = set()
+                    if r is None:
+                        if cache is not None:
+                            cache.mark_failed()
+                    elif r.status_code in _GONE_STATUSES:
+                        print(f"  {path_key_for(url)} (depth {depth}, gone: {r.status_code})", flush=True)
+                        if cache is not None:
+                            cache.mark_gone(url)
+                    else:
+                        html = r.text if r.status_code != 304 else None
+                        etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+                        cached = (
+                            cache.cached_links(url, r.status_code, html, etag, last_modified)
+                            if cache is not None
+                            else None
+                        )
+                        content_md: str | None = None
+                        if cached is not None:
+                            links = cached
+                        elif html is not None:
+                            try:
+                                links, content_md = await convert(html, url)
+                            except Exception as e:
+                                # Одна «битая» страница не должна обрывать весь краул (как и ошибки загрузки)
+                                print(f"  skip {url}: convert failed: {e!r}", file=sys.stderr)
+                                if cache is not None:
+                                    cache.mark_failed()
+                                continue
+                            if cache is not None:
+                                cache.put(url, html, etag, last_modified, links)
+                        if content_md is None:
+                            print(f"  {path_key_for(url)} (depth {depth}, unchanged)", flush=True)
+                        else:
+                            if content_md.strip():
+                                results.append((url, path_key_for(url), content_md))
+                            print(f"  {path_key_for(url)} (depth {depth})", flush=True)
+                finally:
+                    async with wakeup:
+                        active -= 1
+                        if max_depth is None or depth < max_depth:
+                            for link in sorted(links - seen):
+                                seen.add(link)
+                                frontier.append((link, depth + 1))
+                        wakeup.notify_all()
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(n)))
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+    return results
+
+
 def save_md_with_hierarchy(results: list[tuple[str, str, str]]) -> None:
     """Сохраняет результаты в docs_crawl с иерархией."""
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     for url, path_key, content_md in results:
-        parts = path_key.strip("/").split("/") if path_key != "index" else ["index"]
-        safe_parts = [re.sub(r"[^\w\-.]", "_", p) for p in parts if p]
-        if not safe_parts or safe_parts == ["index"]:
-            dir_path = OUTPUT_DIR / "index"
-        else:
-            dir_path = OUTPUT_DIR / Path(*safe_parts)
-        dir_path.mkdir(parents=True, exist_ok=True)
-        md_file = dir_path / "index.md"
+        md_file = md_path_for(path_key)
+        md_file.parent.mkdir(parents=True, exist_ok=True)
         md_file.write_text(f"# Source: {url}\n\n{content_md}", encoding="utf-8")
     print(f"Saved {len(results)} pages under {OUTPUT_DIR}", flush=True)
 
 
-def main() -> None:
-    print("Crawling", BASE_URL, "...", flush=True)
-    results = crawl()
-    if not results:
+def load_changes_manifest() -> dict[str, set[str]]:
+    """Ещё не проиндексированные изменения прошлых краулов ({} если файла нет или он битый)."""
+    try:
+        data = json.loads(CHANGES_PATH.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {"changed": set(), "removed": set()}
+    return {"changed": set(data.get("changed") or []), "removed": set(data.get("removed") or [])}
+
+
+def remove_pages(removed: set[str]) -> int:
+    """Удалить .md исчезнувших страниц, чтобы полная индексация не вернула их; пустые каталоги — тоже."""
+    deleted = 0
+    for rel in removed:
+        md_file = OUTPUT_DIR / rel
+        if not md_file.exists():
+            continue
+        md_file.unlink()
+        deleted += 1
+        parent = md_file.parent
+        while parent != OUTPUT_DIR and not any(parent.iterdir()):
+            parent.rmdir()
+            parent = parent.parent
+    return deleted
+
+
+def save_changes_manifest(results: list[tuple[str, str, str]], removed_urls: list[str]) -> None:
+    """
+    Изменённые и исчезнувшие страницы (пути .md относительно docs_crawl) для index_to_qdrant.py --changed-only.
+    Сливается с уже записанными: изменения нескольких краулов копятся, пока индексатор успешно не обработает
+    их и не удалит файл. .md исчезнувших страниц удаляются.
+    """
+    def rel(path_key: str) -> str:
+        return md_path_for(path_key).relative_to(OUTPUT_DIR).as_posix()
+
+    changed = {rel(path_key) for _, path_key, _ in results}
+    removed = {rel(path_key_for(u)) for u in removed_urls}
+    pending = load_changes_manifest()
+    # Страница, вернувшаяся после удаления, — изменённая; изменённая, затем удалённая — удалённая
+    data = {
+        "crawled_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "changed": sorted((pending["changed"] - removed) | changed),
+        "removed": sorted((pending["removed"] - changed) | removed),
+    }
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    deleted = remove_pages(removed)
+    CHANGES_PATH.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(
+        f"Changes: {len(changed)} changed, {len(removed)} removed ({deleted} files deleted); "
+        f"pending {len(data['changed'])} changed, {len(data['removed'])} removed -> {CHANGES_PATH}",
+        flush=True,
+    )
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Crawl docs.kinescope.ru into docs_crawl/<path>/index.md.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="concurrent asyncio crawler")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="parallel requests (--async)")
+    parser.add_argument("--rate", type=float, default=RATE_PER_HOST, help="requests/sec per host, 0 = no limit (--async)")
+    parser.add_argument("--max-depth", type=int, default=None, help="link depth from the start page (--async)")
+    parser.add_argument("--retries", type=int, default=RETRIES, help="retries for 429/5xx/network errors (--async)")
+    parser.add_argument("--no-cache", action="store_true", help="ignore the HTTP cache and re-download every page")
+    parser.add_argument("--no-sitemap", action="store_true", help="do not seed the crawl from sitemap.xml")
+    parser.add_argument(
+        "--parser",
+        default=os.environ.get("CRAWL_HTML_PARSER", HTML_PARSER),
+        help="BeautifulSoup parser: auto (lxml if installed), lxml, html.parser",
+    )
+    parser.add_argument(
+        "--convert-workers", type=int, default=CONVERT_WORKERS, help="HTML->Markdown processes, 1 = thread (--async)"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    html_parser = resolve_parser(args.parser)
+    print("Crawling", BASE_URL, f"(parser {html_parser}) ...", flush=True)
+    t0 = time.perf_counter()
+    cache = None if args.no_cache else HttpCache()
+    stats = CrawlStats()
+    if args.use_async:
+        results = asyncio.run(
+            acrawl(
+                concurrency=args.concurrency,
+                rate_per_host=args.rate,
+                max_depth=args.max_depth,
+                retries=args.retries,
+                cache=cache,
+                parser=html_parser,
+                convert_workers=args.convert_workers,
+                use_sitemap=not args.no_sitemap,
+                stats=stats,
+            )
+        )
+    else:
+        results = crawl(cache, parser=html_parser, use_sitemap=not args.no_sitemap, stats=stats)
+    wall = time.perf_counter() - t0
+    unchanged = cache.unchanged if cache is not None else 0
+    print(f"Crawled {len(results) + unchanged} pages ({unchanged} unchanged) in {wall:.1f}s", flush=True)
+    print(stats.report(wall), flush=True)
+    if not results and not unchanged:
         print("No pages found.", file=sys.stderr)
         sys.exit(1)
     save_md_with_hierarchy(results)
+    # С --max-depth обход неполный: пропажа из sitemap ещё не значит удаление, только 404/410
+    full_crawl = args.max_depth is None
+    removed = cache.removed(full_crawl) if cache is not None else []
+    # Какая-то страница не загрузилась или не разобралась — ссылки за ней не найдены; ничего не удаляем
+    prune = cache is not None and not cache.failures
+    if cache is not None and cache.failures and removed:
+        print(
+            f"{cache.failures} pages failed to fetch or convert; not removing {len(removed)} pages this run",
+            file=sys.stderr,
+        )
+    save_changes_manifest(results, removed if prune else [])
+    if cache is not None:
+        cache.save(prune=prune)
 
 
 if __name__ == "__main__":
@@ -2,26 +2,82 @@
 """
 Читает .md из docs_crawl, разбивает на чанки, эмбеддит (fastembed, 384 dim)
 и загружает в Qdrant коллекцию papers с именованным вектором fast-all-minilm-l6-v2.
-Payload: section, source, content, heading. Чанкинг по заголовкам Markdown (##, ###), длинные блоки — по размеру с перекрытием.
+Payload: section, source, content, heading, token_ids (ID токенов для keyword-реранка).
+Дополнительно — разреженный BM25-вектор bm25 (rag.lexical) для гибридного поиска (HYBRID_SEARCH), если он есть
+в схеме коллекции (новые коллекции создаются с ним). Старая коллекция без bm25 при выключенном HYBRID_SEARCH
+индексируется только плотными векторами; при включённом — нужен --full. Чанкинг по заголовкам Markdown (##, ###), длинные блоки — по размеру с перекрытием.
+
+Инкрементально: ID точки детерминирован (source, heading, sha256 чанка), локальный манифест помнит,
+что уже проиндексировано. Эмбеддятся и загружаются только новые/изменённые чанки, исчезнувшие — удаляются.
+--full — пересоздать коллекцию и проиндексировать всё заново.
+--changed-only — читать только страницы из docs_crawl/.crawl_changes.json (изменённые краулами с последней
+индексации), точки исчезнувших страниц удаляются; остальной манифест не трогается.
+После успешного запуска (в любом режиме) .crawl_changes.json удаляется — изменения учтены.
+
+Потоковый конвейер: чтение+чанкинг → эмбеддинг батчами → upsert, стадии связаны ограниченными очередями,
+поэтому память не растёт с размером корпуса, а загрузка в Qdrant идёт параллельно с эмбеддингом.
+--workers N — эмбеддинг в пуле из N процессов (модель загружается в каждом один раз),
+порядок результатов совпадает с порядком чанков.
 """
 from __future__ import annotations
 
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
 import re
 import sys
+import threading
+import time
 import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
 
 from fastembed import TextEmbedding
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, PointStruct, VectorParams
+from qdrant_client.models import (
+    Distance,
+    Modifier,
+    PointIdsList,
+    PointStruct,
+    SparseVector,
+    SparseVectorParams,
+    VectorParams,
+)
+
+# Токенизация BM25 общая с rag.search — индекс и запросы должны давать одинаковые ID токенов
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from rag.lexical import SPARSE_VECTOR_NAME, document_vector  # noqa: E402
 
 DOCS_DIR = Path(__file__).resolve().parent.parent / "docs_crawl"
 QDRANT_URL = "http://localhost:6333"
 COLLECTION_NAME = "papers"
 VECTOR_NAME = "fast-all-minilm-l6-v2"
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Гибридный поиск (как в rag.search): тогда коллекция обязана иметь разреженный вектор bm25
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "").lower() in ("1", "true", "yes")
 CHUNK_SIZE = 600
 CHUNK_OVERLAP = 100
+MANIFEST_PATH = DOCS_DIR / ".index_manifest.json"
+CHANGES_PATH = DOCS_DIR / ".crawl_changes.json"
+# Ключ метаданных коллекции с поколением индекса (rag.search.collection_generation — инвалидация кэша ответов)
+INDEX_GENERATION_KEY = "index_generation"
+# Пространство имён для uuid5 ID точек (не менять — иначе все ID станут новыми)
+POINT_ID_NAMESPACE = uuid.UUID("6f1c3c0e-2b7a-4d0e-9a51-3f4e8f0b7c21")
+# Конвейер: размеры батчей, ёмкость очередей между стадиями (в батчах), число потоков upsert
+EMBED_BATCH = 64
+UPSERT_BATCH = 64
+QUEUE_SIZE = 8
+UPSERT_WORKERS = 2
+# Процессов эмбеддинга (1 — в текущем процессе); батчей в работе на процесс
+EMBED_WORKERS = 1
+EMBED_INFLIGHT_PER_WORKER = 2
+
+_END = object()
 
 
 def iter_md_files(root: Path):
@@ -95,63 +151,508 @@ def chunk_by_headers(
     return result
 
 
-def main() -> None:
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+def point_id(source: str, heading: str, digest: str) -> str:
+    """Детерминированный ID точки: один и тот же чанк всегда получает один и тот же ID."""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}\n{heading}\n{digest}"))
+
+
+def load_manifest(path: Path, collection: str) -> dict[str, dict[str, str]]:
+    """Манифест: {point_id: {source, heading, hash}} для указанной коллекции; {} если нет или другая коллекция."""
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Manifest unreadable ({e}), ignoring: {path}", file=sys.stderr)
+        return {}
+    if data.get("collection") != collection:
+        return {}
+    return data.get("points") or {}
+
+
+def save_manifest(path: Path, collection: str, points: dict[str, dict[str, str]]) -> None:
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(
+        json.dumps({"collection": collection, "points": points}, ensure_ascii=False, indent=0),
+        encoding="utf-8",
+    )
+    tmp.replace(path)
+
+
+def index_generation(points: dict[str, dict[str, str]]) -> str:
+    """Хеш манифеста: ID точек выводятся из текста чанков, так что любая правка страницы меняет поколение."""
+    digest = hashlib.sha1()
+    for pid in sorted(points):
+        digest.update(pid.encode("ascii"))
+    return digest.hexdigest()
+
+
+def save_generation(client: QdrantClient, points: dict[str, dict[str, str]]) -> None:
+    """Записать поколение индекса в метаданные коллекции (нужен Qdrant >= 1.16; иначе — предупреждение)."""
+    generation = index_generation(points)
+    try:
+        client.update_collection(collection_name=COLLECTION_NAME, metadata={INDEX_GENERATION_KEY: generation})
+    except Exception as e:
+        print(
+            f"Could not write {INDEX_GENERATION_KEY} to collection metadata ({e}); "
+            "answer caches fall back to the point count and may need POST /cache/invalidate",
+            file=sys.stderr,
+        )
+        return
+    print(f"Index generation {generation[:12]}", flush=True)
+
+
+def load_changes(path: Path) -> dict[str, list[str]]:
+    """Манифест изменений краула: {changed: [...], removed: [...]} — пути .md относительно docs_crawl."""
+    data = json.loads(path.read_text(encoding="utf-8"))
+    return {"changed": list(data.get("changed") or []), "removed": list(data.get("removed") or [])}
+
+
+def iter_chunks(docs_dir: Path, files: Iterable[Path] | None = None) -> Iterator[tuple[str, dict[str, str]]]:
+    """Чанки корпуса (или только files) по одному: (point_id, {section, source, content, heading, hash})."""
+    for md_file in iter_md_files(docs_dir) if files is None else files:
+        raw = md_file.read_text(encoding="utf-8")
+        title_match = re.match(r"^#\s+Source:\s*\S+\s*\n\n", raw)
+        body = raw[title_match.end() :] if title_match else raw
+        section, source = extract_section_and_source(md_file, docs_dir)
+        for heading, chunk in chunk_by_headers(body):
+            digest = chunk_hash(chunk)
+            yield point_id(source, heading, digest), {
+                "section": section,
+                "source": source,
+                "content": chunk,
+                "heading": heading,
+                "hash": digest,
+            }
+
+
+class StageStats:
+    """Счётчики стадии конвейера: элементы и время, потраченное на работу (без ожидания очередей)."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.items = 0
+        self.busy_sec = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int, sec: float) -> None:
+        with self._lock:
+            self.items += items
+            self.busy_sec += sec
+
+    def report(self, wall_sec: float) -> str:
+        busy_rate = self.items / self.busy_sec if self.busy_sec > 0 else 0.0
+        wall_rate = self.items / wall_sec if wall_sec > 0 else 0.0
+        return (
+            f"  {self.name:<7} {self.items:>7} items  busy {self.busy_sec:7.2f}s  "
+            f"{busy_rate:9.1f}/s busy  {wall_rate:9.1f}/s wall"
+        )
+
+
+class _Aborted(Exception):
+    pass
+
+
+def _put(q: queue.Queue, item: Any, stop: threading.Event) -> None:
+    while True:
+        if stop.is_set():
+            raise _Aborted
+        try:
+            q.put(item, timeout=0.5)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(q: queue.Queue, stop: threading.Event) -> Any:
+    while True:
+        if stop.is_set():
+            raise _Aborted
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+
+
+_worker_embedder: TextEmbedding | None = None
+_worker_batch_size = EMBED_BATCH
+
+
+def _init_embed_worker(model_name: str, threads: int, batch_size: int) -> None:
+    """Инициализатор процесса пула: модель грузится один раз на процесс."""
+    global _worker_embedder, _worker_batch_size
+    _worker_embedder = TextEmbedding(model_name=model_name, threads=threads)
+    _worker_batch_size = batch_size
+
+
+def _embed_in_worker(texts: list[str]) -> list[Any]:
+    assert _worker_embedder is not None
+    return list(_worker_embedder.embed(texts, batch_size=_worker_batch_size))
+
+
+class EmbedPool:
+    """
+    Пул процессов для эмбеддинга. submit() возвращает Future со списком векторов батча.
+    ONNX в каждом процессе получает cpu_count / workers потоков, чтобы процессы не делили ядра.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        *,
+        model_name: str = EMBEDDING_MODEL,
+        batch_size: int = EMBED_BATCH,
+        threads: int | None = None,
+    ) -> None:
+        self.workers = max(1, workers)
+        threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        # spawn: onnxruntime не переживает fork после инициализации потоков
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_embed_worker,
+            initargs=(model_name, threads, batch_size),
+        )
+
+    def submit(self, texts: list[str]) -> Future:
+        return self._executor.submit(_embed_in_worker, texts)
+
+    def warm_up(self) -> None:
+        """Дождаться запуска процессов и загрузки модели (чтобы не учитывать это во времени эмбеддинга)."""
+        for f in [self.submit(["warm up"]) for _ in range(self.workers)]:
+            f.result()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> EmbedPool:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def iter_embedded(
+    batches: Iterable[list[str]],
+    embed_fn: Callable[[list[str]], Iterable[Any] | Future],
+    inflight: int = 1,
+) -> Iterator[tuple[list[str], list[Any]]]:
+    """
+    (батч, векторы) строго в порядке входных батчей. Если embed_fn возвращает Future,
+    в работе держится до inflight батчей одновременно; иначе батчи эмбеддятся по одному.
+    """
+    window: deque[tuple[list[str], Any]] = deque()
+    for batch in batches:
+        window.append((batch, embed_fn(batch)))
+        while len(window) >= max(1, inflight):
+            done, result = window.popleft()
+            yield done, list(result.result() if isinstance(result, Future) else result)
+    while window:
+        done, result = window.popleft()
+        yield done, list(result.result() if isinstance(result, Future) else result)
+
+
+def run_pipeline(
+    chunks: Iterable[tuple[str, dict[str, str]]],
+    embed_fn: Callable[[list[str]], Iterable[Any] | Future],
+    upsert_fn: Callable[[list[PointStruct]], None],
+    *,
+    embed_batch: int = EMBED_BATCH,
+    upsert_batch: int = UPSERT_BATCH,
+    queue_size: int = QUEUE_SIZE,
+    upsert_workers: int = UPSERT_WORKERS,
+    embed_inflight: int = 1,
+    on_upserted: Callable[[list[str]], None] | None = None,
+    sparse: bool = True,
+) -> dict[str, StageStats]:
+    """
+    chunks → [embed батчами] → [upsert]. Стадии — потоки, связаны очередями на queue_size батчей.
+    embed_fn может вернуть Future (EmbedPool.submit) — тогда в работе до embed_inflight батчей,
+    порядок точек при этом сохраняется. on_upserted получает ID каждого успешно загруженного батча. Ошибка любой стадии останавливает остальные.
+    sparse=False — без разреженного вектора bm25 (коллекция без него в схеме).
+    Возвращает статистику стадий.
+    """
+    stats = {name: StageStats(name) for name in ("read", "embed", "upsert")}
+    stop = threading.Event()
+    errors: list[BaseException] = []
+    chunk_q: queue.Queue = queue.Queue(maxsize=queue_size)
+    point_q: queue.Queue = queue.Queue(maxsize=queue_size)
+    upserted_lock = threading.Lock()
+    upserted_total = 0
+    n_upsert = max(1, upsert_workers)
+
+    def fail(e: BaseException) -> None:
+        if not isinstance(e, _Aborted):
+            errors.append(e)
+        stop.set()
+
+    def read_stage() -> None:
+        try:
+            it = iter(chunks)
+            while True:
+                t0 = time.perf_counter()
+                batch = [item for _, item in zip(range(embed_batch), it)]
+                stats["read"].add(len(batch), time.perf_counter() - t0)
+                if not batch:
+                    break
+                _put(chunk_q, batch, stop)
+            _put(chunk_q, _END, stop)
+        except BaseException as e:
+            fail(e)
+
+    def embed_stage() -> None:
+        try:
+            pending: list[PointStruct] = []
+            batches: deque[list[tuple[str, dict[str, str]]]] = deque()
+            waited = 0.0
+
+            def texts() -> Iterator[list[str]]:
+                nonlocal waited
+                while True:
+                    w0 = time.perf_counter()
+                    batch = _get(chunk_q, stop)
+                    waited += time.perf_counter() - w0
+                    if batch is _END:
+                        return
+                    batches.append(batch)
+                    yield [item["content"] for _, item in batch]
+
+            t0 = time.perf_counter()
+            for _, vectors in iter_embedded(texts(), embed_fn, embed_inflight):
+                batch = batches.popleft()
+                for (pid, item), vector in zip(batch, vectors):
+                    indices, values = document_vector(item["content"])
+                    vectors_by_name: dict[str, Any] = {VECTOR_NAME: vector}
+                    if sparse:
+                        vectors_by_name[SPARSE_VECTOR_NAME] = SparseVector(indices=indices, values=values)
+                    pending.append(
+                        PointStruct(
+                            id=pid,
+                            vector=vectors_by_name,
+                            payload={
+                                "section": item["section"],
+                                "source": item["source"],
+                                "content": item["content"],
+                                "heading": item["heading"],
+                                "token_ids": indices,
+                            },
+                        )
+                    )
+                stats["embed"].add(len(batch), time.perf_counter() - t0 - waited)
+                while len(pending) >= upsert_batch:
+                    _put(point_q, pending[:upsert_batch], stop)
+                    pending = pending[upsert_batch:]
+                t0 = time.perf_counter()
+                waited = 0.0
+            if pending:
+                _put(point_q, pending, stop)
+            for _ in range(n_upsert):
+                _put(point_q, _END, stop)
+        except BaseException as e:
+            fail(e)
+
+    def upsert_stage() -> None:
+        nonlocal upserted_total
+        try:
+            while True:
+                points = _get(point_q, stop)
+                if points is _END:
+                    break
+                t0 = time.perf_counter()
+                upsert_fn(points)
+                stats["upsert"].add(len(points), time.perf_counter() - t0)
+                with upserted_lock:
+                    if on_upserted is not None:
+                        on_upserted([str(p.id) for p in points])
+                    upserted_total += len(points)
+                    total = upserted_total
+                print(f"  upserted {total}", flush=True)
+        except BaseException as e:
+            fail(e)
+
+    threads = [
+        threading.Thread(target=read_stage, name="index-read"),
+        threading.Thread(target=embed_stage, name="index-embed"),
+    ] + [threading.Thread(target=upsert_stage, name=f"index-upsert-{i}") for i in range(n_upsert)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Index docs_crawl/*.md into Qdrant (incremental).")
+    parser.add_argument("--full", action="store_true", help="recreate the collection and re-index everything")
+    parser.add_argument("--embed-batch", type=int, default=EMBED_BATCH, help="chunks per embedding call")
+    parser.add_argument("--upsert-batch", type=int, default=UPSERT_BATCH, help="points per Qdrant upsert")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="batches buffered between stages")
+    parser.add_argument("--upsert-workers", type=int, default=UPSERT_WORKERS, help="parallel upsert threads")
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help=f"index only pages listed in {CHANGES_PATH.name} by crawls since the last index run",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=EMBED_WORKERS, help="embedding processes (1 = in this process)"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
     if not DOCS_DIR.exists():
         print(f"Run crawl first: python scripts/crawl_docs.py\nDocs dir missing: {DOCS_DIR}", file=sys.stderr)
         sys.exit(1)
 
-    print("Loading embedding model", EMBEDDING_MODEL, "...", flush=True)
-    embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
     print("Connecting to Qdrant", QDRANT_URL, "...", flush=True)
     client = QdrantClient(url=QDRANT_URL)
 
     collections = client.get_collections().collections
-    if not any(c.name == COLLECTION_NAME for c in collections):
+    exists = any(c.name == COLLECTION_NAME for c in collections)
+    if exists and args.full:
+        client.delete_collection(collection_name=COLLECTION_NAME)
+        print("Dropped collection", COLLECTION_NAME, "(--full)", flush=True)
+        exists = False
+    if not exists:
         client.create_collection(
             collection_name=COLLECTION_NAME,
             vectors_config={
                 VECTOR_NAME: VectorParams(size=384, distance=Distance.COSINE),
             },
+            sparse_vectors_config={
+                SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF),
+            },
         )
         print("Created collection", COLLECTION_NAME, flush=True)
+        has_sparse = True
+    else:
+        has_sparse = SPARSE_VECTOR_NAME in (client.get_collection(COLLECTION_NAME).config.params.sparse_vectors or {})
+        if not has_sparse and HYBRID_SEARCH:
+            print(
+                f"Collection {COLLECTION_NAME} has no sparse vector {SPARSE_VECTOR_NAME!r} (BM25).\n"
+                "Run once with --full to rebuild it for hybrid search.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        if not has_sparse:
+            print(
+                f"Collection {COLLECTION_NAME} has no sparse vector {SPARSE_VECTOR_NAME!r}: indexing dense vectors only "
+                "(run with --full before enabling HYBRID_SEARCH)",
+                file=sys.stderr,
+            )
 
-    items: list[tuple[str, str, str, str]] = []
-    for md_file in iter_md_files(DOCS_DIR):
-        raw = md_file.read_text(encoding="utf-8")
-        title_match = re.match(r"^#\s+Source:\s*\S+\s*\n\n", raw)
-        body = raw[title_match.end() :] if title_match else raw
-        section, source = extract_section_and_source(md_file, DOCS_DIR)
-        for heading, chunk in chunk_by_headers(body):
-            items.append((section, source, chunk, heading))
+    manifest = load_manifest(MANIFEST_PATH, COLLECTION_NAME) if exists else {}
+    if exists and not manifest:
+        count = client.count(collection_name=COLLECTION_NAME, exact=True).count
+        if count:
+            print(
+                f"No index manifest ({MANIFEST_PATH}) but collection {COLLECTION_NAME} has {count} points.\n"
+                "Run once with --full to rebuild it with deterministic IDs (otherwise points would be duplicated).",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+    # Читатель отмечает все встреченные чанки (для манифеста и удаления исчезнувших), дальше идут только новые
+    seen: dict[str, dict[str, str]] = {}
+    files: list[Path] | None = None
+    if args.changed_only:
+        if not CHANGES_PATH.exists() or not manifest:
+            print(
+                f"--changed-only needs {CHANGES_PATH} (crawl_docs.py) and an existing index manifest; "
+                "run without --changed-only first.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        changes = load_changes(CHANGES_PATH)
+        files = [DOCS_DIR / rel for rel in changes["changed"] if (DOCS_DIR / rel).exists()]
+        affected = {
+            extract_section_and_source(DOCS_DIR / rel, DOCS_DIR)[1] for rel in changes["changed"] + changes["removed"]
+        }
+        # Точки незатронутых страниц остаются как есть; точки затронутых либо встретятся снова, либо будут удалены
+        seen = {pid: meta for pid, meta in manifest.items() if meta["source"] not in affected}
+        print(f"Changed-only: {len(files)} changed pages, {len(changes['removed'])} removed", flush=True)
+
+    def new_chunks() -> Iterator[tuple[str, dict[str, str]]]:
+        for pid, item in iter_chunks(DOCS_DIR, files):
+            if pid in seen:
+                continue
+            seen[pid] = {"source": item["source"], "heading": item["heading"], "hash": item["hash"]}
+            if pid not in manifest:
+                yield pid, item
+
+    embedder: TextEmbedding | None = None
+    pool: EmbedPool | None = None
 
-    if not items:
+    def embed_fn(texts: list[str]) -> Iterable[Any] | Future:
+        nonlocal embedder, pool
+        if args.workers > 1:
+            if pool is None:
+                print(f"Starting {args.workers} embedding processes ({EMBEDDING_MODEL}) ...", flush=True)
+                pool = EmbedPool(args.workers, batch_size=args.embed_batch)
+            return pool.submit(texts)
+        if embedder is None:
+            print("Loading embedding model", EMBEDDING_MODEL, "...", flush=True)
+            embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
+        return embedder.embed(texts, batch_size=args.embed_batch)
+
+    def upsert_fn(points: list[PointStruct]) -> None:
+        client.upsert(collection_name=COLLECTION_NAME, points=points)
+
+    upserted: list[str] = []
+    t0 = time.perf_counter()
+    try:
+        stats = run_pipeline(
+            new_chunks(),
+            embed_fn,
+            upsert_fn,
+            embed_batch=args.embed_batch,
+            upsert_batch=args.upsert_batch,
+            queue_size=args.queue_size,
+            upsert_workers=args.upsert_workers,
+            embed_inflight=args.workers * EMBED_INFLIGHT_PER_WORKER if args.workers > 1 else 1,
+            on_upserted=upserted.extend,
+            sparse=has_sparse,
+        )
+    except BaseException:
+        # Сохраняем прогресс: уже загруженные точки не придётся эмбеддить повторно
+        save_manifest(MANIFEST_PATH, COLLECTION_NAME, {**manifest, **{pid: seen[pid] for pid in upserted}})
+        print(f"Indexing failed after {len(upserted)} upserted points; manifest saved", file=sys.stderr)
+        raise
+    finally:
+        if pool is not None:
+            pool.close()
+    wall = time.perf_counter() - t0
+
+    if not seen:
         print("No chunks to index.", file=sys.stderr)
         sys.exit(1)
 
-    texts = [item[2] for item in items]
-    print("Embedding", len(texts), "chunks ...", flush=True)
-    vectors = list(embedder.embed(texts))
-    points = [
-        PointStruct(
-            id=str(uuid.uuid4()),
-            vector={VECTOR_NAME: vectors[i]},
-            payload={
-                "section": section,
-                "source": source,
-                "content": chunk,
-                "heading": heading,
-            },
-        )
-        for i, (section, source, chunk, heading) in enumerate(items)
-    ]
+    removed_ids = [pid for pid in manifest if pid not in seen]
+    print(
+        f"Chunks: {len(seen)} total, {len(seen) - len(upserted)} unchanged, "
+        f"{len(upserted)} new/changed, {len(removed_ids)} removed",
+        flush=True,
+    )
+    print(f"Pipeline: {wall:.2f}s wall", flush=True)
+    for stage in stats.values():
+        print(stage.report(wall), flush=True)
 
-    batch_size = 64
-    for j in range(0, len(points), batch_size):
-        batch = points[j : j + batch_size]
-        client.upsert(collection_name=COLLECTION_NAME, points=batch)
-        print(f"  upserted {j + len(batch)} / {len(points)}", flush=True)
+    if removed_ids:
+        client.delete(collection_name=COLLECTION_NAME, points_selector=PointIdsList(points=removed_ids))
+        print(f"  deleted {len(removed_ids)} stale points", flush=True)
 
-    print("Indexed", len(points), "points into", COLLECTION_NAME, flush=True)
+    save_manifest(MANIFEST_PATH, COLLECTION_NAME, seen)
+    save_generation(client, seen)
+    # Накопленные изменения краулов проиндексированы; при сбое выше файл остаётся для следующего запуска
+    CHANGES_PATH.unlink(missing_ok=True)
+    print("Indexed", len(seen), "points into", COLLECTION_NAME, flush=True)
 
 
 if __name__ == "__main__":